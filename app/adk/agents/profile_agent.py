@@ -4,6 +4,7 @@ Profile Agent para ADK - Gerenciamento completo de perfil do usuário
 
 import asyncio
 import os
+import re
 import time
 from typing import Dict, Any, Optional, List
 from datetime import datetime, date
@@ -11,6 +12,14 @@ from app.adk.simple_adk import Node
 from app.tools.memory_tool import MemoryTool
 from app.tools.observability_tool import ObservabilityTool
 from app.services.llm_service import llm_service
+from app.services.profile_extraction import profile_extractor
+from app.services.keyword_matcher import get_keyword_matcher
+from app.services.llm_json import llm_json_parser
+
+# Valores com unidade explícita que indicam atualização mesmo sem verbo
+UPDATE_WEIGHT_PATTERN = re.compile(r'\d+(?:\.\d+)?\s*kg')
+UPDATE_HEIGHT_PATTERN = re.compile(r'\d+(?:\.\d+)?\s*cm')
+UPDATE_AGE_PATTERN = re.compile(r'\d+\s*anos?')
 
 class ProfileAgentNode(Node):
     """Agente responsável pelo gerenciamento completo do perfil do usuário"""
@@ -35,45 +44,78 @@ class ProfileAgentNode(Node):
             "completion"
         ]
         
+        # Passo do onboarding → campo do perfil e pergunta correspondente
+        self.onboarding_step_fields = {
+            "age": "age",
+            "height": "height_cm",
+            "weight": "current_weight_kg",
+            "goal": "goal",
+            "training_level": "training_level",
+            "restrictions": "restrictions"
+        }
+        self.onboarding_questions = {
+            "age": "**Qual sua idade?**",
+            "height": "**Qual sua altura?**",
+            "weight": "**Qual seu peso?**",
+            "goal": "**Qual seu objetivo principal?**\n\n• Emagrecimento\n• Hipertrofia\n• Condicionamento\n• Manutenção",
+            "training_level": "**Qual seu nível de treino?**\n\n• Iniciante\n• Intermediário\n• Avançado",
+            "restrictions": "**Tem alguma restrição alimentar ou de saúde?**"
+        }
+        
         # Campos do perfil com validações
         self.profile_fields = {
             "age": {
                 "type": "integer",
                 "required": True,
                 "validation": lambda x: 13 <= x <= 100,
-                "error_msg": "Idade deve estar entre 13 e 100 anos"
+                "error_msg": "Idade deve estar entre 13 e 100 anos",
+                "label": "Idade",
+                "unit": "anos",
+                "description": "Idade em anos"
             },
             "height_cm": {
                 "type": "decimal",
                 "required": True,
                 "validation": lambda x: 100 <= x <= 250,
-                "error_msg": "Altura deve estar entre 100 e 250 cm"
+                "error_msg": "Altura deve estar entre 100 e 250 cm",
+                "label": "Altura",
+                "unit": "cm",
+                "description": "Altura em centímetros (ex.: 1,80 m = 180)"
             },
             "current_weight_kg": {
                 "type": "decimal",
                 "required": True,
                 "validation": lambda x: 30 <= x <= 300,
-                "error_msg": "Peso deve estar entre 30 e 300 kg"
+                "error_msg": "Peso deve estar entre 30 e 300 kg",
+                "label": "Peso",
+                "unit": "kg",
+                "description": "Peso atual em kg"
             },
             "goal": {
                 "type": "choice",
                 "required": True,
                 "options": ["emagrecimento", "hipertrofia", "condicionamento", "manutencao"],
                 "validation": lambda x: x in ["emagrecimento", "hipertrofia", "condicionamento", "manutencao"],
-                "error_msg": "Objetivo deve ser: emagrecimento, hipertrofia, condicionamento ou manutencao"
+                "error_msg": "Objetivo deve ser: emagrecimento, hipertrofia, condicionamento ou manutencao",
+                "label": "Objetivo",
+                "description": "Objetivo principal de treino/dieta"
             },
             "training_level": {
                 "type": "choice",
                 "required": True,
                 "options": ["iniciante", "intermediario", "avancado"],
                 "validation": lambda x: x in ["iniciante", "intermediario", "avancado"],
-                "error_msg": "Nível deve ser: iniciante, intermediario ou avancado"
+                "error_msg": "Nível deve ser: iniciante, intermediario ou avancado",
+                "label": "Nível de treino",
+                "description": "Nível de experiência com treino"
             },
             "restrictions": {
                 "type": "jsonb",
                 "required": False,
-                "validation": lambda x: isinstance(x, dict),
-                "error_msg": "Restrições devem ser um objeto JSON válido"
+                "validation": lambda x: isinstance(x, (dict, str)),
+                "error_msg": "Restrições devem ser um objeto JSON válido",
+                "label": "Restrições",
+                "description": "Restrições alimentares ou de saúde citadas explicitamente (texto curto)"
             }
         }
     
@@ -162,8 +204,8 @@ class ProfileAgentNode(Node):
             # Busca perfil atual do usuário na tabela user_profile
             profile_data = await self._get_user_profile_from_table(user_id)
             
-            # Se é uma solicitação de atualização específica
-            if update_intent:
+            # Se é uma solicitação de atualização específica ("profile" = perfil geral)
+            if update_intent in self.profile_fields:
                 return await self._handle_specific_update(user_id, content, update_intent, profile_data)
             
             # Detecta se o usuário quer atualizar algo específico
@@ -367,7 +409,9 @@ Resposta (apenas o campo ou "null"):
             response = await llm_service.call_with_fallback(
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=20,
-                temperature=0.1
+                temperature=0.1,
+                call_site="profile.detect_change",
+                tier="classification"
             )
             
             result = response.strip().lower()
@@ -802,7 +846,9 @@ Resposta (apenas número ou "null"):
             response = await llm_service.call_with_fallback(
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=10,
-                temperature=0.1
+                temperature=0.1,
+                call_site="profile.extract_age",
+                tier="extraction"
             )
             
             result = response.strip()
@@ -846,7 +892,9 @@ Resposta (apenas número ou "null"):
             response = await llm_service.call_with_fallback(
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=10,
-                temperature=0.1
+                temperature=0.1,
+                call_site="profile.extract_weight",
+                tier="extraction"
             )
             
             result = response.strip()
@@ -889,7 +937,9 @@ Resposta (apenas número ou "null"):
             response = await llm_service.call_with_fallback(
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=10,
-                temperature=0.1
+                temperature=0.1,
+                call_site="profile.extract_height",
+                tier="extraction"
             )
             
             result = response.strip()
@@ -915,17 +965,12 @@ Resposta (JSON apenas):
             response = await llm_service.call_with_fallback(
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=50,
-                temperature=0.1
+                temperature=0.1,
+                call_site="profile.extract_weight_height",
+                tier="extraction"
             )
             
-            import json
-            result = response.strip()
-            if "{" in result and "}" in result:
-                json_start = result.find("{")
-                json_end = result.rfind("}") + 1
-                json_str = result[json_start:json_end]
-                return json.loads(json_str)
-            return {}
+            return llm_json_parser.parse(response, call_site="profile.extract_weight_height")
             
         except Exception:
             return {}
@@ -966,7 +1011,9 @@ Resposta (apenas o objetivo ou "null"):
             response = await llm_service.call_with_fallback(
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=20,
-                temperature=0.1
+                temperature=0.1,
+                call_site="profile.extract_goal",
+                tier="extraction"
             )
             
             result = response.strip().lower()
@@ -1013,7 +1060,9 @@ Resposta (apenas o nível ou "null"):
             response = await llm_service.call_with_fallback(
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=20,
-                temperature=0.1
+                temperature=0.1,
+                call_site="profile.extract_training_level",
+                tier="extraction"
             )
             
             result = response.strip().lower()
@@ -1060,7 +1109,9 @@ Resposta (apenas a restrição, "nenhuma" ou "null"):
             response = await llm_service.call_with_fallback(
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=30,
-                temperature=0.1
+                temperature=0.1,
+                call_site="profile.extract_restrictions",
+                tier="extraction"
             )
             
             result = response.strip().lower()
@@ -1153,70 +1204,6 @@ Agora posso te ajudar com:
         except Exception as e:
             print(f"❌ Erro ao completar onboarding: {e}")
     
-    def _extract_height_value(self, content: str) -> float:
-        """Extrai altura em cm de várias formas de entrada"""
-        import re
-        
-        content = content.lower().strip()
-        
-        # Padrões para diferentes formas de entrada
-        patterns = [
-            # 1 metro e 80
-            r'(\d+)\s*metro\s*e\s*(\d+)',
-            # 1,80m, 1.80m
-            r'(\d+)[,.](\d+)\s*m',
-            # 1m80
-            r'(\d+)m(\d+)',
-            # 180cm, 180 cm
-            r'(\d+)\s*cm',
-            # 1,80, 1.80 (assume metros se < 3)
-            r'^(\d+)[,.](\d+)$',
-            # 180 (assume cm se >= 100)
-            r'^(\d+)$'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, content)
-            if match:
-                groups = match.groups()
-                
-                if len(groups) == 2 and groups[1]:  # 1 metro e 80 ou 1,80m
-                    meters = int(groups[0])
-                    cm = int(groups[1])
-                    if cm < 100:  # 1,80 -> 180cm
-                        return meters * 100 + cm
-                    else:  # 1 metro e 80 -> 180cm
-                        return meters * 100 + cm
-                elif len(groups) == 1:  # 180 ou 180cm
-                    value = int(groups[0])
-                    if value >= 100:  # Assume cm
-                        return float(value)
-                    else:  # Assume metros
-                        return float(value) * 100
-        
-        return None
-    
-    def _extract_weight_value(self, content: str) -> float:
-        """Extrai peso em kg de várias formas de entrada"""
-        import re
-        
-        content = content.lower().strip()
-        
-        # Padrões para diferentes formas de entrada
-        patterns = [
-            # 75kg, 75 kg, 75kgs
-            r'(\d+(?:\.\d+)?)\s*kg?s?',
-            # 75 (assume kg)
-            r'^(\d+(?:\.\d+)?)$'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, content)
-            if match:
-                return float(match.group(1))
-        
-        return None
-    
     async def _extract_goal_value(self, content: str) -> str:
         """Extrai objetivo usando LLM para interpretar diferentes expressões"""
         try:
@@ -1248,7 +1235,9 @@ Responda APENAS com uma das 4 categorias (emagrecimento, hipertrofia, condiciona
                     "content": prompt
                 }],
                 max_tokens=50,
-                temperature=0.1
+                temperature=0.1,
+                call_site="profile.extract_goal",
+                tier="extraction"
             )
             
             result = response.strip().lower()
@@ -1264,24 +1253,6 @@ Responda APENAS com uma das 4 categorias (emagrecimento, hipertrofia, condiciona
             print(f"❌ Erro ao extrair objetivo com LLM: {e}")
             return None
     
-    def _extract_training_level_value(self, content: str) -> str:
-        """Extrai nível de treino de várias formas de entrada"""
-        content = content.lower().strip()
-        
-        # Mapeamento de sinônimos para níveis
-        level_mapping = {
-            "iniciante": ["iniciante", "começando", "novato", "primeira vez", "nunca treinei", "sou novo"],
-            "intermediario": ["intermediário", "intermediario", "já treino", "tenho experiência", "meio termo"],
-            "avancado": ["avançado", "avancado", "experiente", "treino há anos", "sou forte"]
-        }
-        
-        for level, synonyms in level_mapping.items():
-            for synonym in synonyms:
-                if synonym in content:
-                    return level
-        
-        return None
-    
     # =====================================================
     # MÉTODOS PARA GERENCIAMENTO DE PERFIL
     # =====================================================
@@ -1381,6 +1352,16 @@ Ou digite diretamente o novo valor, como "80 kg" para peso.
             # Determina próximo passo
             next_step = self._get_next_onboarding_step(profile_data)
             
+            # Mensagens com vários dados de uma vez ("tenho 30 anos, 1,80 e 85kg") preenchem todos os passos
+            expected_field = self.onboarding_step_fields.get(next_step)
+            if expected_field and expected_field != "restrictions":
+                extraction = await self._extract_profile_fields(content, expected_field)
+                fields = self._filter_onboarding_fields(extraction["fields"], profile_data, expected_field)
+                if fields and (len(fields) > 1 or expected_field not in fields or extraction["source"] == "llm"):
+                    for field_name in fields:
+                        profile_extractor.record_layer(field_name, extraction["layers"][field_name])
+                    return await self._save_onboarding_fields(user_id, profile_data, fields, extraction["errors"])
+            
             if next_step == "welcome":
                 return await self._handle_welcome_step(user_id, content)
             elif next_step == "age":
@@ -1406,6 +1387,201 @@ Ou digite diretamente o novo valor, como "80 kg" para peso.
                 "current_step": "error"
             }
     
+    def _build_profile_extraction_schema(self) -> Dict[str, Any]:
+        """Monta JSON schema de extração a partir de self.profile_fields"""
+        type_map = {"integer": "integer", "decimal": "number", "choice": "string", "jsonb": "string"}
+        properties = {}
+        
+        for field_name, field_config in self.profile_fields.items():
+            field_schema = {
+                "type": [type_map.get(field_config["type"], "string"), "null"],
+                "description": field_config.get("description", field_name)
+            }
+            if field_config.get("options"):
+                field_schema["enum"] = field_config["options"] + [None]
+            properties[field_name] = field_schema
+        
+        return {"type": "object", "properties": properties, "additionalProperties": False}
+    
+    def _coerce_field_value(self, field_name: str, value: Any) -> Any:
+        """Converte valor vindo do LLM para o tipo do campo"""
+        field_type = self.profile_fields[field_name]["type"]
+        if value is None or value == "":
+            return None
+        if field_type == "integer":
+            return int(round(float(str(value).replace(",", "."))))
+        if field_type == "decimal":
+            return float(str(value).replace(",", "."))
+        if field_type == "choice":
+            value = str(value)
+            if value in self.profile_fields[field_name]["options"]:
+                return value
+            # Normaliza acentos/sinônimos ("avançado" → "avancado")
+            return profile_extractor.extract(field_name, value)["value"]
+        return value
+    
+    async def _extract_profile_fields(self, content: str, expected_field: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Extrai todos os campos do perfil presentes na mensagem
+        
+        Parsers determinísticos primeiro; uma única chamada LLM com schema derivado de
+        self.profile_fields só quando a mensagem parece ter mais dados do que os parsers acharam.
+        
+        Returns:
+            {"fields": {campo: valor válido}, "errors": {campo: mensagem},
+             "source": "deterministic"|"llm", "layers": {campo: camada}}
+        """
+        import re
+        
+        fields = {}
+        errors = {}
+        layers = {}
+        
+        # Um número solto ("30") só vale para o campo perguntado
+        bare_number = re.fullmatch(r"\s*\d+(?:[.,]\d+)?\s*", content) is not None
+        
+        for field_name in self.profile_fields:
+            if field_name == "restrictions" or (bare_number and field_name != expected_field):
+                continue
+            parsed = profile_extractor.extract(field_name, content)
+            if parsed["confident"]:
+                fields[field_name] = parsed["value"]
+                layers[field_name] = "deterministic"
+        
+        # Sinais de dados na mensagem: números e palavras de objetivo/nível
+        numbers = re.findall(r"\d+(?:[.,]\d+)?", content)
+        numeric_found = sum(1 for name in ("age", "height_cm", "current_weight_kg") if name in fields)
+        signals = len(numbers) + sum(1 for name in ("goal", "training_level") if name in fields)
+        needs_llm = signals >= 2 and len(numbers) > numeric_found
+        
+        source = "deterministic"
+        if needs_llm:
+            llm_fields = await self._extract_profile_fields_with_llm(content)
+            if llm_fields:
+                source = "llm"
+                # Parsers com alta confiança prevalecem; o LLM completa o restante
+                for field_name, value in llm_fields.items():
+                    if field_name not in fields:
+                        fields[field_name] = value
+                        layers[field_name] = "llm"
+        
+        valid_fields = {}
+        for field_name, value in fields.items():
+            validation = self._validate_field_value(field_name, value)
+            if validation["valid"]:
+                valid_fields[field_name] = value
+            elif field_name == expected_field or layers[field_name] == "llm":
+                # Erros de parsers em campos não perguntados são ruído, não viram aviso
+                errors[field_name] = validation["error"]
+        
+        if valid_fields:
+            print(f"🧩 ProfileAgent: campos extraídos ({source}): {valid_fields}")
+        
+        return {
+            "fields": valid_fields,
+            "errors": errors,
+            "source": source,
+            "layers": {name: layers[name] for name in valid_fields}
+        }
+    
+    async def _extract_profile_fields_with_llm(self, content: str) -> Dict[str, Any]:
+        """Uma chamada LLM que retorna todos os campos do perfil presentes na mensagem"""
+        try:
+            prompt = f"""
+Extraia da mensagem do usuário TODOS os dados de perfil presentes.
+Use null para campos não mencionados. Não invente valores.
+
+MENSAGEM: "{content}"
+"""
+            
+            data = await llm_service.call_structured(
+                messages=[{"role": "user", "content": prompt}],
+                schema=self._build_profile_extraction_schema(),
+                schema_name="dados_perfil",
+                max_tokens=150,
+                temperature=0.0,
+                call_site="profile.extract_fields",
+                tier="extraction"
+            )
+            if data is None:
+                return {}
+            
+            fields = {}
+            for field_name in self.profile_fields:
+                try:
+                    value = self._coerce_field_value(field_name, data.get(field_name))
+                except (TypeError, ValueError):
+                    value = None
+                if value is not None:
+                    fields[field_name] = value
+            return fields
+            
+        except Exception as e:
+            print(f"❌ Erro na extração estruturada do perfil: {e}")
+            return {}
+    
+    def _filter_onboarding_fields(self, fields: Dict[str, Any], profile_data: Dict[str, Any], expected_field: str) -> Dict[str, Any]:
+        """
+        Campos extras só completam o que ainda falta no perfil; o campo perguntado sempre vale
+        
+        Um extra com o mesmo número do campo perguntado ("tenho 85 kg" lido também como idade)
+        é o mesmo dado interpretado duas vezes e é descartado
+        """
+        expected_value = fields.get(expected_field)
+        filtered = {}
+        for field_name, value in fields.items():
+            if field_name != expected_field:
+                if profile_data.get(field_name) not in (None, ""):
+                    continue
+                if (
+                    isinstance(expected_value, (int, float)) and isinstance(value, (int, float))
+                    and float(value) == float(expected_value)
+                ):
+                    continue
+            filtered[field_name] = value
+        return filtered
+    
+    async def _save_onboarding_fields(self, user_id: str, profile_data: Dict[str, Any], fields: Dict[str, Any], errors: Dict[str, str]) -> Dict[str, Any]:
+        """Salva vários campos de uma vez e pula os passos do onboarding já satisfeitos"""
+        updated_profile = {**profile_data, **fields}
+        success = await self._update_user_profile(user_id, updated_profile)
+        
+        current_step = self._get_next_onboarding_step(profile_data)
+        if not success:
+            return {
+                "response": "Erro ao salvar seus dados. Tente novamente:",
+                "current_step": current_step,
+                "profile_updated": False
+            }
+        
+        saved_lines = []
+        for field_name, value in fields.items():
+            field_config = self.profile_fields[field_name]
+            unit = f" {field_config['unit']}" if field_config.get("unit") else ""
+            saved_lines.append(f"• {field_config.get('label', field_name)}: **{value}{unit}**")
+        
+        response = "✅ Dados salvos:\n" + "\n".join(saved_lines)
+        if errors:
+            response += "\n\n⚠️ " + "\n⚠️ ".join(errors.values())
+        
+        next_step = self._get_next_onboarding_step(updated_profile)
+        if next_step == "completion" or next_step not in self.onboarding_questions:
+            await self._complete_onboarding(user_id)
+            completion = await self._handle_completion_step(user_id, "", updated_profile)
+            return {
+                **completion,
+                "response": response + "\n\n" + completion["response"].strip(),
+                "profile_updated": True,
+                "profile_data": updated_profile
+            }
+        
+        return {
+            "response": f"{response}\n\n{self.onboarding_questions[next_step]}",
+            "current_step": next_step,
+            "profile_updated": True,
+            "profile_data": updated_profile
+        }
+    
     def _get_next_onboarding_step(self, profile_data: Dict[str, Any]) -> str:
         """Determina o próximo passo do onboarding"""
         # Pula welcome, vai direto para age
@@ -1427,27 +1603,47 @@ Ou digite diretamente o novo valor, como "80 kg" para peso.
     async def _extract_field_value(self, content: str, field_name: str) -> Any:
         """Extrai valor de um campo específico da mensagem do usuário"""
         try:
-            if field_name == "age":
-                # Extrai número da mensagem
-                import re
-                numbers = re.findall(r'\d+', content)
-                return int(numbers[0]) if numbers else None
-            elif field_name == "height_cm":
-                return self._extract_height_value(content)
-            elif field_name == "current_weight_kg":
-                return self._extract_weight_value(content)
-            elif field_name == "goal":
-                return await self._extract_goal_value(content)
-            elif field_name == "training_level":
-                return self._extract_training_level_value(content)
-            elif field_name == "restrictions":
-                return await self._extract_restrictions(content)
-            else:
-                return content.strip()
+            if field_name in self.profile_fields:
+                return await self._extract_with_layers(field_name, content)
+            return content.strip()
                 
         except Exception:
             return None
     
+    async def _extract_with_layers(self, field_name: str, content: str) -> Any:
+        """
+        Extração em camadas: parser determinístico primeiro, LLM só quando o resultado é ambíguo
+        """
+        parsed = profile_extractor.extract(field_name, content)
+        if parsed["confident"]:
+            profile_extractor.record_layer(field_name, "deterministic")
+            print(f"⚡ ProfileAgent: {field_name} extraído sem LLM: {parsed['value']} (confiança {parsed['confidence']})")
+            return parsed["value"]
+        
+        llm_value = None
+        if field_name == "age":
+            llm_value = await self._extract_age(content)
+        elif field_name == "height_cm":
+            llm_value = await self._extract_height(content)
+        elif field_name == "current_weight_kg":
+            llm_value = await self._extract_weight(content)
+        elif field_name == "goal":
+            llm_value = await self._extract_goal_value(content)
+        elif field_name == "training_level":
+            llm_value = await self._extract_training_level(content)
+            if llm_value:
+                llm_value = profile_extractor.extract("training_level", llm_value)["value"]
+        elif field_name == "restrictions":
+            llm_value = await self._extract_restrictions(content)
+        
+        if llm_value is not None:
+            profile_extractor.record_layer(field_name, "llm")
+            return llm_value
+        
+        # LLM não resolveu: usa o melhor palpite do parser (a validação do campo decide)
+        profile_extractor.record_layer(field_name, "miss" if parsed["value"] is None else "deterministic")
+        return parsed["value"]
+    
     def _validate_field_value(self, field_name: str, value: Any) -> Dict[str, Any]:
         """Valida valor de um campo"""
         try:
@@ -1473,53 +1669,27 @@ Ou digite diretamente o novo valor, como "80 kg" para peso.
     async def _detect_update_intent(self, content: str) -> Optional[str]:
         """Detecta intenção de atualização de campo específico"""
         try:
-            content_lower = content.lower()
+            # Uma passada do matcher encontra verbo de atualização e campos citados
+            matches = get_keyword_matcher("profile_update_intent").match(content)
             
-            # Mapeamento de palavras-chave para campos
-            field_mappings = {
-                "idade": "age",
-                "age": "age",
-                "altura": "height_cm",
-                "height": "height_cm",
-                "peso": "current_weight_kg",
-                "weight": "current_weight_kg",
-                "objetivo": "goal",
-                "goal": "goal",
-                "nível": "training_level",
-                "level": "training_level",
-                "treino": "training_level",
-                "restrições": "restrictions",
-                "restrictions": "restrictions"
-            }
+            if "update_verb" in matches:
+                # Primeiro campo na ordem de prioridade da tabela
+                return next((field for field in matches if field != "update_verb"), None)
             
-            # Palavras que indicam atualização
-            update_keywords = ["atualizar", "mudar", "alterar", "update", "change", "modify"]
+            # Se não há palavras de atualização, detecta por padrões de valor (apenas com unidades explícitas)
+            content_lower = content.lower()
             
-            # Verifica se há intenção de atualização
-            has_update_intent = any(keyword in content_lower for keyword in update_keywords)
+            # Peso (ex: "80 kg", "80kg") - com unidade
+            if UPDATE_WEIGHT_PATTERN.search(content_lower):
+                return "current_weight_kg"
             
-            if has_update_intent:
-                # Procura por campo específico
-                for keyword, field in field_mappings.items():
-                    if keyword in content_lower:
-                        return field
+            # Altura (ex: "175 cm", "175cm") - com unidade
+            if UPDATE_HEIGHT_PATTERN.search(content_lower):
+                return "height_cm"
             
-            # Se não há palavras de atualização, mas há um valor específico, tenta detectar
-            if not has_update_intent:
-                # Detecta por padrões de valor (apenas com unidades explícitas)
-                import re
-                
-                # Peso (ex: "80 kg", "80kg") - com unidade
-                if re.search(r'\d+(?:\.\d+)?\s*kg', content_lower):
-                    return "current_weight_kg"
-                
-                # Altura (ex: "175 cm", "175cm") - com unidade
-                if re.search(r'\d+(?:\.\d+)?\s*cm', content_lower):
-                    return "height_cm"
-                
-                # Idade (ex: "30 anos") - apenas com palavra "anos"
-                if re.search(r'\d+\s*anos?', content_lower):
-                    return "age"
+            # Idade (ex: "30 anos") - apenas com palavra "anos"
+            if UPDATE_AGE_PATTERN.search(content_lower):
+                return "age"
             
             return None
             
@@ -1558,9 +1728,8 @@ Vamos começar:
     async def _handle_age_step(self, user_id: str, content: str, profile_data: Dict[str, Any]) -> Dict[str, Any]:
         """Lida com coleta da idade"""
         try:
-            import re
-            numbers = re.findall(r'\d+', content)
-            if not numbers:
+            age = await self._extract_with_layers("age", content)
+            if age is None:
                 return {
                     "response": """
 🎉 **Bem-vindo ao BodyFlow.ai!**
@@ -1583,7 +1752,7 @@ Vamos começar:
                     "profile_updated": False
                 }
             
-            age = int(numbers[0])
+            age = int(age)
             if not (13 <= age <= 100):
                 return {
                     "response": "Idade deve estar entre 13 e 100 anos. Tente novamente:",
@@ -1618,7 +1787,7 @@ Vamos começar:
     async def _handle_height_step(self, user_id: str, content: str, profile_data: Dict[str, Any]) -> Dict[str, Any]:
         """Lida com coleta da altura"""
         try:
-            height_cm = self._extract_height_value(content)
+            height_cm = await self._extract_with_layers("height_cm", content)
             
             if height_cm is None:
                 return {
@@ -1661,7 +1830,7 @@ Vamos começar:
     async def _handle_weight_step(self, user_id: str, content: str, profile_data: Dict[str, Any]) -> Dict[str, Any]:
         """Lida com coleta do peso"""
         try:
-            weight_kg = self._extract_weight_value(content)
+            weight_kg = await self._extract_with_layers("current_weight_kg", content)
             
             if weight_kg is None:
                 return {
@@ -1703,7 +1872,7 @@ Vamos começar:
     
     async def _handle_goal_step(self, user_id: str, content: str, profile_data: Dict[str, Any]) -> Dict[str, Any]:
         """Lida com coleta do objetivo"""
-        goal = await self._extract_goal_value(content)
+        goal = await self._extract_with_layers("goal", content)
         
         if not goal or goal not in ["emagrecimento", "hipertrofia", "condicionamento", "manutencao"]:
             return {
@@ -1731,7 +1900,7 @@ Vamos começar:
     
     async def _handle_training_level_step(self, user_id: str, content: str, profile_data: Dict[str, Any]) -> Dict[str, Any]:
         """Lida com coleta do nível de treino"""
-        training_level = self._extract_training_level_value(content)
+        training_level = await self._extract_with_layers("training_level", content)
         
         if not training_level or training_level not in ["iniciante", "intermediario", "avancado"]:
             return {
@@ -1759,7 +1928,7 @@ Vamos começar:
     
     async def _handle_restrictions_step(self, user_id: str, content: str, profile_data: Dict[str, Any]) -> Dict[str, Any]:
         """Lida com coleta de restrições"""
-        restrictions = await self._extract_restrictions(content)
+        restrictions = await self._extract_with_layers("restrictions", content)
         
         if restrictions == "null" or restrictions in ["nenhuma", "não", "nao", "none"]:
             restrictions = {}
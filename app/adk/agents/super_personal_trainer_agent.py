@@ -12,6 +12,58 @@ from app.tools.observability_tool import ObservabilityTool
 from app.tools.multimodal_tool import MultimodalTool
 from app.services.session_manager import SessionManager
 from app.services.llm_service import llm_service
+from app.services.metabolic import metabolic_calculator
+from app.services.prompt_budget import PromptAssembler, format_history
+
+# Persona e regras fixas da consulta (prefixo estático e cacheável do prompt)
+CONSULTATION_SYSTEM_PROMPT = """
+Você é o SUPER PERSONAL TRAINER - um agente especializado que atua como Nutrólogo, Nutricionista e Personal Trainer em uma só experiência. 
+Sua missão é conduzir uma conversa natural, acolhedora e prática, como em uma consulta real. 
+Você deve interagir de forma progressiva: pergunte aos poucos, comente o que o paciente disser e ofereça insights imediatos. 
+Não use respostas longas demais; prefira frases curtas, listas rápidas e exemplos aplicáveis ao dia a dia.
+
+POSTURA NA CONVERSA:
+- Use o nome do paciente para personalizar a conversa quando apropriado
+- Não transforme a interação em um questionário. Conduza como um bate-papo natural.
+- Faça perguntas curtas e contextuais, de acordo com o que o paciente falar.
+- Se o paciente pedir algo específico, responda na hora, sem esperar todas as informações.
+- Dê feedbacks contínuos e vá ajustando conforme coleta mais dados.
+
+ÁREAS DE ATUAÇÃO:
+- **Nutrição**: dietas, cardápios, calorias, macronutrientes, hábitos alimentares, escolhas saudáveis, intolerâncias alimentares, emagrecimento, hipertrofia, saúde metabólica.
+- **Suplementação**: orientações gerais sobre suplementos comuns (ex.: whey, creatina, vitaminas), explicando quando podem ajudar. Nunca prescreva medicamentos.
+- **Treinos**: sugestões de exercícios, divisões de treino, frequência, intensidade, postura e progressão. 
+- **Integração**: sempre que possível, conecte alimentação e treino para dar orientações mais completas.
+
+ESTILO DE RESPOSTA:
+- Use frases curtas e diretas.
+- Prefira listas de até 3 a 5 itens.
+- Dê exemplos práticos que o paciente possa aplicar imediatamente.
+- Use emojis moderadamente para dar leveza (ex.: 🥗💪🔥).
+- Adapte o tom para ser motivador e acessível, sem jargões técnicos em excesso.
+
+LIMITES DE ATUAÇÃO:
+- Você não é médico clínico. Não prescreva remédios ou diagnósticos médicos.
+- Se o tema sair totalmente do escopo de saúde, nutrição, treino ou suplementação → encerre educadamente e informe que não é da sua área.
+- Se o paciente tocar em questões emocionais profundas (ex.: ansiedade, depressão), oriente de forma respeitosa que deve procurar apoio psicológico, sem tentar substituir esse papel.
+
+CAPACIDADE MULTIMODAL:
+- **Imagem de refeição**: identifique alimentos, estime calorias/macros em poucas frases e sugira melhorias simples.
+- **Imagem da geladeira/dispensa**: sugira até 3 receitas rápidas e saudáveis com os itens disponíveis.
+- **Imagem de rótulo**: destaque os 2–3 pontos mais relevantes (açúcar, proteína, sódio, calorias).
+- **Imagem de treino/exercício**: dê feedback curto sobre execução, músculos trabalhados ou ajuste de carga/postura.
+- **Imagem de corpo físico**: faça comentários gerais de composição corporal (ex.: "aparenta foco em abdômen, podemos ajustar dieta + treino para essa área"). Nunca critique de forma negativa.
+- **Imagem de exames médicos**: comente apenas dentro do campo nutricional/fitness (ex.: colesterol alto → mais fibras + aeróbico). Nunca faça diagnóstico clínico.
+
+IMPORTANTE: Quando você receber contexto de análise de imagem (seção "IMAGEM ENVIADA"), você DEVE analisar a imagem baseado nesse contexto. NÃO diga que não consegue visualizar a imagem. Use as informações fornecidas no contexto para dar uma análise específica e útil.
+
+OBJETIVO:
+Atuar como o SUPER PERSONAL TRAINER - um guia completo de saúde, nutrição e treino. 
+Fornecer apoio integrado e contínuo, com mensagens curtas, claras e motivadoras. 
+Ajudar o paciente a alcançar objetivos reais (emagrecimento, hipertrofia, energia, bem-estar, performance), sempre com orientações práticas e adaptadas à sua realidade.
+
+Forneça uma resposta curta, prática e personalizada baseada nas informações fornecidas.
+"""
 
 class SuperPersonalTrainerAgentNode(Node):
     """Super Personal Trainer Agent - Agente principal responsável por saúde, nutrição e treino"""
@@ -24,6 +76,8 @@ class SuperPersonalTrainerAgentNode(Node):
         self.memory_tool = MemoryTool()
         self.observability_tool = ObservabilityTool()
         self.multimodal_tool = MultimodalTool()
+        # Orçamento (tokens estimados) da parte variável do prompt da consulta
+        self.prompt_budget = int(os.getenv("CONSULTATION_PROMPT_BUDGET", "1500"))
     
     async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -154,7 +208,9 @@ Vamos começar:
                 max_tokens=2000,
                 temperature=0.4,
                 fallback_response=fallback_response,
-                conversation_context=conversation_context
+                conversation_context=conversation_context,
+                system_prompt=CONSULTATION_SYSTEM_PROMPT,
+                call_site="super_personal_trainer.consultation"
             )
             
             return response
@@ -169,41 +225,22 @@ Vamos começar:
             return llm_service.get_contextual_fallback(content, profile.get("name", "Paciente"), profile)
     
     def _build_conversation_context(self, short_term: List[Dict], profile: Dict[str, Any]) -> str:
-        """Constrói contexto da conversa para manter continuidade entre LLMs"""
-        try:
-            user_name = profile.get("name", "Paciente")
-            
-            # Constrói resumo da conversa recente
-            conversation_summary = []
-            if short_term:
-                for msg in short_term[-5:]:  # Últimas 5 mensagens
-                    role = msg.get('role', 'user')
-                    content = msg.get('content', '')
-                    if role == 'user':
-                        conversation_summary.append(f"Paciente: {content}")
-                    elif role == 'assistant':
-                        conversation_summary.append(f"Nutricionista: {content}")
-            
-            context = f"""
-CONVERSA EM ANDAMENTO COM {user_name.upper()}:
-
-Histórico recente da conversa:
-{chr(10).join(conversation_summary) if conversation_summary else "Primeira interação"}
-
-INSTRUÇÕES:
-- Esta é uma conversa contínua com {user_name}
-- Mantenha o tom e estilo da conversa anterior
-- Continue de onde parou, não reinicie a conversa
-- Seja natural e mantenha a continuidade
-"""
-            return context.strip()
-            
-        except Exception as e:
-            print(f"❌ Erro ao construir contexto da conversa: {e}")
-            return f"Conversa em andamento com {profile.get('name', 'Paciente')}"
+        """Instruções de continuidade (o histórico vai uma única vez, no prompt da consulta)"""
+        user_name = profile.get("name", "Paciente")
+        if not short_term:
+            return f"Primeira interação com {user_name}. Inicie a conversa de forma acolhedora."
+        return (
+            f"Conversa em andamento com {user_name}: mantenha o tom e o estilo das respostas anteriores "
+            f"e continue de onde parou, sem reiniciar a conversa."
+        )
     
     def _build_consultation_prompt(self, content: str, profile: Dict[str, Any], short_term: List[Dict], image_data: Optional[bytes] = None, is_continuation: bool = False, context: Dict[str, Any] = None) -> str:
-        """Constrói prompt para consulta nutricional"""
+        """
+        Constrói a parte variável do prompt da consulta (as instruções fixas ficam em CONSULTATION_SYSTEM_PROMPT)
+        
+        As seções entram por prioridade dentro de CONSULTATION_PROMPT_BUDGET: dados do paciente e
+        solicitação sempre; depois análise da imagem, metas, resumo da sessão e histórico
+        """
         
         # Dados do perfil
         user_name = profile.get("name", "Paciente")
@@ -214,14 +251,34 @@ INSTRUÇÕES:
         training_level = profile.get("training_level", "N/A")
         restrictions = profile.get("restrictions", "Nenhuma")
         
-        # Contexto recente
-        recent_context = ""
-        if short_term:
-            recent_messages = [f"{msg.get('role', 'user')}: {msg.get('content', '')}" for msg in short_term[-5:]]
-            recent_context = f"Contexto recente da conversa: {' | '.join(recent_messages)}"
+        assembler = PromptAssembler(self.prompt_budget, call_site="super_personal_trainer.consultation")
+        
+        assembler.add("paciente", f"""
+DADOS DO PACIENTE:
+- Nome: {user_name}
+- Idade: {age} anos
+- Peso: {weight} kg
+- Altura: {height} cm
+- Objetivo: {goal}
+- Nível de atividade: {training_level}
+- Restrições alimentares: {restrictions}
+""", priority=0, required=True)
+        
+        # TMB, gasto diário e macros calculados localmente (cache por versão do perfil)
+        assembler.add("metas", metabolic_calculator.format_for_prompt(metabolic_calculator.targets_for(profile)), priority=2)
+        
+        # Resumo incremental da sessão: substitui o histórico antigo (contexto de tamanho fixo)
+        session_summary = ((context or {}).get("medium_term") or {}).get("summary", "")
+        if session_summary:
+            assembler.add("resumo_sessao", f"RESUMO DA CONVERSA ATÉ AQUI:\n{session_summary}", priority=2)
+        
+        # Histórico recente: turnos recentes completos, anteriores em uma linha. Com resumo, só os
+        # dois últimos turnos (o resumo é atualizado a cada N turnos e pode não cobri-los ainda)
+        history = format_history(short_term, max_messages=4 if session_summary else None)
+        if history:
+            assembler.add("historico", f"HISTÓRICO RECENTE (mais antigo primeiro):\n{history}", priority=3, keep_recent=True)
         
         # Informações sobre imagem se presente
-        image_context = ""
         if image_data:
             # Usa contexto específico preparado pelo Image Orchestrator
             image_context_data = context.get("image_context", {}) if context else {}
@@ -233,7 +290,7 @@ INSTRUÇÕES:
             
             focus_text = ", ".join(focus_areas) if focus_areas else "análise geral"
             
-            image_context = f"""
+            assembler.add("imagem", f"""
 IMAGEM ENVIADA: O paciente enviou uma imagem do tipo "{image_class}".
 
 ANÁLISE SOLICITADA: {analysis_type}
@@ -242,7 +299,9 @@ ESTILO DE RESPOSTA: {expected_style}
 
 DADOS DA ANÁLISE DA IMAGEM:
 {self._format_image_analysis_data(image_context_data)}
-
+""", priority=1)
+            
+            assembler.add("instrucoes_imagem", f"""
 INSTRUÇÕES ESPECÍFICAS PARA ANÁLISE DETALHADA:
 - Analise a imagem considerando o tipo "{image_class}"
 - Foque nas áreas: {focus_text}
@@ -258,77 +317,16 @@ INSTRUÇÕES ESPECÍFICAS PARA ANÁLISE DETALHADA:
 - Integre a análise com o contexto da consulta
 - Seja prático e aplicável ao dia a dia
 - Use os dados da análise fornecidos acima para dar uma resposta específica e detalhada
-"""
+""", priority=5)
         
-        prompt = f"""
-Você é o SUPER PERSONAL TRAINER - um agente especializado que atua como Nutrólogo, Nutricionista e Personal Trainer em uma só experiência. 
-Sua missão é conduzir uma conversa natural, acolhedora e prática, como em uma consulta real. 
-Você deve interagir de forma progressiva: pergunte aos poucos, comente o que o paciente disser e ofereça insights imediatos. 
-Não use respostas longas demais; prefira frases curtas, listas rápidas e exemplos aplicáveis ao dia a dia.
-
-DADOS DO PACIENTE:
-- Nome: {user_name}
-- Idade: {age} anos
-- Peso: {weight} kg
-- Altura: {height} cm
-- Objetivo: {goal}
-- Nível de atividade: {training_level}
-- Restrições alimentares: {restrictions}
-
+        assembler.add("solicitacao", f"""
 SOLICITAÇÃO DO PACIENTE: "{content}"
 
-{recent_context}
-
-{image_context}
-
 {'CONTEXTO: Esta é uma CONTINUAÇÃO da consulta. Responda diretamente à pergunta/solicitação do paciente de forma curta e prática.' if is_continuation else 'CONTEXTO: Esta é uma NOVA consulta. Inicie com acolhimento breve e simpático.'}
-
-POSTURA NA CONVERSA:
 - {'Responda de forma curta e direta' if is_continuation else 'Seja empático, positivo e motivador desde o início'}
-- Use o nome do paciente ({user_name}) para personalizar a conversa quando apropriado
-- Não transforme a interação em um questionário. Conduza como um bate-papo natural.
-- Faça perguntas curtas e contextuais, de acordo com o que o paciente falar.
-- Se o paciente pedir algo específico, responda na hora, sem esperar todas as informações.
-- Dê feedbacks contínuos e vá ajustando conforme coleta mais dados.
-
-ÁREAS DE ATUAÇÃO:
-- **Nutrição**: dietas, cardápios, calorias, macronutrientes, hábitos alimentares, escolhas saudáveis, intolerâncias alimentares, emagrecimento, hipertrofia, saúde metabólica.
-- **Suplementação**: orientações gerais sobre suplementos comuns (ex.: whey, creatina, vitaminas), explicando quando podem ajudar. Nunca prescreva medicamentos.
-- **Treinos**: sugestões de exercícios, divisões de treino, frequência, intensidade, postura e progressão. 
-- **Integração**: sempre que possível, conecte alimentação e treino para dar orientações mais completas.
-
-ESTILO DE RESPOSTA:
-- Use frases curtas e diretas.
-- Prefira listas de até 3 a 5 itens.
-- Dê exemplos práticos que o paciente possa aplicar imediatamente.
-- Use emojis moderadamente para dar leveza (ex.: 🥗💪🔥).
-- Adapte o tom para ser motivador e acessível, sem jargões técnicos em excesso.
-
-LIMITES DE ATUAÇÃO:
-- Você não é médico clínico. Não prescreva remédios ou diagnósticos médicos.
-- Se o tema sair totalmente do escopo de saúde, nutrição, treino ou suplementação → encerre educadamente e informe que não é da sua área.
-- Se o paciente tocar em questões emocionais profundas (ex.: ansiedade, depressão), oriente de forma respeitosa que deve procurar apoio psicológico, sem tentar substituir esse papel.
-
-CAPACIDADE MULTIMODAL:
-- **Imagem de refeição**: identifique alimentos, estime calorias/macros em poucas frases e sugira melhorias simples.
-- **Imagem da geladeira/dispensa**: sugira até 3 receitas rápidas e saudáveis com os itens disponíveis.
-- **Imagem de rótulo**: destaque os 2–3 pontos mais relevantes (açúcar, proteína, sódio, calorias).
-- **Imagem de treino/exercício**: dê feedback curto sobre execução, músculos trabalhados ou ajuste de carga/postura.
-- **Imagem de corpo físico**: faça comentários gerais de composição corporal (ex.: "aparenta foco em abdômen, podemos ajustar dieta + treino para essa área"). Nunca critique de forma negativa.
-- **Imagem de exames médicos**: comente apenas dentro do campo nutricional/fitness (ex.: colesterol alto → mais fibras + aeróbico). Nunca faça diagnóstico clínico.
-
-IMPORTANTE: Quando você receber contexto de análise de imagem (seção "IMAGEM ENVIADA"), você DEVE analisar a imagem baseado nesse contexto. NÃO diga que não consegue visualizar a imagem. Use as informações fornecidas no contexto para dar uma análise específica e útil.
-
-{image_context}
-
-OBJETIVO:
-Atuar como o SUPER PERSONAL TRAINER - um guia completo de saúde, nutrição e treino. 
-Fornecer apoio integrado e contínuo, com mensagens curtas, claras e motivadoras. 
-Ajudar o paciente a alcançar objetivos reais (emagrecimento, hipertrofia, energia, bem-estar, performance), sempre com orientações práticas e adaptadas à sua realidade.
-
-Forneça uma resposta curta, prática e personalizada baseada nas informações fornecidas.
-"""
+""", priority=0, required=True)
         
+        prompt, _ = assembler.assemble()
         return prompt
     
     def _format_image_analysis_data(self, image_context_data: Dict[str, Any]) -> str:
@@ -612,6 +610,17 @@ ANÁLISE CORPORAL - NÃO CONSEGUIU IDENTIFICAR:
                     health_list = '\n'.join([f"• {note}" for note in health_notes]) if health_notes else 'Não fornecidas'
                     red_flags_list = '\n'.join([f"• {flag}" for flag in red_flags]) if red_flags else 'Nenhum ponto de atenção identificado'
                     
+                    # Alimento equivalente da tabela nutricional local (quando encontrado)
+                    reference = analysis.get('reference_food')
+                    reference_text = ""
+                    if reference:
+                        per_100g = reference.get('per_100g', {})
+                        reference_text = (
+                            f"\n\n📚 REFERÊNCIA (TABELA NUTRICIONAL, POR 100 g):\n- {reference.get('name')}: "
+                            f"{per_100g.get('kcal', 'N/A')} kcal, {per_100g.get('protein', 'N/A')}g proteína, "
+                            f"{per_100g.get('carbs', 'N/A')}g carboidratos, {per_100g.get('fat', 'N/A')}g gordura"
+                        )
+                    
                     return f"""
 ANÁLISE DE RÓTULO NUTRICIONAL DETALHADA:
 
@@ -638,7 +647,7 @@ ANÁLISE DE RÓTULO NUTRICIONAL DETALHADA:
 {red_flags_list}
 
 ⭐ AVALIAÇÃO GERAL:
-{overall_rating}
+{overall_rating}{reference_text}
 
 📈 CONFIABILIDADE:
 - Confiança da análise: {confidence:.1%}
@@ -874,7 +883,9 @@ Exemplos de CONTINUAR: perguntas sobre nutrição, pedidos de ajuda, dúvidas, "
 """
                 }],
                 max_tokens=50,
-                temperature=0.1
+                temperature=0.1,
+                call_site="super_personal_trainer.exit_intent",
+                tier="classification"
             )
             
             result = response.strip().upper()
@@ -9,6 +9,7 @@ from app.adk.simple_adk import Node
 from app.tools.memory_tool import MemoryTool
 from app.tools.observability_tool import ObservabilityTool
 from app.tools.multimodal_tool import MultimodalTool
+from app.services.session_summary import session_summarizer
 
 class ImageOrchestratorNode(Node):
     """Nó orquestrador para processamento de imagens"""
@@ -48,8 +49,13 @@ class ImageOrchestratorNode(Node):
                 else:
                     return await self._handle_invalid_image("Imagem não fornecida")
             
-            # Classifica tipo de imagem
-            classification = await self.multimodal_tool.classify_image(image_data, image_type)
+            # Classifica e analisa em uma chamada (a análise separada fica como fallback);
+            # álbuns vão juntos na mesma chamada
+            image_batch = input_data.get("image_batch") or []
+            if len(image_batch) > 1:
+                classification = await self.multimodal_tool.classify_and_analyze_batch(image_batch, image_type)
+            else:
+                classification = await self.multimodal_tool.classify_and_analyze(image_data, image_type)
             
             if not classification.get("success", False):
                 return await self._handle_invalid_image("Erro ao processar imagem")
@@ -59,12 +65,14 @@ class ImageOrchestratorNode(Node):
             
             # Roteia baseado na classificação - todas as imagens válidas vão para Super Personal Trainer
             if image_class in ["food", "body", "exercise", "bioimpedancia", "label", "treino_planilha"]:
-                agent_result = await self._route_to_super_personal_trainer(user_id, image_data, image_class)
+                agent_result = await self._route_to_super_personal_trainer(
+                    user_id, image_data, image_class, classification.get("analysis_result")
+                )
             else:
                 return await self._handle_invalid_image("Tipo de imagem não reconhecido")
             
-            # Atualiza resumo da sessão
-            await self._update_session_summary(user_id, image_class, agent_result.get("response", ""))
+            # Atualiza assunto da sessão; o resumo é atualizado em segundo plano
+            await self._update_session_summary(user_id, image_class, input_data.get("content", ""), agent_result.get("response", ""))
             
             execution_time = (time.time() - start_time) * 1000
             
@@ -77,6 +85,8 @@ class ImageOrchestratorNode(Node):
                     "image_class": image_class,
                     "confidence": confidence,
                     "image_info": classification.get("image_info", {}),
+                    "cache_hit": classification.get("cache_hit", False),
+                    "image_count": max(len(image_batch), 1),
                     "execution_time_ms": execution_time
                 }
             }
@@ -94,7 +104,8 @@ class ImageOrchestratorNode(Node):
                 }
             }
     
-    async def _route_to_super_personal_trainer(self, user_id: str, image_data: bytes, image_class: str) -> Dict[str, Any]:
+    async def _route_to_super_personal_trainer(self, user_id: str, image_data: bytes, image_class: str,
+                                               analysis_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Roteia imagem para o Super Personal Trainer Agent"""
         try:
             from app.adk.agents.super_personal_trainer_agent import SuperPersonalTrainerAgentNode
@@ -103,7 +114,7 @@ class ImageOrchestratorNode(Node):
             context = await self.memory_tool.get_context_for_agent(user_id, "super_personal_trainer")
             
             # Prepara dados específicos baseados no tipo de imagem
-            image_context = await self._prepare_image_context(image_data, image_class)
+            image_context = await self._prepare_image_context(image_data, image_class, analysis_result)
             
             agent = SuperPersonalTrainerAgentNode()
             agent_input = {
@@ -135,8 +146,13 @@ class ImageOrchestratorNode(Node):
                 "metadata": {"error": str(e)}
             }
     
-    async def _prepare_image_context(self, image_data: bytes, image_class: str) -> Dict[str, Any]:
-        """Prepara contexto específico baseado no tipo de imagem"""
+    async def _prepare_image_context(self, image_data: bytes, image_class: str,
+                                     analysis_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Prepara contexto específico baseado no tipo de imagem
+        
+        analysis_result: análise já obtida na passada única (evita a segunda chamada de visão)
+        """
         try:
             context = {
                 "image_class": image_class,
@@ -146,37 +162,37 @@ class ImageOrchestratorNode(Node):
             
             # Análise específica baseada no tipo de imagem
             if image_class == "food":
-                food_analysis = await self.multimodal_tool.analyze_food_image(image_data)
+                food_analysis = analysis_result or await self.multimodal_tool.analyze_food_image(image_data)
                 context.update({
                     "food_analysis": food_analysis,
                     "focus_areas": ["calorias", "macronutrientes", "sugestões de melhoria"]
                 })
             elif image_class == "bioimpedancia":
-                bio_data = await self.multimodal_tool.extract_bioimpedance_data(image_data)
+                bio_data = analysis_result or await self.multimodal_tool.extract_bioimpedance_data(image_data)
                 context.update({
                     "bioimpedance_data": bio_data,
                     "focus_areas": ["composição corporal", "evolução", "ajustes na dieta e treino"]
                 })
             elif image_class == "exercise":
-                exercise_analysis = await self.multimodal_tool.analyze_exercise_image(image_data)
+                exercise_analysis = analysis_result or await self.multimodal_tool.analyze_exercise_image(image_data)
                 context.update({
                     "exercise_analysis": exercise_analysis,
                     "focus_areas": ["execução", "músculos trabalhados", "ajuste de carga/postura"]
                 })
             elif image_class == "body":
-                body_analysis = await self.multimodal_tool.analyze_body_image(image_data)
+                body_analysis = analysis_result or await self.multimodal_tool.analyze_body_image(image_data)
                 context.update({
                     "body_analysis": body_analysis,
                     "focus_areas": ["composição corporal", "ajustes na dieta e treino", "progressão"]
                 })
             elif image_class == "label":
-                label_analysis = await self.multimodal_tool.analyze_label_image(image_data)
+                label_analysis = analysis_result or await self.multimodal_tool.analyze_label_image(image_data)
                 context.update({
                     "label_analysis": label_analysis,
                     "focus_areas": ["açúcar", "proteína", "sódio", "calorias", "ingredientes"]
                 })
             elif image_class == "treino_planilha":
-                planilha_analysis = await self.multimodal_tool.analyze_treino_planilha_image(image_data)
+                planilha_analysis = analysis_result or await self.multimodal_tool.analyze_treino_planilha_image(image_data)
                 context.update({
                     "planilha_analysis": planilha_analysis,
                     "focus_areas": ["estrutura do treino", "exercícios", "progressão", "sugestões"]
@@ -243,11 +259,11 @@ Certifique-se de que a imagem está nítida e bem iluminada para melhor análise
             }
         }
     
-    async def _update_session_summary(self, user_id: str, image_class: str, response: str) -> None:
-        """Atualiza resumo da sessão"""
+    async def _update_session_summary(self, user_id: str, image_class: str, content: str, response: str) -> None:
+        """Atualiza o assunto da sessão e registra o turno no resumo incremental"""
         try:
-            summary = f"Imagem processada: {image_class}. Resposta: {response[:100]}..."
-            await self.memory_tool.update_session_summary(user_id, summary, image_class)
+            await self.memory_tool.update_session_topic(user_id, image_class)
+            session_summarizer.record_turn(user_id, f"[imagem: {image_class}] {content or ''}".strip(), response, image_class)
         except Exception:
             # Falha silenciosa
             pass
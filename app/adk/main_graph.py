@@ -3,7 +3,7 @@ Grafo Principal do ADK - BodyFlow
 """
 
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from app.adk.simple_adk import AgentDevelopmentKit, Graph
 from app.adk.router_node import RouterNode
 from app.adk.text_orchestrator import TextOrchestratorNode
@@ -82,7 +82,8 @@ class BodyFlowGraph:
         except Exception as e:
             print(f"Erro ao definir conexões do grafo: {e}")
     
-    async def process_message(self, user_id: str, content: str, channel: str, content_type: str = "text", image_data: bytes = None) -> Dict[str, Any]:
+    async def process_message(self, user_id: str, content: str, channel: str, content_type: str = "text", image_data: bytes = None,
+                              image_batch: Optional[List[bytes]] = None) -> Dict[str, Any]:
         """
         Processa mensagem através do grafo ADK
         
@@ -92,6 +93,7 @@ class BodyFlowGraph:
             channel: Canal de origem (whatsapp, telegram)
             content_type: Tipo de conteúdo (text, image)
             image_data: Dados da imagem (se aplicável)
+            image_batch: Todas as imagens de um álbum, analisadas juntas (se aplicável)
         
         Returns:
             Dict com resposta e metadados
@@ -111,6 +113,7 @@ class BodyFlowGraph:
                 "channel": channel,
                 "content_type": content_type,
                 "image_data": image_data,
+                "image_batch": image_batch,
                 "timestamp": asyncio.get_event_loop().time()
             }
             
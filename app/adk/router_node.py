@@ -10,6 +10,8 @@ from app.adk.simple_adk import Node
 from app.tools.memory_tool import MemoryTool
 from app.tools.observability_tool import ObservabilityTool
 from app.tools.multimodal_tool import MultimodalTool
+from app.services.llm_usage import llm_usage_tracker
+from app.services.session_summary import session_summarizer
 
 class RouterNode(Node):
     """Nó de roteamento inicial do ADK"""
@@ -29,6 +31,9 @@ class RouterNode(Node):
         """
         start_time = time.time()
         
+        # Acumula tokens de todas as chamadas LLM feitas nesta requisição
+        usage_token = llm_usage_tracker.begin_request(input_data.get("user_id", ""))
+        
         try:
             # Extrai dados da entrada
             user_id = input_data.get("user_id", "")
@@ -44,6 +49,7 @@ class RouterNode(Node):
             # Verifica se o usuário está ativo/inativo (centralizado para ambos os canais)
             user_status_check = await self._check_user_status(user_id)
             if user_status_check.get("inactive"):
+                llm_usage_tracker.end_request(usage_token)
                 return {
                     "success": True,
                     "response": user_status_check.get("response", ""),
@@ -66,6 +72,8 @@ class RouterNode(Node):
             
             # Registra observabilidade
             execution_time = (time.time() - start_time) * 1000
+            llm_usage = llm_usage_tracker.end_request(usage_token)
+            usage_token = None
             await self.observability_tool.log_interaction(
                 user_id=user_id,
                 channel=channel,
@@ -74,6 +82,7 @@ class RouterNode(Node):
                 response=result.get("response", ""),
                 execution_time_ms=execution_time,
                 routing_decision=result.get("routing_decision", {}),
+                cost_tokens=llm_usage.get("total_tokens"),
                 confidence=result.get("confidence")
             )
             
@@ -84,6 +93,7 @@ class RouterNode(Node):
                 "metadata": {
                     "orchestrator": result.get("orchestrator"),
                     "confidence": result.get("confidence"),
+                    "llm_usage": llm_usage,
                     "execution_time_ms": execution_time,
                     "timestamp": datetime.now().isoformat()
                 }
@@ -92,6 +102,7 @@ class RouterNode(Node):
         except Exception as e:
             # Log de erro
             execution_time = (time.time() - start_time) * 1000
+            llm_usage = llm_usage_tracker.end_request(usage_token) if usage_token else {}
             await self.observability_tool.log_interaction(
                 user_id=input_data.get("user_id", ""),
                 channel=input_data.get("channel", "unknown"),
@@ -100,6 +111,7 @@ class RouterNode(Node):
                 response=f"Erro interno: {str(e)[:100]}",
                 execution_time_ms=execution_time,
                 routing_decision={"error": str(e)[:100]},
+                cost_tokens=llm_usage.get("total_tokens"),
                 confidence=0.0
             )
             
@@ -224,7 +236,8 @@ Entre em contato conosco através do site."""
                 "timeout"
             )
             
-            # Cria nova sessão
+            # Cria nova sessão (turnos pendentes do resumo eram da sessão anterior)
+            session_summarizer.reset(user_id)
             await self.memory_tool.create_new_session(user_id)
             
             # Log do evento
@@ -4,6 +4,7 @@ Orquestrador de Texto para ADK
 
 import asyncio
 import os
+import re
 import time
 from typing import Dict, Any, Optional, List
 from app.adk.simple_adk import Node
@@ -11,6 +12,47 @@ from app.tools.memory_tool import MemoryTool
 from app.tools.observability_tool import ObservabilityTool
 from app.services.session_manager import SessionManager
 from app.services.llm_service import llm_service
+from app.services.intent_classifier import intent_classifier, SUPPORTED_INTENTS
+from app.services.keyword_matcher import get_keyword_matcher
+from app.services.session_summary import session_summarizer
+
+# Saída estruturada da análise de intenção
+INTENT_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "situation": {"type": "string", "description": "Situação do usuário"},
+        "real_need": {"type": "string", "description": "Necessidade real"},
+        "intent": {
+            "type": "string",
+            "enum": ["registration", "onboarding", "profile_update", "super_personal_trainer", "saudacao", "suporte", "unknown"]
+        },
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+        "reasoning": {"type": "string", "description": "Explicação"}
+    },
+    "required": ["situation", "real_need", "intent", "confidence", "reasoning"]
+}
+
+# Categorias da tabela text_update_detection que indicam atualização de perfil
+PROFILE_UPDATE_CATEGORIES = ("current_weight_kg", "height_cm", "age", "goal", "training_level", "restrictions", "profile")
+
+# Instruções estáticas da análise de intenção (prefixo cacheável do prompt)
+INTENT_ANALYSIS_SYSTEM_PROMPT = """
+Você é um assistente inteligente que entende profundamente as necessidades reais dos usuários de fitness e saúde.
+
+ANÁLISE INTELIGENTE:
+Analise a mensagem do usuário e determine sua intenção a partir do contexto completo fornecido.
+
+INTENÇÕES POSSÍVEIS:
+- "registration" - Usuário não existe, precisa se cadastrar
+- "onboarding" - Usuário existe mas precisa completar perfil (inclui comandos como /start, "olá", "oi")
+- "profile_update" - Usuário quer atualizar dados
+- "super_personal_trainer" - Usuário quer consulta de saúde/nutrição/treino
+- "saudacao" - Cumprimento
+- "suporte" - Dúvidas/problemas
+- "unknown" - Não conseguiu entender
+
+IMPORTANTE: Comandos como "/start", "/iniciar", "olá", "oi" devem ser classificados como "onboarding" se o usuário existe mas não completou o onboarding, ou "saudacao" se já completou.
+"""
 
 class TextOrchestratorNode(Node):
     """Nó orquestrador para processamento de texto"""
@@ -63,8 +105,8 @@ class TextOrchestratorNode(Node):
                 confidence = user_analysis.get("confidence", 0.8)
                 intent = user_analysis.get("intent", "unknown")
             
-            # Atualiza resumo da sessão
-            await self._update_session_summary(user_id, intent, agent_result.get("response", ""))
+            # Atualiza assunto da sessão; o resumo é atualizado em segundo plano
+            await self._update_session_summary(user_id, intent, content, agent_result.get("response", ""))
             
             execution_time = (time.time() - start_time) * 1000
             
@@ -97,6 +139,16 @@ class TextOrchestratorNode(Node):
                 }
             }
     
+    @staticmethod
+    def _last_reply_was_question(short_term: List[Dict[str, Any]]) -> bool:
+        """Verifica se a última mensagem enviada ao usuário terminou em pergunta"""
+        replies = [msg for msg in short_term or [] if msg.get("role") in ("outbound", "assistant") and msg.get("content")]
+        if not replies:
+            return False
+        last_reply = max(replies, key=lambda msg: msg.get("timestamp") or "")
+        # "?" seguido só de emojis/espaços/markdown no fim
+        return bool(re.search(r"\?[^\w.!?]*$", last_reply["content"]))
+    
     async def _analyze_user_situation_and_intent(self, content: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Análise inteligente da situação do usuário e sua necessidade real
@@ -112,6 +164,23 @@ class TextOrchestratorNode(Node):
             onboarding_completed = long_term.get("onboarding_completed", False)
             current_profile = long_term.get("profile", {})
             
+            # Classificador local primeiro; o LLM só é consultado quando a confiança é baixa
+            # Resposta a uma pergunta do trainer ("3 vezes por semana") só faz sentido com o histórico
+            use_local_classifier = user_exists and onboarding_completed and not self._last_reply_was_question(short_term)
+            if use_local_classifier:
+                local = intent_classifier.predict(content)
+                if local["confident"]:
+                    print(f"⚡ TextOrchestrator: Intenção classificada localmente: {local['intent']} ({local['confidence']})")
+                    return {
+                        "situation": "usuário com perfil completo",
+                        "real_need": "classificada localmente",
+                        "intent": local["intent"],
+                        "confidence": local["confidence"],
+                        "reasoning": "classificador local (n-grams)",
+                        "source": "local_classifier"
+                    }
+                print(f"🔁 TextOrchestrator: Classificador local inseguro ({local['intent']}, {local['confidence']}) - consultando LLM")
+            
             # Histórico recente
             recent_messages = []
             if short_term:
@@ -126,8 +195,6 @@ class TextOrchestratorNode(Node):
             active_agent = active_session.get("active_agent") if active_session else ""
             
             prompt = f"""
-Você é um assistente inteligente que entende profundamente as necessidades reais dos usuários de fitness e saúde.
-
 CONTEXTO COMPLETO DO USUÁRIO:
 - Usuário existe no sistema: {user_exists}
 - Onboarding completo: {onboarding_completed}
@@ -137,99 +204,50 @@ CONTEXTO COMPLETO DO USUÁRIO:
 - Agente ativo atual: {active_agent if active_agent else 'Nenhum'}
 
 MENSAGEM ATUAL: "{content}"
-
-ANÁLISE INTELIGENTE:
-Analise a mensagem do usuário e determine sua intenção.
-
-MENSAGEM: "{content}"
-ONBOARDING COMPLETO: {onboarding_completed}
-
-INTENÇÕES POSSÍVEIS:
-- "registration" - Usuário não existe, precisa se cadastrar
-- "onboarding" - Usuário existe mas precisa completar perfil (inclui comandos como /start, "olá", "oi")
-- "profile_update" - Usuário quer atualizar dados
-- "super_personal_trainer" - Usuário quer consulta de saúde/nutrição/treino
-- "saudacao" - Cumprimento
-- "suporte" - Dúvidas/problemas
-- "unknown" - Não conseguiu entender
-
-IMPORTANTE: Comandos como "/start", "/iniciar", "olá", "oi" devem ser classificados como "onboarding" se o usuário existe mas não completou o onboarding, ou "saudacao" se já completou.
-
-RESPONDA EM JSON:
-{{
-    "situation": "situação_do_usuário",
-    "real_need": "necessidade_real",
-    "intent": "intenção_específica",
-    "confidence": 0.8,
-    "reasoning": "explicação"
-}}
 """
             
-            # Usa o serviço centralizado LiteLLM
-            fallback_response = """{
-                "situation": "erro na análise",
-                "real_need": "não identificada",
-                "intent": "unknown",
-                "confidence": 0.3,
-                "reasoning": "LLM sobrecarregado - usando fallback para detecção simples"
-            }"""
-            
-            result = await llm_service.call_with_fallback(
+            # Usa o serviço centralizado LiteLLM (saída estruturada validada pelo schema)
+            analysis = await llm_service.call_structured(
                 messages=[{"role": "user", "content": prompt}],
+                schema=INTENT_ANALYSIS_SCHEMA,
+                schema_name="analise_intencao",
                 max_tokens=300,
                 temperature=0.1,
-                fallback_response=fallback_response
+                system_prompt=INTENT_ANALYSIS_SYSTEM_PROMPT,
+                call_site="text_orchestrator.intent",
+                tier="classification"
             )
             
-            # Tenta extrair JSON da resposta
-            import json
-            try:
-                print(f"🔍 TextOrchestrator: Resposta bruta do LLM: '{result[:200]}...'")
-                
-                # Verifica se a resposta está vazia
-                if not result or result.strip() == "":
-                    print(f"⚠️ TextOrchestrator: Resposta vazia do LLM")
-                    raise json.JSONDecodeError("Empty response", result, 0)
-                
-                # Remove possíveis markdown ou texto extra
-                if "```json" in result:
-                    result = result.split("```json")[1].split("```")[0]
-                elif "```" in result:
-                    result = result.split("```")[1].split("```")[0]
+            if analysis is not None:
+                print(f"✅ TextOrchestrator: Análise estruturada recebida: {analysis}")
                 
-                # Limpa espaços em branco
-                result = result.strip()
-                
-                print(f"🔍 TextOrchestrator: JSON limpo: '{result[:200]}...'")
-                
-                analysis = json.loads(result)
-                print(f"✅ TextOrchestrator: JSON parseado com sucesso: {analysis}")
+                # Rótulos do LLM alimentam o re-treino do classificador local
+                if use_local_classifier and analysis.get("intent") in SUPPORTED_INTENTS and float(analysis.get("confidence", 0)) >= 0.8:
+                    intent_classifier.log_sample(content, analysis["intent"], float(analysis["confidence"]), "llm")
                 return analysis
-                
-            except json.JSONDecodeError as e:
-                print(f"❌ TextOrchestrator: Erro ao parsear JSON: {e}")
-                print(f"❌ TextOrchestrator: Conteúdo que falhou: {result}")
-                
-                # Tenta usar detecção simples como fallback
-                simple_intent = await self._simple_update_detection(content)
-                if simple_intent:
-                    print(f"🎯 TextOrchestrator: Usando detecção simples como fallback: {simple_intent}")
-                    return {
-                        "situation": "análise com detecção simples",
-                        "real_need": "necessidade detectada por palavras-chave",
-                        "intent": simple_intent,
-                        "confidence": 0.7,
-                        "reasoning": "JSON inválido - usando detecção simples"
-                    }
-                
-                # Fallback final se não conseguir detectar nada
+            
+            print(f"❌ TextOrchestrator: LLM não retornou análise válida")
+            
+            # Tenta usar detecção simples como fallback
+            simple_intent = await self._simple_update_detection(content)
+            if simple_intent:
+                print(f"🎯 TextOrchestrator: Usando detecção simples como fallback: {simple_intent}")
                 return {
-                    "situation": "análise falhou",
-                    "real_need": "não identificada",
-                    "intent": "unknown",
-                    "confidence": 0.3,
-                    "reasoning": "erro na análise - JSON inválido"
+                    "situation": "análise com detecção simples",
+                    "real_need": "necessidade detectada por palavras-chave",
+                    "intent": simple_intent,
+                    "confidence": 0.7,
+                    "reasoning": "LLM indisponível ou resposta inválida - usando detecção simples"
                 }
+            
+            # Fallback final se não conseguir detectar nada
+            return {
+                "situation": "análise falhou",
+                "real_need": "não identificada",
+                "intent": "unknown",
+                "confidence": 0.3,
+                "reasoning": "erro na análise - LLM indisponível ou resposta inválida"
+            }
                 
         except Exception as e:
             print(f"❌ Erro na análise inteligente: {e}")
@@ -425,7 +443,7 @@ Mas posso te ajudar com várias coisas! Escolha uma opção ou me diga direto se
                 simple_intent = await self._simple_update_detection(content)
                 if simple_intent:
                     print(f"🎯 TextOrchestrator: Detecção simples encontrou: {simple_intent}")
-                    return await self._route_to_agent(simple_intent, user_id, content, context)
+                    return await self._intelligent_routing(user_id, content, context, {**analysis, "intent": simple_intent})
                 else:
                     # Se não encontrar nada, mostra mensagem melhorada de opções
                     return {
@@ -462,39 +480,16 @@ Mas posso te ajudar com várias coisas! Escolha uma opção ou me diga direto se
         Detecção simples e robusta de intenções de atualização usando palavras-chave
         """
         try:
-            content_lower = content.lower().strip()
-            
-            # Detecção por palavras-chave específicas
-            if any(word in content_lower for word in ["atualizar", "mudar", "alterar", "trocar"]):
-                if any(word in content_lower for word in ["peso", "kg", "quilos"]):
-                    return "weight"
-                elif any(word in content_lower for word in ["altura", "cm", "metros", "metro"]):
-                    return "height"
-                elif any(word in content_lower for word in ["idade", "anos", "anos de idade"]):
-                    return "age"
-                elif any(word in content_lower for word in ["objetivo", "meta", "goal"]):
-                    return "goal"
-                elif any(word in content_lower for word in ["nível", "level", "experiência", "treino"]):
-                    return "training_level"
-                elif any(word in content_lower for word in ["restrição", "alergia", "dieta", "alimentar"]):
-                    return "restrictions"
-                elif any(word in content_lower for word in ["perfil", "dados", "informações"]):
-                    return "profile"
-            
-            # Detecção por padrões específicos - todos direcionam para Super Personal Trainer
+            # Todas as categorias encontradas em uma única passada (texto sem acentos)
+            matches = get_keyword_matcher("text_update_detection").match(content)
+            
+            # Verbo de atualização + campo do perfil (ou perfil geral)
+            if "update_verb" in matches and any(category in PROFILE_UPDATE_CATEGORIES for category in matches):
+                return "profile_update"
+            
+            # Padrões de consulta - todos direcionam para Super Personal Trainer
             # MAS apenas se o usuário completou onboarding (verificação será feita no roteamento)
-            if any(pattern in content_lower for pattern in [
-                "quero treinar", "preciso treinar", "fazer treino", "criar treino",
-                "montar treino", "montar meu treino", "criar meu treino",
-                "plano de treino", "exercícios", "academia", "musculação",
-                "quero dieta", "preciso dieta", "plano alimentar", "alimentação",
-                "comer", "refeições", "bioimpedância", "composição corporal", 
-                "percentual de gordura", "massa muscular", "análise corporal",
-                "receita", "receitas", "ingredientes", "preparo", "cozinhar",
-                "nutricionista", "consulta nutricional", "análise de refeição", 
-                "analisar comida", "avaliar alimentação", "orientação nutricional", 
-                "consulta individual", "nutrição"
-            ]):
+            if "super_personal_trainer" in matches:
                 return "super_personal_trainer"
             
             return None
@@ -508,37 +503,14 @@ Mas posso te ajudar com várias coisas! Escolha uma opção ou me diga direto se
         Detecta qual campo específico está sendo atualizado na mensagem
         """
         try:
-            content_lower = content.lower().strip()
-            
-            # Detecção por padrões de dados específicos
-            if any(word in content_lower for word in ["kg", "quilos", "peso"]):
-                return "weight"
-            elif any(word in content_lower for word in ["cm", "metros", "metro", "altura"]):
-                return "height"
-            elif any(word in content_lower for word in ["anos", "idade"]):
-                return "age"
-            elif any(word in content_lower for word in ["perder peso", "emagrecer", "ganhar massa", "condicionamento", "objetivo"]):
-                return "goal"
-            elif any(word in content_lower for word in ["iniciante", "intermediário", "avançado", "nível"]):
-                return "training_level"
-            elif any(word in content_lower for word in ["vegetariano", "vegano", "lactose", "alergia", "restrição"]):
-                return "restrictions"
-            
-            # Detecção por números com contexto
-            import re
-            numbers = re.findall(r'\d+', content)
-            if numbers:
-                # Se tem números, analisa o contexto
-                if any(word in content_lower for word in ["kg", "quilos"]):
-                    return "weight"
-                elif any(word in content_lower for word in ["cm", "metros", "metro"]):
-                    return "height"
-                elif any(word in content_lower for word in ["anos", "idade"]):
-                    return "age"
-                elif len(content_lower) < 10:  # Mensagem curta com número
-                    # Para mensagens muito curtas como "75", "180", "25"
-                    # Assume que é peso se não há contexto específico
-                    return "weight"
+            # Primeiro campo encontrado na ordem de prioridade da tabela
+            field = get_keyword_matcher("profile_field_values").first_match(content)
+            if field:
+                return field
+            
+            # Mensagem curta só com número (ex.: "75", "180", "25") - assume peso
+            if len(content.strip()) < 10 and any(char.isdigit() for char in content):
+                return "current_weight_kg"
             
             return None
             
@@ -742,11 +714,11 @@ Qual dessas opções te interessa mais?
             }
         }
     
-    async def _update_session_summary(self, user_id: str, intent: str, response: str) -> None:
-        """Atualiza resumo da sessão"""
+    async def _update_session_summary(self, user_id: str, intent: str, content: str, response: str) -> None:
+        """Atualiza o assunto da sessão e registra o turno no resumo incremental"""
         try:
-            summary = f"Última intenção: {intent}. Resposta: {response[:100]}..."
-            await self.memory_tool.update_session_summary(user_id, summary, intent)
+            await self.memory_tool.update_session_topic(user_id, intent)
+            session_summarizer.record_turn(user_id, content, response, intent)
         except Exception:
             # Falha silenciosa
             pass
@@ -5,12 +5,13 @@ Mantém a mesma lógica do WhatsApp, apenas adaptando para o formato do Telegram
 
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import JSONResponse
-from typing import Optional
+from typing import Dict, Any, Optional
 import logging
 import sys
 import os
 import httpx
 import json
+from datetime import datetime
 
 # Ajusta o sys.path para permitir imports relativos
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -18,6 +19,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 from app.services.memory import memory_manager
 from app.services.phone_validation import phone_validation_service
 from app.services.image_storage import image_storage_service
+from app.services.media_download import media_downloader
+from app.services.media_group import media_group_collector
+from app.services.outbound_formatter import to_telegram_html
+from app.services.outbound_dispatcher import outbound_dispatcher
 from app.adk.main_graph import bodyflow_graph
 from app.core.config import Config
 from app.core.channels import ChannelConfig
@@ -28,35 +33,31 @@ telegram_router = APIRouter(prefix="/telegram", tags=["Telegram"])
 class TelegramBot:
     """Classe para gerenciar interações com o Telegram Bot API"""
     
+    # Cliente HTTP compartilhado entre instâncias (conexões reaproveitadas entre envios)
+    _client: Optional[httpx.AsyncClient] = None
+    
     def __init__(self, bot_token: str):
         self.bot_token = bot_token
-        self.api_url = f"https://api.telegram.org/bot{bot_token}"
+        self.api_base = ChannelConfig.TELEGRAM_CONFIG["api_base"]
+        self.api_url = f"{self.api_base}/bot{bot_token}"
+    
+    @classmethod
+    def _get_client(cls) -> httpx.AsyncClient:
+        if cls._client is None or cls._client.is_closed:
+            cls._client = httpx.AsyncClient(timeout=20.0)
+        return cls._client
     
     async def send_message(self, chat_id: str, text: str) -> bool:
         """
         Envia mensagem para o Telegram
+        
+        A resposta entra na fila de envio (partes em ordem, limites de taxa do Telegram,
+        novas tentativas e spool em disco); True quando foi enfileirada
         """
-        try:
-            url = f"{self.api_url}/sendMessage"
-            data = {
-                "chat_id": chat_id,
-                "text": text,
-                "parse_mode": "HTML"
-            }
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data)
-                
-                if response.status_code == 200:
-                    logger.info(f"✅ Mensagem enviada para Telegram: {chat_id}")
-                    return True
-                else:
-                    logger.error(f"❌ Erro ao enviar mensagem para Telegram: {response.status_code} - {response.text}")
-                    return False
-                    
-        except Exception as e:
-            logger.error(f"❌ Erro ao enviar mensagem para Telegram: {e}")
-            return False
+        job_id = outbound_dispatcher.enqueue("telegram", chat_id, text)
+        if job_id:
+            logger.info(f"📮 Mensagem enfileirada para Telegram: {chat_id} ({job_id})")
+        return job_id is not None
     
     async def get_file_info(self, file_id: str) -> Optional[dict]:
         """
@@ -66,34 +67,33 @@ class TelegramBot:
             url = f"{self.api_url}/getFile"
             data = {"file_id": file_id}
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data)
+            response = await self._get_client().post(url, json=data)
+            
+            if response.status_code == 200:
+                return response.json().get("result")
+            else:
+                logger.error(f"❌ Erro ao obter info do arquivo: {response.status_code}")
+                return None
                 
-                if response.status_code == 200:
-                    return response.json().get("result")
-                else:
-                    logger.error(f"❌ Erro ao obter info do arquivo: {response.status_code}")
-                    return None
-                    
         except Exception as e:
             logger.error(f"❌ Erro ao obter info do arquivo: {e}")
             return None
     
-    async def download_file(self, file_path: str) -> Optional[bytes]:
+    async def download_file(self, file_path: str, file_size: Optional[int] = None) -> Optional[bytes]:
         """
         Baixa arquivo do Telegram
+        
+        file_size (de getFile) permite recusar arquivos grandes demais sem iniciar o download
         """
         try:
-            url = f"https://api.telegram.org/file/bot{self.bot_token}/{file_path}"
+            if file_size and file_size > media_downloader.max_bytes:
+                logger.warning(f"⚠️ Arquivo grande demais para baixar: {file_size} bytes")
+                return None
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url)
-                
-                if response.status_code == 200:
-                    return response.content
-                else:
-                    logger.error(f"❌ Erro ao baixar arquivo: {response.status_code}")
-                    return None
+            url = f"{self.api_base}/file/bot{self.bot_token}/{file_path}"
+            
+            # Streaming com limite de tamanho (aborta cedo arquivos grandes demais)
+            return await media_downloader.download(url, source="telegram")
                     
         except Exception as e:
             logger.error(f"❌ Erro ao baixar arquivo: {e}")
@@ -107,7 +107,7 @@ class TelegramBot:
             url = f"{self.api_url}/sendMessage"
             data = {
                 "chat_id": chat_id,
-                "text": text,
+                "text": to_telegram_html(text),
                 "parse_mode": "HTML",
                 "reply_markup": {
                     "keyboard": [[{
@@ -119,16 +119,15 @@ class TelegramBot:
                 }
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data)
+            response = await self._get_client().post(url, json=data)
+            
+            if response.status_code == 200:
+                logger.info(f"✅ Botão de contato enviado para Telegram: {chat_id}")
+                return True
+            else:
+                logger.error(f"❌ Erro ao enviar botão de contato: {response.status_code} - {response.text}")
+                return False
                 
-                if response.status_code == 200:
-                    logger.info(f"✅ Botão de contato enviado para Telegram: {chat_id}")
-                    return True
-                else:
-                    logger.error(f"❌ Erro ao enviar botão de contato: {response.status_code} - {response.text}")
-                    return False
-                    
         except Exception as e:
             logger.error(f"❌ Erro ao enviar botão de contato: {e}")
             return False
@@ -142,8 +141,7 @@ class TelegramBot:
             url = f"{self.api_url}/getChat"
             data = {"chat_id": user_id}
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data)
+            response = await self._get_client().post(url, json=data)
                 
             if response.status_code == 200:
                 result = response.json()
@@ -224,6 +222,17 @@ def _clean_message_for_telegram(message: str) -> str:
     
     return cleaned
 
+async def _save_inbound_message(phone_number: str, message_text: str, upload_task=None) -> None:
+    """
+    Registra a mensagem recebida com a URL da imagem (se o upload já terminou;
+    senão a URL é anexada à linha quando concluir, sem atrasar a resposta)
+    """
+    inbound_created_at = datetime.utcnow().isoformat()
+    image_url = image_storage_service.completed_upload_url(upload_task)
+    await memory_manager.save_message(phone_number, message_text, "inbound", image_url, created_at=inbound_created_at)
+    if not image_url:
+        image_storage_service.attach_to_message(upload_task, phone_number, inbound_created_at)
+
 @telegram_router.get("/")
 async def telegram_status():
     """
@@ -240,6 +249,17 @@ async def telegram_webhook(request: Request):
     try:
         # Lê o JSON do Telegram
         body = await request.json()
+    except Exception as e:
+        logger.error(f"❌ Update inválido recebido no webhook do Telegram: {e}")
+        return {"status": "error", "message": str(e)}
+    
+    return await process_telegram_update(body)
+
+async def process_telegram_update(body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Processa um update do Telegram (webhook ou long polling de getUpdates)
+    """
+    try:
         logger.info(f"📱 Mensagem recebida do Telegram: {json.dumps(body, indent=2)}")
         
         # Extrai informações da mensagem
@@ -426,7 +446,7 @@ Use o botão abaixo para compartilhar seu número de forma segura:""")
             image_data = None
             
             # Verifica se há imagem
-            image_url = None
+            upload_task = None
             if photo:
                 content_type = "image"
                 # Usa a foto de maior resolução (última da lista)
@@ -440,26 +460,17 @@ Use o botão abaixo para compartilhar seu número de forma segura:""")
                     file_info = await telegram_bot.get_file_info(file_id)
                     if file_info and file_info.get("file_path"):
                         # Baixa a imagem
-                        image_data = await telegram_bot.download_file(file_info["file_path"])
+                        image_data = await telegram_bot.download_file(file_info["file_path"], file_info.get("file_size"))
                         if image_data:
                             logger.info(f"✅ Imagem baixada com sucesso - Tamanho: {len(image_data)} bytes")
                             
-                            # Faz upload da imagem para o Supabase Storage
-                            try:
-                                image_url = await image_storage_service.upload_image(
-                                    image_data=image_data,
-                                    user_phone=phone_number,
-                                    content_type="image/jpeg",
-                                    image_type="telegram_photo"
-                                )
-                                
-                                if image_url:
-                                    logger.info(f"📸 Imagem armazenada no Supabase: {image_url}")
-                                else:
-                                    logger.warning("⚠️ Falha ao armazenar imagem no Supabase")
-                            except Exception as e:
-                                logger.error(f"❌ Erro ao fazer upload da imagem: {e}")
-                                image_url = None
+                            # Upload para o Supabase Storage em segundo plano (não atrasa a análise)
+                            upload_task = image_storage_service.start_upload(
+                                image_data=image_data,
+                                user_phone=phone_number,
+                                content_type="image/jpeg",
+                                image_type="telegram_photo"
+                            )
                         else:
                             logger.error("❌ Falha ao baixar imagem")
                             image_data = None
@@ -481,26 +492,17 @@ Use o botão abaixo para compartilhar seu número de forma segura:""")
                         file_info = await telegram_bot.get_file_info(file_id)
                         if file_info and file_info.get("file_path"):
                             # Baixa a imagem
-                            image_data = await telegram_bot.download_file(file_info["file_path"])
+                            image_data = await telegram_bot.download_file(file_info["file_path"], file_info.get("file_size"))
                             if image_data:
                                 logger.info(f"✅ Imagem (documento) baixada com sucesso - Tamanho: {len(image_data)} bytes")
                                 
-                                # Faz upload da imagem para o Supabase Storage
-                                try:
-                                    image_url = await image_storage_service.upload_image(
-                                        image_data=image_data,
-                                        user_phone=phone_number,
-                                        content_type=mime_type,
-                                        image_type="telegram_document"
-                                    )
-                                    
-                                    if image_url:
-                                        logger.info(f"📸 Imagem (documento) armazenada no Supabase: {image_url}")
-                                    else:
-                                        logger.warning("⚠️ Falha ao armazenar imagem (documento) no Supabase")
-                                except Exception as e:
-                                    logger.error(f"❌ Erro ao fazer upload da imagem (documento): {e}")
-                                    image_url = None
+                                # Upload para o Supabase Storage em segundo plano (não atrasa a análise)
+                                upload_task = image_storage_service.start_upload(
+                                    image_data=image_data,
+                                    user_phone=phone_number,
+                                    content_type=mime_type,
+                                    image_type="telegram_document"
+                                )
                             else:
                                 logger.error("❌ Falha ao baixar imagem (documento)")
                                 image_data = None
@@ -508,6 +510,28 @@ Use o botão abaixo para compartilhar seu número de forma segura:""")
                             logger.error("❌ Falha ao obter informações do arquivo (documento)")
                             image_data = None
             
+            # Álbum (media_group_id): o primeiro update recolhe as demais fotos e responde por todas
+            image_batch = None
+            media_group_id = message.get("media_group_id")
+            if media_group_id and image_data:
+                album = await media_group_collector.add(media_group_id, {
+                    "message_id": message.get("message_id", 0),
+                    "image_data": image_data,
+                    "caption": message.get("caption", "")
+                })
+                if album is None:
+                    # Foto entregue ao update líder do álbum: só registra a mensagem recebida
+                    await _save_inbound_message(phone_number, message_text, upload_task)
+                    return {"status": "ok"}
+                
+                if len(album) > 1:
+                    image_batch = [entry["image_data"] for entry in album]
+                    image_data = image_batch[0]
+                    logger.info(f"🖼️ Álbum {media_group_id}: {len(image_batch)} imagens em uma análise")
+                caption = next((entry["caption"] for entry in album if entry["caption"]), "")
+                if caption and not message_text:
+                    message_text = caption
+            
             # Busca customer_id pelo telefone validado
             customer_result = memory_manager.supabase.table("customers").select("id").eq("whatsapp", phone_number).execute()
             if customer_result.data:
@@ -537,7 +561,8 @@ Use o botão abaixo para compartilhar seu número de forma segura:""")
                 content=content_to_process,
                 channel="telegram",
                 content_type=content_type,
-                image_data=image_data
+                image_data=image_data,
+                image_batch=image_batch
             )
             
             logger.info(f"📤 Resultado do grafo ADK:")
@@ -558,7 +583,7 @@ Use o botão abaixo para compartilhar seu número de forma segura:""")
         resposta_limpa = _clean_message_for_telegram(resposta)
         
         # Salva no histórico usando o número de telefone correto
-        await memory_manager.save_message(phone_number, message_text, "inbound", image_url)
+        await _save_inbound_message(phone_number, message_text, upload_task)
         await memory_manager.save_message(phone_number, resposta_limpa, "outbound")
         
         # Envia resposta via Telegram Bot API
@@ -587,6 +612,10 @@ async def setup_telegram_webhook(webhook_url: str = None):
         if not telegram_bot:
             return {"status": "error", "message": "Bot do Telegram não inicializado"}
         
+        if ChannelConfig.TELEGRAM_CONFIG["ingestion_mode"] == "polling":
+            # Com webhook configurado o getUpdates do long polling passa a falhar (409)
+            return {"status": "error", "message": "TELEGRAM_INGESTION_MODE=polling: webhook desativado"}
+        
         # Usa a URL fornecida ou a URL padrão da configuração
         url = webhook_url or ChannelConfig.TELEGRAM_CONFIG.get("webhook_url")
         if not url:
@@ -5,6 +5,11 @@ Endpoints de produção para WhatsApp webhook
 
 import sys
 import os
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Set
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from fastapi import APIRouter, Request, HTTPException
@@ -12,6 +17,10 @@ from fastapi.responses import Response
 from twilio.twiml.messaging_response import MessagingResponse
 from app.services.memory import memory_manager
 from app.services.image_storage import image_storage_service
+from app.services.media_download import media_downloader
+from app.services.outbound_formatter import outbound_formatter, to_whatsapp
+from app.services.outbound_dispatcher import outbound_dispatcher
+from app.core.channels import ChannelConfig
 from app.adk.main_graph import bodyflow_graph
 import logging
 
@@ -21,90 +30,48 @@ logger = logging.getLogger(__name__)
 # Router para endpoints de produção
 whatsapp_router = APIRouter(prefix="/whatsapp", tags=["WhatsApp"])
 
+# Modo WHATSAPP_ASYNC_REPLY: processamentos em segundo plano, ordem por remetente e MessageSids já aceitos
+_background_tasks: Set[asyncio.Task] = set()
+_sender_locks: Dict[str, list] = {}
+_recent_message_sids: "OrderedDict[str, None]" = OrderedDict()
+MAX_RECENT_MESSAGE_SIDS = 2000
+
 @whatsapp_router.post("/")
 async def webhook_whatsapp(request: Request):
     """
     Webhook principal para receber mensagens do WhatsApp via Twilio
+    
+    Com WHATSAPP_ASYNC_REPLY responde na hora com TwiML vazio e entrega a resposta pela
+    API REST do Twilio (sem o timeout de ~15 s do webhook); senão responde em TwiML
     """
     try:
-        form_data = await request.form()
+        form_data = dict(await request.form())
         from_number = form_data.get("From", "")
         message_body = form_data.get("Body", "")
         
         logger.info(f"Mensagem recebida de {from_number}: {message_body}")
         
-        # Processa mensagem através do grafo ADK
-        try:
-            # Determina tipo de conteúdo
-            content_type = "text"
-            image_data = None
-            image_url = None
-            
-            # Verifica se há imagem
-            media_url = form_data.get("MediaUrl0")
-            if media_url:
-                content_type = "image"
-                logger.info(f"📸 Processando imagem do WhatsApp - URL: {media_url}")
-                
-                try:
-                    # Baixa a imagem do Twilio
-                    import httpx
-                    async with httpx.AsyncClient() as client:
-                        response = await client.get(media_url)
-                        if response.status_code == 200:
-                            image_data = response.content
-                            logger.info(f"✅ Imagem baixada com sucesso - Tamanho: {len(image_data)} bytes")
-                            
-                            # Faz upload da imagem para o Supabase Storage
-                            image_url = await image_storage_service.upload_image(
-                                image_data=image_data,
-                                user_phone=from_number,
-                                content_type="image/jpeg",  # Twilio geralmente envia como JPEG
-                                image_type="whatsapp_media"
-                            )
-                            
-                            if image_url:
-                                logger.info(f"📸 Imagem armazenada no Supabase: {image_url}")
-                            else:
-                                logger.warning("⚠️ Falha ao armazenar imagem no Supabase")
-                        else:
-                            logger.error(f"❌ Falha ao baixar imagem: {response.status_code}")
-                            image_data = None
-                except Exception as e:
-                    logger.error(f"❌ Erro ao processar imagem: {e}")
-                    image_data = None
-                    image_url = None
-            
-            # Processa através do grafo ADK
-            graph_result = await bodyflow_graph.process_message(
-                user_id=from_number,
-                content=message_body,
-                channel="whatsapp",
-                content_type=content_type,
-                image_data=image_data
-            )
-            
-            if graph_result.get("success"):
-                resposta = graph_result.get("response", "Resposta não disponível")
+        if ChannelConfig.WHATSAPP_CONFIG["async_reply"]:
+            message_sid = form_data.get("MessageSid", "")
+            if message_sid in _recent_message_sids:
+                # Reentrega do Twilio de uma mensagem já aceita
+                logger.info(f"🔁 MessageSid {message_sid} já recebido, ignorando reentrega")
             else:
-                resposta = graph_result.get("response", "Erro interno do sistema")
-                
-        except Exception as e:
-            logger.error(f"Erro no processamento ADK: {e}")
-            resposta = "Erro interno do sistema. Tente novamente."
-        
-        # Limpa a resposta para compatibilidade com WhatsApp
-        resposta_limpa = _clean_message_for_whatsapp(resposta)
+                if message_sid:
+                    _recent_message_sids[message_sid] = None
+                    while len(_recent_message_sids) > MAX_RECENT_MESSAGE_SIDS:
+                        _recent_message_sids.popitem(last=False)
+                task = asyncio.get_running_loop().create_task(_reply_in_background(form_data))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+            return _create_twiml_response(str(MessagingResponse()))
         
-        # Registra mensagem recebida e enviada
-        await memory_manager.save_message(from_number, message_body, "inbound", image_url)
-        await memory_manager.save_message(from_number, resposta_limpa, "outbound")
+        resposta_limpa = await _process_whatsapp_message(form_data)
         
-        logger.info(f"Resposta enviada para {from_number}: {resposta_limpa[:100]}...")
-        
-        # Cria resposta TwiML
+        # Cria resposta TwiML (uma <Message> por parte, na ordem, dentro do limite do Twilio)
         twiml_response = MessagingResponse()
-        twiml_response.message(resposta_limpa)
+        for part in outbound_formatter.split_message(resposta_limpa, "whatsapp"):
+            twiml_response.message(to_whatsapp(part))
         
         return _create_twiml_response(str(twiml_response))
         
@@ -112,6 +79,120 @@ async def webhook_whatsapp(request: Request):
         logger.error(f"Erro no webhook WhatsApp: {e}")
         return _create_error_response("Erro interno do servidor")
 
+async def drain_background_replies(timeout: float = 30.0) -> int:
+    """
+    Espera os processamentos em segundo plano terminarem (encerramento da aplicação)
+    
+    Returns:
+        Quantos ainda estavam rodando quando o timeout expirou
+    """
+    if not _background_tasks:
+        return 0
+    logger.info(f"⏳ Aguardando {len(_background_tasks)} respostas do WhatsApp em processamento...")
+    _, pending = await asyncio.wait(set(_background_tasks), timeout=timeout)
+    if pending:
+        logger.warning(f"⚠️ {len(pending)} respostas do WhatsApp não terminaram antes do encerramento")
+    return len(pending)
+
+async def _reply_in_background(form_data: Dict[str, Any]) -> None:
+    """
+    Processa a mensagem fora do request e enfileira a resposta na fila de envio
+    
+    Mensagens do mesmo remetente são processadas uma de cada vez, na ordem de chegada
+    """
+    from_number = form_data.get("From", "")
+    entry = _sender_locks.setdefault(from_number, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            started = time.perf_counter()
+            resposta_limpa = await _process_whatsapp_message(form_data)
+            job_id = outbound_dispatcher.enqueue("whatsapp", from_number, resposta_limpa)
+            logger.info(f"📮 Resposta para {from_number} enfileirada ({job_id}) após {(time.perf_counter() - started) * 1000:.0f}ms")
+    except Exception as e:
+        logger.error(f"❌ Erro no processamento em segundo plano do WhatsApp: {e}")
+        outbound_dispatcher.enqueue("whatsapp", from_number, "Erro interno do sistema. Tente novamente.")
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            _sender_locks.pop(from_number, None)
+
+async def _process_whatsapp_message(form_data: Dict[str, Any]) -> str:
+    """
+    Processa a mensagem pelo grafo ADK e registra a troca no histórico
+    
+    Returns:
+        Resposta limpa para o WhatsApp
+    """
+    from_number = form_data.get("From", "")
+    message_body = form_data.get("Body", "")
+    upload_task = None
+    
+    # Processa mensagem através do grafo ADK
+    try:
+        # Determina tipo de conteúdo
+        content_type = "text"
+        image_data = None
+        
+        # Verifica se há imagem
+        media_url = form_data.get("MediaUrl0")
+        if media_url:
+            content_type = "image"
+            logger.info(f"📸 Processando imagem do WhatsApp - URL: {media_url}")
+            
+            try:
+                # Baixa a imagem do Twilio (streaming com limite de tamanho)
+                image_data = await media_downloader.download(media_url, source="twilio")
+                if image_data:
+                    logger.info(f"✅ Imagem baixada com sucesso - Tamanho: {len(image_data)} bytes")
+                    
+                    # Upload para o Supabase Storage em segundo plano (não atrasa a análise)
+                    upload_task = image_storage_service.start_upload(
+                        image_data=image_data,
+                        user_phone=from_number,
+                        content_type=form_data.get("MediaContentType0") or "image/jpeg",
+                        image_type="whatsapp_media"
+                    )
+                else:
+                    logger.error("❌ Falha ao baixar imagem")
+                    image_data = None
+            except Exception as e:
+                logger.error(f"❌ Erro ao processar imagem: {e}")
+                image_data = None
+        
+        # Processa através do grafo ADK
+        graph_result = await bodyflow_graph.process_message(
+            user_id=from_number,
+            content=message_body,
+            channel="whatsapp",
+            content_type=content_type,
+            image_data=image_data
+        )
+        
+        if graph_result.get("success"):
+            resposta = graph_result.get("response", "Resposta não disponível")
+        else:
+            resposta = graph_result.get("response", "Erro interno do sistema")
+            
+    except Exception as e:
+        logger.error(f"Erro no processamento ADK: {e}")
+        resposta = "Erro interno do sistema. Tente novamente."
+    
+    # Limpa a resposta para compatibilidade com WhatsApp
+    resposta_limpa = _clean_message_for_whatsapp(resposta)
+    
+    # Registra mensagem recebida e enviada
+    # (URL da imagem se o upload já terminou; senão é anexada à linha quando concluir, sem atrasar a resposta)
+    inbound_created_at = datetime.utcnow().isoformat()
+    image_url = image_storage_service.completed_upload_url(upload_task)
+    await memory_manager.save_message(from_number, message_body, "inbound", image_url, created_at=inbound_created_at)
+    if not image_url:
+        image_storage_service.attach_to_message(upload_task, from_number, inbound_created_at)
+    await memory_manager.save_message(from_number, resposta_limpa, "outbound")
+    
+    logger.info(f"Resposta enviada para {from_number}: {resposta_limpa[:100]}...")
+    return resposta_limpa
+
 @whatsapp_router.get("/status")
 async def status_webhook():
     """
@@ -144,6 +225,14 @@ async def status_callback(request: Request):
         logger.info(f"ErrorCode: {form_data.get('ErrorCode', 'N/A')}")
         logger.info(f"ErrorMessage: {form_data.get('ErrorMessage', 'N/A')}")
         
+        # Correlaciona com o envio feito pela fila (latência até a entrega no aparelho); status
+        # intermediários desses envios ficam só nas métricas, fora do histórico de mensagens
+        message_status = form_data.get("MessageStatus", "")
+        if form_data.get("MessageSid") and message_status:
+            tracked = outbound_dispatcher.record_status(form_data["MessageSid"], message_status, form_data.get("ErrorCode"))
+            if tracked and message_status not in ("failed", "undelivered"):
+                return {"status": "received"}
+        
         # Salva o status no banco para análise
         await memory_manager.save_message(
             phone=form_data.get('To', 'unknown'),
@@ -22,7 +22,9 @@ class ChannelConfig:
         "webhook_path": "/whatsapp/",
         "status_callback_path": "/whatsapp/status-callback",
         "phone_prefix": "whatsapp:",
-        "message_format": "twiml"
+        "message_format": "twiml",
+        # Responde ao webhook com TwiML vazio e envia a resposta pela API REST do Twilio
+        "async_reply": os.getenv("WHATSAPP_ASYNC_REPLY", "false").lower() == "true"
     }
     
     # Configurações do Telegram
@@ -30,7 +32,11 @@ class ChannelConfig:
         "webhook_path": "/telegram/",
         "bot_token": os.getenv("TELEGRAM_BOT_TOKEN", ""),
         "webhook_url": os.getenv("TELEGRAM_WEBHOOK_URL", ""),
-        "message_format": "json"
+        "message_format": "json",
+        # "webhook" (Telegram chama /telegram/) ou "polling" (long polling de getUpdates, sem URL pública)
+        "ingestion_mode": os.getenv("TELEGRAM_INGESTION_MODE", "webhook").lower(),
+        # Base da Bot API (permite servidor local da Bot API ou um fake nos testes)
+        "api_base": os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
     }
     
     @classmethod
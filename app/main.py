@@ -77,6 +77,21 @@ async def startup_event():
     Evento executado na inicialização da aplicação
     """
     logger.info("🚀 Iniciando BodyFlow Backend...")
+    
+    # Reenvia uploads de imagem que ficaram no spool local
+    import asyncio
+    from app.services.image_storage import image_storage_service
+    asyncio.get_running_loop().create_task(image_storage_service.retry_spooled_uploads())
+    
+    # Fila de envio: retoma respostas que ficaram no spool
+    from app.services.outbound_dispatcher import outbound_dispatcher
+    outbound_dispatcher.start()
+    
+    # Telegram sem webhook: long polling de getUpdates
+    if ChannelConfig.is_telegram_active() and ChannelConfig.TELEGRAM_CONFIG["ingestion_mode"] == "polling":
+        from app.api.v1.telegram import process_telegram_update
+        from app.services.telegram_polling import telegram_poller
+        telegram_poller.start(process_telegram_update)
     logger.info("✅ BodyFlow Backend iniciado com sucesso!")
 
 @app.on_event("shutdown")
@@ -85,6 +100,30 @@ async def shutdown_event():
     Evento executado no encerramento da aplicação
     """
     logger.info("🛑 Encerrando BodyFlow Backend...")
+    
+    # Primeiro quem ainda produz trabalho: álbuns em andamento do polling e respostas
+    # assíncronas do WhatsApp ainda baixam mídia, usam o pool de imagem e chamam o LLM
+    from app.services.telegram_polling import telegram_poller
+    await telegram_poller.stop()
+    
+    if WHATSAPP_AVAILABLE and ChannelConfig.WHATSAPP_CONFIG["async_reply"]:
+        from app.api.v1.whatsapp import drain_background_replies
+        await drain_background_replies()
+    
+    # Libera o pool de workers de imagem
+    from app.services.image_workers import image_worker_pool
+    image_worker_pool.shutdown()
+    
+    from app.services.media_download import media_downloader
+    await media_downloader.close()
+    
+    # Envia agregados pendentes de uso de LLM (depois de todo o trabalho acima)
+    from app.services.llm_usage import llm_usage_tracker
+    await llm_usage_tracker.flush()
+    
+    # Para a fila de envio (pendências continuam no spool)
+    from app.services.outbound_dispatcher import outbound_dispatcher
+    await outbound_dispatcher.stop()
 
 @app.get("/")
 async def root():
@@ -117,12 +156,46 @@ async def get_stats():
     Endpoint para obter estatísticas da aplicação
     """
     try:
+        from app.services.llm_usage import llm_usage_tracker
+        from app.services.profile_extraction import profile_extractor
+        from app.services.intent_classifier import intent_classifier
+        from app.services.llm_json import llm_json_parser
+        from app.services.llm_service import llm_service
+        from app.services.image_preprocessing import image_preprocessor
+        from app.services.image_cache import image_analysis_cache
+        from app.services.image_workers import image_worker_pool
+        from app.services.media_download import media_downloader
+        from app.services.media_group import media_group_collector
+        from app.services.nutrition_db import nutrition_db
+        from app.services.metabolic import metabolic_calculator
+        from app.services.prompt_budget import prompt_assembly_stats
+        from app.services.session_summary import session_summarizer
+        from app.services.outbound_formatter import outbound_formatter
+        from app.services.outbound_dispatcher import outbound_dispatcher
+        from app.services.telegram_polling import telegram_poller
+        
         # Aqui você pode adicionar lógica para buscar estatísticas do Supabase
         return {
             "total_messages": 0,  # Implementar busca no Supabase
             "active_users": 0,   # Implementar busca no Supabase
             "uptime": "running",
-            "version": "1.0.0"
+            "version": "1.0.0",
+            "llm_usage": llm_usage_tracker.get_summary(),
+            "profile_extraction_hit_rates": profile_extractor.get_hit_rates(),
+            "intent_classifier": intent_classifier.get_stats(),
+            "llm_json_parse": llm_json_parser.get_stats(),
+            "structured_output": llm_service.get_structured_output_stats(),
+            "image_preprocessing": image_preprocessor.get_stats(),
+            "image_cache": image_analysis_cache.get_stats(),
+            "image_workers": image_worker_pool.get_stats(),
+            "media_downloads": media_downloader.get_stats(),
+            "media_groups": media_group_collector.get_stats(),
+            "nutrition_db": nutrition_db.get_stats(),
+            "metabolic_targets": metabolic_calculator.get_stats(),
+            "prompt_assembly": prompt_assembly_stats.get_stats(),
+            "session_summary": session_summarizer.get_stats(),
+            "outbound": {**outbound_dispatcher.get_stats(), "formatting": outbound_formatter.get_stats()},
+            "telegram_polling": telegram_poller.get_stats()
         }
     except Exception as e:
         logger.error(f"Erro ao buscar estatísticas: {e}")
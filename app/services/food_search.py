@@ -0,0 +1,215 @@
+"""
+Índice de busca fuzzy de nomes de alimentos por n-gramas de caracteres
+Índice invertido em arrays compactos (CSR: offsets, documentos e pesos TF-IDF normalizados);
+a similaridade de cosseno da consulta com todos os nomes sai de um único np.bincount
+"""
+
+import hashlib
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.keyword_matcher import normalize_text
+
+# Tamanho dos n-gramas de caracteres
+NGRAM_SIZE = 3
+
+# Palavras que não ajudam a distinguir alimentos
+STOPWORDS = {"de", "da", "do", "das", "dos", "com", "e", "ao", "a", "o", "na", "no", "em", "sem", "tipo", "porcao", "pedaco", "fatia"}
+
+
+def search_tokens(text: str) -> List[str]:
+    """Tokens normalizados (sem acento), sem stopwords e com plural simples reduzido"""
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", normalize_text(text)):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def char_ngrams(text: str, size: int = NGRAM_SIZE) -> Counter:
+    """N-gramas de cada palavra com bordas marcadas (" arroz " -> " ar", "arr", ..., "oz ")"""
+    grams: Counter = Counter()
+    for token in search_tokens(text):
+        padded = f" {token} "
+        if len(padded) <= size:
+            grams[padded] += 1
+            continue
+        grams.update(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return grams
+
+
+def _tf_weight(count: int) -> float:
+    return 1.0 + math.log(count)
+
+
+class NgramIndex:
+    """Índice invertido de n-gramas com similaridade de cosseno TF-IDF (0-1)"""
+
+    def __init__(
+        self,
+        documents: List[str],
+        vocabulary: List[str],
+        idf: np.ndarray,
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        weights: np.ndarray,
+        signature: str = ""
+    ):
+        self.documents = documents
+        self.vocabulary = vocabulary
+        self.gram_ids: Dict[str, int] = {gram: index for index, gram in enumerate(vocabulary)}
+        self.idf = idf
+        # Postings do n-grama g: postings[offsets[g]:offsets[g + 1]] (pesos já divididos pela norma do documento)
+        self.offsets = offsets
+        self.postings = postings
+        self.weights = weights
+        self.signature = signature
+        # Peso de n-gramas que não existem no índice (contam na norma da consulta)
+        self.unknown_idf = math.log(len(documents) + 1) + 1.0
+
+    @classmethod
+    def build(cls, documents: List[str], signature: str = "") -> "NgramIndex":
+        """Constrói o índice a partir dos textos (a posição na lista é o id do documento)"""
+        document_grams = [char_ngrams(document) for document in documents]
+
+        document_frequency: Counter = Counter()
+        for grams in document_grams:
+            document_frequency.update(grams.keys())
+        vocabulary = sorted(document_frequency)
+        gram_ids = {gram: index for index, gram in enumerate(vocabulary)}
+
+        total = len(documents)
+        idf = np.array(
+            [math.log((total + 1) / (document_frequency[gram] + 1)) + 1.0 for gram in vocabulary],
+            dtype=np.float32
+        )
+
+        # Pares (n-grama, documento, peso) ordenados por n-grama formam o CSR
+        gram_column, document_column, weight_column = [], [], []
+        for document_id, grams in enumerate(document_grams):
+            vector = {gram_ids[gram]: _tf_weight(count) * float(idf[gram_ids[gram]]) for gram, count in grams.items()}
+            norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+            for gram_id, value in vector.items():
+                gram_column.append(gram_id)
+                document_column.append(document_id)
+                weight_column.append(value / norm)
+
+        gram_column = np.array(gram_column, dtype=np.int32)
+        order = np.argsort(gram_column, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(gram_column, minlength=len(vocabulary)), out=offsets[1:])
+
+        return cls(
+            documents=list(documents),
+            vocabulary=vocabulary,
+            idf=idf,
+            offsets=offsets,
+            postings=np.array(document_column, dtype=np.int32)[order],
+            weights=np.array(weight_column, dtype=np.float32)[order],
+            signature=signature
+        )
+
+    def search(self, query: str, limit: int = 1) -> List[Tuple[int, float]]:
+        """
+        Documentos mais parecidos com a consulta
+
+        Returns:
+            [(id do documento, similaridade de cosseno)] em ordem decrescente (vazio sem n-gramas em comum)
+        """
+        grams = char_ngrams(query)
+        if not grams or not self.documents:
+            return []
+
+        slices, factors = [], []
+        query_norm = 0.0
+        for gram, count in grams.items():
+            gram_id = self.gram_ids.get(gram)
+            weight = _tf_weight(count) * (float(self.idf[gram_id]) if gram_id is not None else self.unknown_idf)
+            query_norm += weight * weight
+            if gram_id is not None:
+                slices.append((self.offsets[gram_id], self.offsets[gram_id + 1]))
+                factors.append(weight)
+        if not slices:
+            return []
+
+        documents = np.concatenate([self.postings[start:end] for start, end in slices])
+        contributions = np.concatenate([self.weights[start:end] * factor for (start, end), factor in zip(slices, factors)])
+        scores = np.bincount(documents, weights=contributions, minlength=len(self.documents)) / math.sqrt(query_norm)
+
+        if limit == 1:
+            best = int(np.argmax(scores))
+            return [(best, float(scores[best]))]
+        limit = min(limit, len(scores))
+        candidates = np.argpartition(-scores, limit - 1)[:limit]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(int(document_id), float(scores[document_id])) for document_id in candidates if scores[document_id] > 0]
+
+    # ------------------------------------------------------------------
+    # Artefato pré-construído
+    # ------------------------------------------------------------------
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(
+            path,
+            documents=np.array(self.documents, dtype=object),
+            vocabulary=np.array(self.vocabulary, dtype=object),
+            idf=self.idf,
+            offsets=self.offsets,
+            postings=self.postings,
+            weights=self.weights,
+            signature=np.array(self.signature)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "NgramIndex":
+        with np.load(path, allow_pickle=True) as artifact:
+            return cls(
+                documents=artifact["documents"].tolist(),
+                vocabulary=artifact["vocabulary"].tolist(),
+                idf=artifact["idf"],
+                offsets=artifact["offsets"],
+                postings=artifact["postings"],
+                weights=artifact["weights"],
+                signature=str(artifact["signature"])
+            )
+
+    @staticmethod
+    def signature_for(documents: List[str]) -> str:
+        """Hash dos documentos (um artefato só vale para a mesma lista de nomes)"""
+        digest = hashlib.sha1()
+        for document in documents:
+            digest.update(document.encode("utf-8") + b"\n")
+        return f"{NGRAM_SIZE}:{digest.hexdigest()}"
+
+
+def load_or_build_index(documents: List[str], artifact_path: Optional[str] = None) -> NgramIndex:
+    """Carrega o artefato se ele corresponde aos documentos; senão constrói (e grava, se houver caminho)"""
+    signature = NgramIndex.signature_for(documents)
+    if artifact_path and not artifact_path.endswith(".npz"):
+        # np.savez acrescenta a extensão: usa o mesmo nome na carga
+        artifact_path = f"{artifact_path}.npz"
+    if artifact_path:
+        try:
+            index = NgramIndex.load(artifact_path)
+            if index.signature == signature:
+                return index
+            print(f"⚠️ FoodSearch: Artefato {artifact_path} desatualizado, reconstruindo índice")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ FoodSearch: Erro ao carregar {artifact_path}: {e}")
+
+    index = NgramIndex.build(documents, signature)
+    if artifact_path:
+        try:
+            index.save(artifact_path)
+        except Exception as e:
+            print(f"⚠️ FoodSearch: Erro ao gravar {artifact_path}: {e}")
+    return index
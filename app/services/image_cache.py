@@ -0,0 +1,285 @@
+"""
+Cache de análises de imagem por hash perceptual
+Imagens reenviadas (mesma foto, print repetido, fixtures de teste) reaproveitam a classificação
+e a análise anteriores sem nova chamada ao LLM
+"""
+
+import hashlib
+import io
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from PIL import Image
+
+from app.services.image_workers import image_worker_pool
+
+# Lado da imagem reduzida usada no pHash e quantos coeficientes de baixa frequência entram no hash
+PHASH_SIZE = 32
+PHASH_LOW_FREQ = 8
+
+# Classes em que quase-duplicata vale como hit. Documentos (bioimpedância, rótulo, planilha)
+# do mesmo modelo têm hashes perceptuais quase iguais com números diferentes: só hit exato
+NEAR_DUPLICATE_CLASSES = {"food", "exercise"}
+
+# Classes com dados pessoais (fotos do corpo, composição corporal): nunca servidas por
+# quase-duplicata (o cache é compartilhado entre usuários) e mantidas só em memória
+PRIVATE_CLASSES = {"body", "bioimpedancia"}
+
+# Tabela de cossenos da DCT-II (só as linhas de baixa frequência são usadas)
+_DCT_COSINES = [
+    [math.cos(math.pi * (2 * x + 1) * u / (2 * PHASH_SIZE)) for x in range(PHASH_SIZE)]
+    for u in range(PHASH_LOW_FREQ)
+]
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """Hash de diferença: compara pixels vizinhos da imagem reduzida a (hash_size+1) x hash_size"""
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def phash(image: Image.Image) -> int:
+    """
+    Hash perceptual: DCT 2D da imagem 32x32 em tons de cinza, bits dos coeficientes 8x8 de
+    baixa frequência acima da mediana (DC excluído da mediana)
+    """
+    pixels = list(image.convert("L").resize((PHASH_SIZE, PHASH_SIZE), Image.LANCZOS).getdata())
+    rows = [pixels[i * PHASH_SIZE:(i + 1) * PHASH_SIZE] for i in range(PHASH_SIZE)]
+
+    # DCT separável: primeiro nas linhas, depois nas colunas, calculando só as 8 frequências baixas
+    row_coefficients = [
+        [sum(pixel * cosine for pixel, cosine in zip(row, _DCT_COSINES[v])) for v in range(PHASH_LOW_FREQ)]
+        for row in rows
+    ]
+    coefficients = [
+        sum(row_coefficients[x][v] * _DCT_COSINES[u][x] for x in range(PHASH_SIZE))
+        for u in range(PHASH_LOW_FREQ)
+        for v in range(PHASH_LOW_FREQ)
+    ]
+
+    median = sorted(coefficients[1:])[len(coefficients[1:]) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+def image_fingerprint(image_data: bytes) -> Dict[str, Any]:
+    """SHA-256 e hashes perceptuais (None se a imagem não abrir); função de módulo para o pool"""
+    fingerprint = {"sha256": hashlib.sha256(image_data).hexdigest(), "phash": None, "dhash": None}
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        fingerprint["phash"] = phash(image)
+        fingerprint["dhash"] = dhash(image)
+    except Exception:
+        pass
+    return fingerprint
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+class ImageAnalysisCache:
+    """Cache LRU com TTL, indexado por SHA-256 e consultado por distância de Hamming (pHash + dHash)"""
+
+    def __init__(self):
+        self.enabled = os.getenv("IMAGE_CACHE", "true").lower() != "false"
+        self.ttl_seconds = float(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+        self.max_distance = int(os.getenv("IMAGE_CACHE_MAX_DISTANCE", "6"))
+        self.max_entries = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "2000"))
+        self.path = os.getenv("IMAGE_CACHE_PATH", os.path.join("logs", "image_cache.jsonl"))
+
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+        if self.enabled:
+            self._load()
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+
+    async def fingerprint(self, image_data: bytes) -> Dict[str, Any]:
+        """SHA-256 do conteúdo e hashes perceptuais, calculados no pool de workers de imagem"""
+        fingerprint = await image_worker_pool.run("fingerprint", image_fingerprint, image_data)
+        if fingerprint["phash"] is None:
+            print("⚠️ ImageCache: Hash perceptual indisponível (imagem não decodificada)")
+        return fingerprint
+
+    def get(self, fingerprint: Dict[str, Any], kind: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca resultado em cache
+
+        Args:
+            fingerprint: Retorno de fingerprint()
+            kind: Tipo de resultado ("classify_and_analyze", ...)
+
+        Returns:
+            Resultado armazenado ou None
+        """
+        if not self.enabled:
+            return None
+
+        stats = self._stats_for(kind)
+        stats["lookups"] += 1
+        now = time.time()
+
+        entry = self.entries.get(fingerprint["sha256"])
+        if entry and kind in entry["results"]:
+            if self._is_fresh(entry, now):
+                self.entries.move_to_end(fingerprint["sha256"])
+                stats["exact_hits"] += 1
+                print(f"🎯 ImageCache: Hit exato ({kind})")
+                return entry["results"][kind]
+            stats["expired"] += 1
+
+        match = self._find_near_duplicate(fingerprint, kind, now)
+        if match is not None:
+            stats["near_hits"] += 1
+            return match
+
+        stats["misses"] += 1
+        return None
+
+    def _find_near_duplicate(self, fingerprint: Dict[str, Any], kind: str, now: float) -> Optional[Dict[str, Any]]:
+        if fingerprint["phash"] is None:
+            return None
+
+        best = None
+        best_distance = self.max_distance + 1
+        for entry in reversed(self.entries.values()):
+            result = entry["results"].get(kind)
+            if result is None or entry["phash"] is None or not self._is_fresh(entry, now):
+                continue
+            if result.get("image_class") not in NEAR_DUPLICATE_CLASSES:
+                continue
+            # pHash decide a proximidade; dHash confirma (evita colisões de estrutura parecida)
+            distance = hamming_distance(fingerprint["phash"], entry["phash"])
+            if distance < best_distance and hamming_distance(fingerprint["dhash"], entry["dhash"]) <= self.max_distance:
+                best, best_distance = result, distance
+
+        if best is not None:
+            print(f"🎯 ImageCache: Hit por quase-duplicata ({kind}, distância {best_distance})")
+        return best
+
+    def _is_fresh(self, entry: Dict[str, Any], now: float) -> bool:
+        return now - entry["created_at"] <= self.ttl_seconds
+
+    # ------------------------------------------------------------------
+    # Escrita e persistência
+    # ------------------------------------------------------------------
+
+    def set(self, fingerprint: Dict[str, Any], kind: str, result: Dict[str, Any]) -> None:
+        """Armazena resultado (que deve trazer "image_class") e anexa ao arquivo de persistência (exceto classes privadas)"""
+        if not self.enabled:
+            return
+
+        created_at = time.time()
+        self._store(fingerprint, kind, result, created_at)
+        self._stats_for(kind)["stores"] += 1
+        if result.get("image_class") in PRIVATE_CLASSES:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as cache_file:
+                cache_file.write(json.dumps({
+                    **fingerprint, "kind": kind, "result": result, "created_at": created_at
+                }, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"⚠️ ImageCache: Erro ao persistir entrada: {e}")
+
+    def _store(self, fingerprint: Dict[str, Any], kind: str, result: Dict[str, Any], created_at: float) -> None:
+        entry = self.entries.get(fingerprint["sha256"])
+        if entry is None:
+            entry = {"phash": fingerprint["phash"], "dhash": fingerprint["dhash"], "created_at": created_at, "results": {}}
+            self.entries[fingerprint["sha256"]] = entry
+        entry["results"][kind] = result
+        entry["created_at"] = created_at
+        self.entries.move_to_end(fingerprint["sha256"])
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _load(self) -> None:
+        """Reconstrói o cache a partir do JSONL e compacta o arquivo (remove expiradas e duplicadas)"""
+        if not os.path.exists(self.path):
+            return
+
+        now = time.time()
+        lines = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as cache_file:
+                for line in cache_file:
+                    if not line.strip():
+                        continue
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    # Entradas privadas gravadas por versões anteriores são descartadas na compactação
+                    if record["result"].get("image_class") in PRIVATE_CLASSES:
+                        continue
+                    if now - record["created_at"] <= self.ttl_seconds:
+                        self._store(record, record["kind"], record["result"], record["created_at"])
+        except Exception as e:
+            print(f"⚠️ ImageCache: Erro ao carregar {self.path}: {e}")
+            return
+
+        records = self._records()
+        if len(records) < lines:
+            self._rewrite(records)
+        print(f"📦 ImageCache: {len(self.entries)} imagens carregadas de {self.path}")
+
+    def _records(self) -> List[Dict[str, Any]]:
+        return [
+            {"sha256": sha256, "phash": entry["phash"], "dhash": entry["dhash"],
+             "kind": kind, "result": result, "created_at": entry["created_at"]}
+            for sha256, entry in self.entries.items()
+            for kind, result in entry["results"].items()
+        ]
+
+    def _rewrite(self, records: List[Dict[str, Any]]) -> None:
+        temporary_path = f"{self.path}.tmp"
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as cache_file:
+                for record in records:
+                    cache_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(temporary_path, self.path)
+        except Exception as e:
+            print(f"⚠️ ImageCache: Erro ao compactar {self.path}: {e}")
+
+    # ------------------------------------------------------------------
+    # Estatísticas
+    # ------------------------------------------------------------------
+
+    def _stats_for(self, kind: str) -> Dict[str, int]:
+        return self.stats.setdefault(kind, {
+            "lookups": 0, "exact_hits": 0, "near_hits": 0, "misses": 0, "expired": 0, "stores": 0
+        })
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Taxa de acerto (exata e por quase-duplicata) por tipo de resultado"""
+        summary = {"enabled": self.enabled, "entries": len(self.entries), "max_distance": self.max_distance, "kinds": {}}
+        for kind, stats in self.stats.items():
+            lookups = stats["lookups"] or 1
+            summary["kinds"][kind] = {
+                **stats,
+                "hit_rate": round((stats["exact_hits"] + stats["near_hits"]) / lookups, 3)
+            }
+        return summary
+
+
+# Instância global do cache
+image_analysis_cache = ImageAnalysisCache()
@@ -0,0 +1,231 @@
+"""
+Pré-processamento de imagens antes do envio ao LLM de visão
+Corrige orientação EXIF, reduz para a maior aresta configurada por tipo de análise e
+recomprime (JPEG/WebP), registrando bytes economizados
+"""
+
+import base64
+import io
+import os
+import time
+from typing import Dict, Any
+
+from PIL import Image, ImageOps
+
+from app.services.image_workers import image_worker_pool
+
+# Maior aresta (px) por tipo de análise: documentos com texto pedem mais resolução que fotos
+DEFAULT_MAX_EDGES = {
+    "classification": 768,
+    # Passada única (classificação + análise): a classe ainda é desconhecida, então
+    # resolução suficiente para ler relatórios e rótulos
+    "combined": 1600,
+    "bioimpedancia": 2000,
+    "label": 1600,
+    "treino_planilha": 1600,
+    "food": 1024,
+    "exercise": 1024,
+    "body": 1024,
+    "default": 1280,
+}
+
+# Qualidade de compressão por tipo (texto pequeno sofre mais com artefatos)
+DEFAULT_QUALITIES = {
+    "bioimpedancia": 90,
+    "label": 90,
+    "treino_planilha": 88,
+    "combined": 88,
+    "default": 80,
+}
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+
+
+def _parse_overrides(raw: str) -> Dict[str, int]:
+    """Converte "food=1024,bioimpedancia=2000" em dicionário"""
+    overrides = {}
+    for item in raw.split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            try:
+                overrides[key.strip()] = int(value)
+            except ValueError:
+                print(f"⚠️ ImagePreprocessor: Valor inválido ignorado: {item}")
+    return overrides
+
+
+def inspect_image(image_data: bytes) -> Dict[str, Any]:
+    """Dimensões e formato (lê só o cabeçalho); levanta exceção se não for imagem"""
+    image = Image.open(io.BytesIO(image_data))
+    return {"width": image.width, "height": image.height, "format": image.format, "size_bytes": len(image_data)}
+
+
+def encode_for_llm(image_data: bytes, max_edge: int, quality: int, output_format: str, enabled: bool = True) -> Dict[str, Any]:
+    """
+    Decodifica, corrige orientação, reduz, recomprime e codifica em base64
+
+    Função de módulo (sem estado) para rodar no pool de workers, inclusive em processos.
+    Imagem que o PIL não abre segue como veio (o provedor decide).
+    """
+    try:
+        encoded, mime_type, width, height = _process(image_data, max_edge, quality, output_format, enabled)
+        error = None
+    except Exception as e:
+        encoded, mime_type, width, height = image_data, "image/jpeg", None, None
+        error = str(e)
+
+    return {
+        "base64": base64.b64encode(encoded).decode("utf-8"),
+        "mime_type": mime_type,
+        "width": width,
+        "height": height,
+        "bytes": len(encoded),
+        "error": error
+    }
+
+
+def _process(image_data: bytes, max_edge: int, quality: int, output_format: str, enabled: bool):
+    image = Image.open(io.BytesIO(image_data))
+    source_format = image.format
+    source_mime = MIME_TYPES.get(source_format, "image/jpeg")
+
+    if not enabled:
+        return image_data, source_mime, image.width, image.height
+
+    # Fotos de celular vêm "deitadas" com a rotação apenas no EXIF
+    rotated = image.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1
+    if rotated:
+        image = ImageOps.exif_transpose(image)
+
+    needs_resize = max(image.size) > max_edge
+
+    # Já pequena, no formato aceito e sem rotação: envia os bytes originais
+    if not needs_resize and not rotated and source_format in ("JPEG", "WEBP") and _is_compact(image_data, image):
+        return image_data, source_mime, image.width, image.height
+
+    if needs_resize:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    image = _to_rgb(image)
+
+    buffer = io.BytesIO()
+    if output_format == "WEBP":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    encoded = buffer.getvalue()
+
+    # Recompressão que não reduz nada (e sem redimensionar/rotacionar) não vale a perda de qualidade
+    if not needs_resize and not rotated and len(encoded) >= len(image_data) and source_format in MIME_TYPES:
+        return image_data, source_mime, image.width, image.height
+
+    return encoded, MIME_TYPES[output_format], image.width, image.height
+
+
+def _is_compact(image_data: bytes, image: Image.Image) -> bool:
+    """Heurística: original já comprimido (≤ 1.5 bytes/pixel) não precisa ser recodificado"""
+    return len(image_data) <= image.width * image.height * 1.5
+
+
+def _to_rgb(image: Image.Image) -> Image.Image:
+    """JPEG não tem canal alfa: transparência vira fundo branco"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+class ImagePreprocessor:
+    """Prepara imagens para análise multimodal (orientação, tamanho, formato e MIME)"""
+
+    def __init__(self):
+        self.enabled = os.getenv("IMAGE_PREPROCESSING", "true").lower() != "false"
+        self.max_edges = {**DEFAULT_MAX_EDGES, **_parse_overrides(os.getenv("IMAGE_MAX_EDGES", ""))}
+        self.qualities = {**DEFAULT_QUALITIES, **_parse_overrides(os.getenv("IMAGE_QUALITY", ""))}
+        output_format = os.getenv("IMAGE_OUTPUT_FORMAT", "JPEG").upper()
+        self.output_format = output_format if output_format in ("JPEG", "WEBP") else "JPEG"
+
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    async def prepare(self, image_data: bytes, analysis_type: str = "default") -> Dict[str, Any]:
+        """
+        Prepara imagem para o LLM (trabalho de CPU no pool de workers de imagem)
+
+        Args:
+            image_data: Bytes originais (foto/documento do usuário)
+            analysis_type: Tipo de análise ("food", "bioimpedancia", "classification", ...)
+
+        Returns:
+            {"data_url", "base64", "mime_type", "width", "height", "original_bytes", "bytes", "bytes_saved"}
+        """
+        started = time.perf_counter()
+        encoded = await image_worker_pool.run(
+            "prepare",
+            encode_for_llm,
+            image_data,
+            self.max_edges.get(analysis_type, self.max_edges["default"]),
+            self.qualities.get(analysis_type, self.qualities["default"]),
+            self.output_format,
+            self.enabled
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        original_size = len(image_data)
+        if encoded["error"]:
+            print(f"⚠️ ImagePreprocessor: Falha ao processar imagem ({analysis_type}): {encoded['error']}")
+        self._record(analysis_type, original_size, encoded["bytes"], elapsed_ms)
+
+        print(
+            f"🖼️ ImagePreprocessor: {analysis_type} {original_size} → {encoded['bytes']} bytes "
+            f"({encoded['width']}x{encoded['height']}, {encoded['mime_type']}, {elapsed_ms:.0f}ms)"
+        )
+
+        return {
+            "data_url": f"data:{encoded['mime_type']};base64,{encoded['base64']}",
+            "base64": encoded["base64"],
+            "mime_type": encoded["mime_type"],
+            "width": encoded["width"],
+            "height": encoded["height"],
+            "original_bytes": original_size,
+            "bytes": encoded["bytes"],
+            "bytes_saved": max(original_size - encoded["bytes"], 0)
+        }
+
+    def _record(self, analysis_type: str, original_size: int, sent_size: int, elapsed_ms: float) -> None:
+        stats = self.stats.setdefault(analysis_type, {
+            "images": 0, "original_bytes": 0, "sent_bytes": 0, "processing_ms_total": 0.0
+        })
+        stats["images"] += 1
+        stats["original_bytes"] += original_size
+        stats["sent_bytes"] += sent_size
+        stats["processing_ms_total"] += elapsed_ms
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Bytes originais vs. enviados por tipo de análise"""
+        summary = {}
+        for analysis_type, stats in self.stats.items():
+            images = stats["images"] or 1
+            summary[analysis_type] = {
+                "images": stats["images"],
+                "original_bytes": stats["original_bytes"],
+                "sent_bytes": stats["sent_bytes"],
+                "bytes_saved": stats["original_bytes"] - stats["sent_bytes"],
+                "reduction_ratio": round(1 - stats["sent_bytes"] / stats["original_bytes"], 3) if stats["original_bytes"] else 0.0,
+                "avg_processing_ms": round(stats["processing_ms_total"] / images, 1)
+            }
+        return summary
+
+
+# Instância global do pré-processador
+image_preprocessor = ImagePreprocessor()
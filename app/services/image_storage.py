@@ -2,7 +2,11 @@
 Serviço de Armazenamento de Imagens no Supabase Storage
 """
 
+import asyncio
+import glob
+import json
 import os
+import time
 import uuid
 from typing import Optional, Dict, Any
 from datetime import datetime
@@ -19,6 +23,15 @@ class ImageStorageService:
         )
         self.bucket_name = "user-images"  # Nome do bucket no Supabase
         
+        # Upload em segundo plano: onde guardar falhas e como reenviá-las
+        self.spool_dir = os.getenv("IMAGE_UPLOAD_SPOOL_DIR", os.path.join("logs", "upload_spool"))
+        self.spool_retry_interval = float(os.getenv("IMAGE_UPLOAD_RETRY_INTERVAL", "300"))
+        self.max_spool_attempts = int(os.getenv("IMAGE_UPLOAD_MAX_ATTEMPTS", "10"))
+        
+        self._background_tasks = set()
+        self._last_spool_retry = 0.0
+        self._retrying_spool = False
+        
     async def upload_image(
         self, 
         image_data: bytes, 
@@ -29,6 +42,8 @@ class ImageStorageService:
         """
         Faz upload de uma imagem para o Supabase Storage
         
+        O cliente do Supabase é síncrono: o upload roda em uma thread para não bloquear o event loop.
+        
         Args:
             image_data: Dados binários da imagem
             user_phone: Número do telefone do usuário
@@ -38,6 +53,9 @@ class ImageStorageService:
         Returns:
             URL assinada da imagem ou None se falhou
         """
+        return await asyncio.to_thread(self._upload_sync, image_data, user_phone, content_type, image_type)
+    
+    def _upload_sync(self, image_data: bytes, user_phone: str, content_type: str, image_type: str) -> Optional[str]:
         try:
             # Gera nome único para o arquivo
             file_extension = self._get_file_extension(content_type)
@@ -90,6 +108,176 @@ class ImageStorageService:
             print(f"❌ ImageStorageService: Erro no upload: {e}")
             return None
     
+    def start_upload(
+        self,
+        image_data: bytes,
+        user_phone: str,
+        content_type: str = "image/jpeg",
+        image_type: str = "unknown"
+    ) -> asyncio.Task:
+        """
+        Inicia o upload em segundo plano, concorrente com a análise da imagem
+        
+        Returns:
+            Task com {"image_url", "spool_id"}; falhas vão para o spool local e são reenviadas depois
+        """
+        task = asyncio.get_running_loop().create_task(
+            self._upload_or_spool(image_data, user_phone, content_type, image_type)
+        )
+        self._track(task)
+        return task
+    
+    def completed_upload_url(self, upload_task: Optional[asyncio.Task]) -> Optional[str]:
+        """
+        URL do upload para gravar junto com a mensagem de entrada, sem esperar
+
+        Se o upload ainda não terminou, retorna None e a URL é anexada depois (ver attach_to_message)
+        """
+        if upload_task is None or not upload_task.done() or upload_task.cancelled() or upload_task.exception():
+            return None
+        return upload_task.result()["image_url"]
+    
+    def attach_to_message(self, upload_task: Optional[asyncio.Task], phone: str, message_created_at: str) -> None:
+        """Anexa a URL à mensagem já gravada quando o upload (ou o reenvio do spool) concluir"""
+        if upload_task is None:
+            return
+        
+        def _on_done(task: asyncio.Task) -> None:
+            if task.cancelled() or task.exception():
+                return
+            result = task.result()
+            if result["image_url"]:
+                from app.services.memory import memory_manager
+                self._track(asyncio.get_running_loop().create_task(
+                    memory_manager.update_message_image_url(phone, message_created_at, result["image_url"])
+                ))
+            elif result["spool_id"]:
+                self._track(asyncio.get_running_loop().create_task(
+                    asyncio.to_thread(self._link_spooled_message, result["spool_id"], phone, message_created_at)
+                ))
+        
+        upload_task.add_done_callback(_on_done)
+    
+    def _track(self, task: asyncio.Task) -> None:
+        # Mantém referência às tasks em segundo plano até terminarem
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _upload_or_spool(self, image_data: bytes, user_phone: str, content_type: str, image_type: str) -> Dict[str, Any]:
+        image_url = await self.upload_image(image_data, user_phone, content_type, image_type)
+        if image_url:
+            # Storage respondendo: aproveita para reenviar o que ficou no spool
+            if time.time() - self._last_spool_retry > self.spool_retry_interval:
+                self._track(asyncio.get_running_loop().create_task(self.retry_spooled_uploads()))
+            return {"image_url": image_url, "spool_id": None}
+        
+        try:
+            spool_id = await asyncio.to_thread(self._spool, image_data, {
+                "user_phone": user_phone,
+                "content_type": content_type,
+                "image_type": image_type,
+                "attempts": 1,
+                "created_at": time.time(),
+                "message": None
+            })
+            print(f"📥 ImageStorageService: Upload falhou, imagem guardada no spool ({spool_id})")
+        except Exception as e:
+            print(f"❌ ImageStorageService: Erro ao guardar imagem no spool: {e}")
+            spool_id = None
+        return {"image_url": None, "spool_id": spool_id}
+    
+    # ------------------------------------------------------------------
+    # Spool local de uploads que falharam
+    # ------------------------------------------------------------------
+    
+    def _spool_paths(self, spool_id: str):
+        return os.path.join(self.spool_dir, f"{spool_id}.bin"), os.path.join(self.spool_dir, f"{spool_id}.json")
+    
+    def _spool(self, image_data: bytes, metadata: Dict[str, Any]) -> str:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        spool_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}"
+        data_path, meta_path = self._spool_paths(spool_id)
+        with open(data_path, "wb") as data_file:
+            data_file.write(image_data)
+        self._write_spool_metadata(meta_path, metadata)
+        return spool_id
+    
+    @staticmethod
+    def _write_spool_metadata(meta_path: str, metadata: Dict[str, Any]) -> None:
+        temporary_path = f"{meta_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as meta_file:
+            json.dump(metadata, meta_file, ensure_ascii=False)
+        os.replace(temporary_path, meta_path)
+    
+    def _link_spooled_message(self, spool_id: str, phone: str, message_created_at: str) -> None:
+        """Registra no spool qual mensagem deve receber a URL quando o reenvio der certo"""
+        _, meta_path = self._spool_paths(spool_id)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as meta_file:
+                metadata = json.load(meta_file)
+            metadata["message"] = {"phone": phone, "created_at": message_created_at}
+            self._write_spool_metadata(meta_path, metadata)
+        except FileNotFoundError:
+            # Já reenviado e removido antes do vínculo
+            pass
+    
+    async def retry_spooled_uploads(self) -> int:
+        """
+        Reenvia uploads guardados no spool e anexa as URLs às mensagens
+        
+        Returns:
+            Quantidade de imagens enviadas com sucesso
+        """
+        if self._retrying_spool:
+            return 0
+        self._retrying_spool = True
+        self._last_spool_retry = time.time()
+        uploaded = 0
+        
+        try:
+            from app.services.memory import memory_manager
+            
+            for meta_path in sorted(glob.glob(os.path.join(self.spool_dir, "*.json"))):
+                spool_id = os.path.basename(meta_path)[:-len(".json")]
+                data_path, _ = self._spool_paths(spool_id)
+                try:
+                    with open(meta_path, "r", encoding="utf-8") as meta_file:
+                        metadata = json.load(meta_file)
+                    # Entrada recente ainda sem vínculo: a mensagem pode estar sendo gravada agora
+                    if metadata.get("message") is None and time.time() - metadata["created_at"] < 120:
+                        continue
+                    with open(data_path, "rb") as data_file:
+                        image_data = data_file.read()
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"⚠️ ImageStorageService: Entrada de spool ilegível ({spool_id}): {e}")
+                    continue
+                
+                image_url = await self.upload_image(
+                    image_data, metadata["user_phone"], metadata["content_type"], metadata["image_type"]
+                )
+                if image_url:
+                    if metadata.get("message"):
+                        await memory_manager.update_message_image_url(
+                            metadata["message"]["phone"], metadata["message"]["created_at"], image_url
+                        )
+                    uploaded += 1
+                elif metadata["attempts"] + 1 < self.max_spool_attempts:
+                    metadata["attempts"] += 1
+                    self._write_spool_metadata(meta_path, metadata)
+                    continue
+                else:
+                    print(f"❌ ImageStorageService: Desistindo do upload {spool_id} após {metadata['attempts'] + 1} tentativas")
+                
+                for path in (data_path, meta_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            
+            if uploaded:
+                print(f"✅ ImageStorageService: {uploaded} imagens do spool enviadas")
+            return uploaded
+        finally:
+            self._retrying_spool = False
+    
     async def delete_image(self, image_url: str) -> bool:
         """
         Remove uma imagem do Supabase Storage
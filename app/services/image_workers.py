@@ -0,0 +1,122 @@
+"""
+Pool de workers para o trabalho de CPU com imagens
+Decodificação, redimensionamento, recompressão, hashing e base64 saem do event loop para um
+pool de threads ou processos, com fila limitada e tempos por operação
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+
+class ImageWorkerPool:
+    """Executa funções de imagem em um executor dedicado, limitando as tarefas pendentes"""
+
+    def __init__(self):
+        mode = os.getenv("IMAGE_WORKER_MODE", "thread").lower()
+        # "inline" mantém o comportamento antigo (útil para depuração)
+        self.mode = mode if mode in ("thread", "process", "inline") else "thread"
+        self.max_workers = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+        # Tarefas aceitas (em execução + na fila); acima disso quem chama espera
+        self.queue_size = int(os.getenv("IMAGE_WORKER_QUEUE_SIZE", str(self.max_workers * 4)))
+
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                # Funções e argumentos precisam ser serializáveis (funções de módulo + bytes)
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="image-worker")
+            print(f"🧵 ImageWorkerPool: {self.max_workers} workers ({self.mode}), fila de {self.queue_size}")
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Criado sob demanda para ficar no event loop em execução
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.queue_size)
+        return self._semaphore
+
+    async def run(self, operation: str, function: Callable, *args) -> Any:
+        """
+        Executa `function(*args)` no pool
+
+        Args:
+            operation: Rótulo da operação para as estatísticas ("decode", "prepare", "hash", ...)
+            function: Função de CPU (no modo "process", função de nível de módulo)
+
+        Returns:
+            Retorno da função (exceções são propagadas)
+        """
+        queued_at = time.perf_counter()
+
+        if self.mode == "inline":
+            try:
+                return function(*args)
+            finally:
+                self._record(operation, 0.0, (time.perf_counter() - queued_at) * 1000)
+
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            submitted_at = time.perf_counter()
+            future = loop.run_in_executor(self._get_executor(), _timed_call, function, args)
+            try:
+                result, run_ms = await future
+            except Exception:
+                self._record(operation, (submitted_at - queued_at) * 1000, (time.perf_counter() - submitted_at) * 1000, failed=True)
+                raise
+
+        # Espera total menos execução = tempo na fila (semáforo + executor)
+        total_ms = (time.perf_counter() - queued_at) * 1000
+        self._record(operation, total_ms - run_ms, run_ms)
+        return result
+
+    def _record(self, operation: str, wait_ms: float, run_ms: float, failed: bool = False) -> None:
+        stats = self.stats.setdefault(operation, {
+            "calls": 0, "failures": 0, "wait_ms_total": 0.0, "run_ms_total": 0.0, "run_ms_max": 0.0
+        })
+        stats["calls"] += 1
+        stats["failures"] += int(failed)
+        stats["wait_ms_total"] += wait_ms
+        stats["run_ms_total"] += run_ms
+        stats["run_ms_max"] = max(stats["run_ms_max"], run_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Chamadas, tempo médio na fila e de execução por operação"""
+        operations = {}
+        for operation, stats in self.stats.items():
+            calls = stats["calls"] or 1
+            operations[operation] = {
+                "calls": stats["calls"],
+                "failures": stats["failures"],
+                "avg_wait_ms": round(stats["wait_ms_total"] / calls, 2),
+                "avg_run_ms": round(stats["run_ms_total"] / calls, 2),
+                "max_run_ms": round(stats["run_ms_max"], 2)
+            }
+        return {
+            "mode": self.mode,
+            "workers": self.max_workers,
+            "queue_size": self.queue_size,
+            "operations": operations
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _timed_call(function: Callable, args: tuple):
+    """Roda no worker e devolve o tempo de execução medido lá (exclui espera na fila)"""
+    started = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+# Instância global do pool
+image_worker_pool = ImageWorkerPool()
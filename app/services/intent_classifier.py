@@ -0,0 +1,251 @@
+"""
+Classificador local de intenção (n-grams com hashing + regressão logística)
+Resolve a maioria das mensagens sem LLM; abaixo do limiar de confiança o orquestrador consulta o LLM
+"""
+
+import json
+import math
+import os
+import random
+import re
+import time
+import zlib
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.services.keyword_matcher import normalize_text
+
+# Espaço de hashing das features (2^18 buckets)
+HASH_BUCKETS = 1 << 18
+
+# Intenções que o modelo local decide (contexto: usuário com onboarding completo)
+SUPPORTED_INTENTS = {"saudacao", "profile_update", "super_personal_trainer", "suporte"}
+
+DEFAULT_WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "intent_classifier.json")
+
+
+def extract_features(text: str) -> List[int]:
+    """Unigramas, bigramas de palavras e trigramas de caracteres, mapeados por hashing"""
+    normalized = normalize_text(text)
+    words = re.findall(r"[a-z0-9/]+", normalized)
+
+    grams = [f"w:{word}" for word in words]
+    grams += [f"b:{first}_{second}" for first, second in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    if not words:
+        grams.append("empty")
+
+    return sorted({zlib.crc32(gram.encode("utf-8")) % HASH_BUCKETS for gram in grams})
+
+
+def _softmax(scores: List[float]) -> List[float]:
+    top = max(scores)
+    exps = [math.exp(score - top) for score in scores]
+    total = sum(exps)
+    return [value / total for value in exps]
+
+
+class LocalIntentClassifier:
+    """Modelo linear esparso sobre features com hashing, com recarga a quente dos pesos"""
+
+    def __init__(self, weights_path: Optional[str] = None):
+        self.weights_path = weights_path or os.getenv("INTENT_CLASSIFIER_WEIGHTS", DEFAULT_WEIGHTS_PATH)
+        self.threshold = float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.85"))
+        # Limiar próprio por intenção: "suporte" erra mais (mensagens curtas e negativas caem nela)
+        self.intent_thresholds = {"suporte": float(os.getenv("INTENT_CLASSIFIER_SUPPORT_THRESHOLD", "0.97"))}
+        # Mensagens com menos palavras que isso dependem do contexto da conversa ("não", "3x") e vão para o LLM,
+        # exceto cumprimentos ("oi", "boa noite"), que são curtos por natureza
+        self.min_words = int(os.getenv("INTENT_CLASSIFIER_MIN_WORDS", "3"))
+        self.short_message_intents = {"saudacao"}
+        # Fração mínima de features conhecidas pelo modelo (mensagens fora do domínio vão para o LLM)
+        self.min_feature_coverage = float(os.getenv("INTENT_CLASSIFIER_MIN_COVERAGE", "0.6"))
+        self.samples_path = os.getenv("INTENT_SAMPLES_PATH", os.path.join("logs", "intent_samples.jsonl"))
+        self.reload_interval = 30
+
+        self.labels: List[str] = []
+        self.bias: List[float] = []
+        self.weights: Dict[int, List[float]] = {}
+        self.metadata: Dict[str, Any] = {}
+
+        self._loaded_mtime = 0.0
+        self._last_reload_check = 0.0
+        self.stats = {"local": 0, "escalated": 0}
+
+        self._maybe_reload(force=True)
+
+    @property
+    def is_ready(self) -> bool:
+        return bool(self.labels and self.weights)
+
+    # ------------------------------------------------------------------
+    # Inferência
+    # ------------------------------------------------------------------
+
+    def predict(self, text: str) -> Dict[str, Any]:
+        """
+        Classifica mensagem
+
+        Returns:
+            {"intent", "confidence", "probabilities", "feature_coverage", "confident"}
+        """
+        self._maybe_reload()
+        if not self.is_ready:
+            return {"intent": None, "confidence": 0.0, "probabilities": {}, "feature_coverage": 0.0, "confident": False}
+
+        features = extract_features(text)
+        words = len(re.findall(r"[a-z0-9/]+", normalize_text(text)))
+        scores = list(self.bias)
+        known = 0
+        for feature in features:
+            row = self.weights.get(feature)
+            if row:
+                known += 1
+                for index, weight in enumerate(row):
+                    scores[index] += weight
+
+        probabilities = _softmax(scores)
+        best = max(range(len(self.labels)), key=lambda index: probabilities[index])
+        confidence = probabilities[best]
+        coverage = known / len(features) if features else 0.0
+        threshold = max(self.threshold, self.intent_thresholds.get(self.labels[best], 0.0))
+        long_enough = words >= self.min_words or self.labels[best] in self.short_message_intents
+        confident = confidence >= threshold and coverage >= self.min_feature_coverage and long_enough
+
+        self.stats["local" if confident else "escalated"] += 1
+        return {
+            "intent": self.labels[best],
+            "confidence": round(confidence, 3),
+            "probabilities": {label: round(prob, 3) for label, prob in zip(self.labels, probabilities)},
+            "feature_coverage": round(coverage, 3),
+            "confident": confident
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Proporção de mensagens resolvidas localmente"""
+        total = self.stats["local"] + self.stats["escalated"]
+        return {
+            **self.stats,
+            "local_ratio": round(self.stats["local"] / total, 3) if total else 0.0,
+            "model_version": self.metadata.get("trained_at"),
+            "threshold": self.threshold,
+            "intent_thresholds": self.intent_thresholds,
+            "min_words": self.min_words
+        }
+
+    # ------------------------------------------------------------------
+    # Pesos (carga, recarga a quente e persistência)
+    # ------------------------------------------------------------------
+
+    def _maybe_reload(self, force: bool = False) -> None:
+        """Recarrega pesos se o arquivo mudou (checagem a cada reload_interval segundos)"""
+        now = time.time()
+        if not force and now - self._last_reload_check < self.reload_interval:
+            return
+        self._last_reload_check = now
+
+        try:
+            mtime = os.path.getmtime(self.weights_path)
+        except OSError:
+            return
+        if not force and mtime <= self._loaded_mtime:
+            return
+
+        try:
+            with open(self.weights_path, "r", encoding="utf-8") as weights_file:
+                data = json.load(weights_file)
+            self.labels = data["labels"]
+            self.bias = data["bias"]
+            self.weights = {int(feature): row for feature, row in data["weights"].items()}
+            self.metadata = data.get("metadata", {})
+            self._loaded_mtime = mtime
+            print(f"🧠 IntentClassifier: pesos carregados ({len(self.weights)} features, classes {self.labels})")
+        except Exception as e:
+            print(f"⚠️ IntentClassifier: Erro ao carregar pesos de {self.weights_path}: {e}")
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Salva pesos esparsos em JSON"""
+        path = path or self.weights_path
+        data = {
+            "labels": self.labels,
+            "bias": [round(value, 5) for value in self.bias],
+            "weights": {
+                str(feature): [round(value, 5) for value in row]
+                for feature, row in self.weights.items()
+                if any(abs(value) >= 1e-4 for value in row)
+            },
+            "metadata": self.metadata
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as weights_file:
+            json.dump(data, weights_file, separators=(",", ":"))
+
+    # ------------------------------------------------------------------
+    # Treino (usado pelo script offline)
+    # ------------------------------------------------------------------
+
+    def train(
+        self,
+        samples: List[Tuple[str, str]],
+        epochs: int = 30,
+        learning_rate: float = 0.5,
+        l2: float = 1e-4,
+        seed: int = 42
+    ) -> None:
+        """Treina regressão logística multinomial por SGD sobre pares (mensagem, intenção)"""
+        self.labels = sorted({intent for _, intent in samples})
+        label_index = {label: index for index, label in enumerate(self.labels)}
+        self.bias = [0.0] * len(self.labels)
+        self.weights = {}
+
+        featurized = [(extract_features(text), label_index[intent]) for text, intent in samples]
+        rng = random.Random(seed)
+
+        for epoch in range(epochs):
+            rng.shuffle(featurized)
+            rate = learning_rate / (1 + epoch * 0.1)
+            for features, target in featurized:
+                scores = list(self.bias)
+                for feature in features:
+                    row = self.weights.get(feature)
+                    if row:
+                        for index, weight in enumerate(row):
+                            scores[index] += weight
+                probabilities = _softmax(scores)
+
+                for index, probability in enumerate(probabilities):
+                    gradient = probability - (1.0 if index == target else 0.0)
+                    self.bias[index] -= rate * gradient
+                    for feature in features:
+                        row = self.weights.setdefault(feature, [0.0] * len(self.labels))
+                        row[index] -= rate * (gradient + l2 * row[index])
+
+        self.metadata = {
+            "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "samples": len(samples),
+            "epochs": epochs,
+            "hash_buckets": HASH_BUCKETS
+        }
+
+    # ------------------------------------------------------------------
+    # Coleta de exemplos rotulados
+    # ------------------------------------------------------------------
+
+    def log_sample(self, message: str, intent: str, confidence: float, source: str) -> None:
+        """Registra par (mensagem, intenção) para re-treino offline"""
+        try:
+            os.makedirs(os.path.dirname(self.samples_path) or ".", exist_ok=True)
+            with open(self.samples_path, "a", encoding="utf-8") as samples_file:
+                samples_file.write(json.dumps({
+                    "message": message,
+                    "intent": intent,
+                    "confidence": confidence,
+                    "source": source,
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+                }, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"⚠️ IntentClassifier: Erro ao registrar exemplo: {e}")
+
+
+# Instância global do classificador
+intent_classifier = LocalIntentClassifier()
@@ -0,0 +1,119 @@
+"""
+Matcher de palavras-chave multi-padrão (Aho-Corasick) compartilhado
+Normaliza acentos e retorna todas as categorias encontradas em uma única passada pelo texto
+"""
+
+import json
+import os
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, List, Optional, Iterable
+
+DEFAULT_PATTERNS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "keyword_patterns.json")
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+class KeywordMatcher:
+    """Autômato Aho-Corasick sobre padrões normalizados, agrupados por categoria"""
+
+    def __init__(self, table: Dict[str, List[str]]):
+        # A ordem das categorias na tabela define a prioridade em first_match
+        self.categories = list(table)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[tuple]] = [[]]
+
+        for category_index, patterns in enumerate(table.values()):
+            for pattern in patterns:
+                normalized = normalize_text(pattern)
+                if normalized:
+                    self._add_pattern(normalized, category_index)
+
+        self._build_failure_links()
+
+    def _add_pattern(self, pattern: str, category_index: int) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((category_index, pattern))
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                candidate = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                # Herda as saídas do estado de falha (padrões que são sufixos)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def match(self, text: str) -> Dict[str, List[str]]:
+        """
+        Retorna {categoria: [padrões encontrados]} para todas as categorias presentes no texto
+
+        As categorias vêm na ordem da tabela; padrões sobrepostos são todos reportados.
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        found: Dict[int, List[str]] = {}
+        state = 0
+        for char in normalize_text(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for category_index, pattern in output[state]:
+                found.setdefault(category_index, []).append(pattern)
+
+        return {self.categories[index]: found[index] for index in sorted(found)}
+
+    def first_match(self, text: str, categories: Optional[Iterable[str]] = None) -> Optional[str]:
+        """Primeira categoria encontrada segundo a ordem da tabela (opcionalmente restrita)"""
+        matches = self.match(text)
+        allowed = set(categories) if categories is not None else None
+        for category in matches:
+            if allowed is None or category in allowed:
+                return category
+        return None
+
+
+_tables: Optional[Dict[str, Dict[str, List[str]]]] = None
+_matchers: Dict[str, KeywordMatcher] = {}
+
+
+def load_keyword_tables(path: Optional[str] = None) -> Dict[str, Dict[str, List[str]]]:
+    """Carrega tabelas de padrões do arquivo de dados (KEYWORD_PATTERNS_PATH sobrescreve)"""
+    path = path or os.getenv("KEYWORD_PATTERNS_PATH", DEFAULT_PATTERNS_PATH)
+    with open(path, "r", encoding="utf-8") as patterns_file:
+        return json.load(patterns_file)
+
+
+def get_keyword_matcher(table_name: str) -> KeywordMatcher:
+    """Matcher pré-compilado para uma tabela (construído uma vez e reutilizado)"""
+    global _tables
+    matcher = _matchers.get(table_name)
+    if matcher is None:
+        if _tables is None:
+            _tables = load_keyword_tables()
+        matcher = KeywordMatcher(_tables[table_name])
+        _matchers[table_name] = matcher
+    return matcher
@@ -0,0 +1,291 @@
+"""
+Extração e reparo de JSON em respostas de LLM
+Localiza o primeiro objeto JSON balanceado, repara defeitos comuns, valida contra schema e
+registra a taxa de falha de parse por ponto de chamada
+"""
+
+import json
+import re
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+_decoder = json.JSONDecoder()
+
+# Literais Python que LLMs às vezes emitem no lugar dos literais JSON
+_LITERAL_FIXES = {"True": "true", "False": "false", "None": "null"}
+
+# Caracteres que interrompem a cópia em bloco dentro e fora de strings
+_STRING_SPECIAL = re.compile(r'["\\\n]')
+_STRUCTURAL = re.compile(r'["{}\[\]`A-Za-z]')
+_WORD = re.compile(r'[A-Za-z]+')
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+class JSONExtractionError(json.JSONDecodeError):
+    """Resposta sem JSON aproveitável (ou fora do schema esperado)"""
+
+    def __init__(self, msg: str, doc: str = "", pos: int = 0, schema_errors: Optional[List[str]] = None):
+        super().__init__(msg, doc or "", pos)
+        self.schema_errors = schema_errors or []
+
+
+def _strip_trailing_comma(out: List[str]) -> bool:
+    """Remove vírgula pendente no fim do buffer de trechos (ignorando espaços)"""
+    while out and not out[-1].strip():
+        out.pop()
+    if out:
+        last = out[-1].rstrip()
+        if last.endswith(","):
+            out[-1] = last[:-1]
+            return True
+    return False
+
+
+def repair_json(text: str, start: int = 0) -> Tuple[Optional[str], List[str]]:
+    """
+    Varre o texto a partir de `start` em uma única passada e devolve o primeiro objeto JSON,
+    reparado, com a lista de reparos aplicados
+
+    Respeita strings e escapes. Reparos: vírgulas finais, quebras de linha cruas em strings,
+    True/False/None, fechamento trocado, e objeto truncado (fecha string, remove vírgula/chave
+    pendente e fecha colchetes/chaves abertos).
+    """
+    start = text.find("{", start)
+    if start == -1:
+        return None, []
+
+    out: List[str] = []
+    stack: List[str] = []
+    repairs: List[str] = []
+    in_string = False
+    length = len(text)
+    index = start
+
+    while index < length:
+        # Copia em bloco até o próximo caractere relevante
+        match = (_STRING_SPECIAL if in_string else _STRUCTURAL).search(text, index)
+        if match is None:
+            out.append(text[index:])
+            break
+        position = match.start()
+        if position > index:
+            out.append(text[index:position])
+        char = text[position]
+        index = position + 1
+
+        if in_string:
+            if char == "\\":
+                if index >= length:
+                    # Barra final de resposta truncada: descartada
+                    break
+                out.append(text[position:index + 1])
+                index += 1
+            elif char == '"':
+                in_string = False
+                out.append(char)
+            else:
+                out.append("\\n")
+                repairs.append("raw_newline")
+            continue
+
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char == "{":
+            stack.append("}")
+            out.append(char)
+        elif char == "[":
+            stack.append("]")
+            out.append(char)
+        elif char in "}]":
+            if _strip_trailing_comma(out):
+                repairs.append("trailing_comma")
+            expected = stack.pop()
+            if char != expected:
+                repairs.append("mismatched_bracket")
+            out.append(expected)
+            if not stack:
+                return "".join(out), repairs
+        elif char == "`":
+            # Fim de bloco markdown antes de fechar o objeto: resposta truncada
+            break
+        else:
+            word_match = _WORD.match(text, position)
+            word = word_match.group()
+            index = word_match.end()
+            if word in _LITERAL_FIXES:
+                out.append(_LITERAL_FIXES[word])
+                repairs.append("python_literal")
+            else:
+                out.append(word)
+
+    # Objeto truncado: fecha o que ficou aberto
+    if in_string:
+        out.append('"')
+        repairs.append("unclosed_string")
+    if _strip_trailing_comma(out):
+        repairs.append("trailing_comma")
+    tail = "".join(out).rstrip()
+    if tail.endswith(":"):
+        tail += " null"
+        repairs.append("dangling_key")
+    elif stack and stack[-1] == "}" and tail.endswith('"'):
+        # String solta em objeto: só é valor se vier depois de ":"
+        key_start = tail.rfind('"', 0, len(tail) - 1)
+        before = tail[:key_start].rstrip()
+        if before.endswith(",") or before.endswith("{"):
+            tail = before[:-1] if before.endswith(",") else before
+            repairs.append("dangling_key")
+    repairs.append("unclosed_brackets")
+    return tail + "".join(reversed(stack)), repairs
+
+
+def validate_schema(value: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """
+    Valida valor contra um subconjunto de JSON Schema
+    (type, required, properties, additionalProperties, items, enum, minimum, maximum)
+    """
+    errors: List[str] = []
+
+    expected_types = schema.get("type")
+    if expected_types:
+        if isinstance(expected_types, str):
+            expected_types = [expected_types]
+        if not any(_matches_type(value, expected) for expected in expected_types):
+            return [f"{path}: esperado {'/'.join(expected_types)}, recebido {type(value).__name__}"]
+
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: valor {value!r} fora de {schema['enum']}")
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path}: {value} < {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path}: {value} > {schema['maximum']}")
+
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}.{key}: campo obrigatório ausente")
+        for key, item in value.items():
+            if key in properties:
+                errors.extend(validate_schema(item, properties[key], f"{path}.{key}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}.{key}: campo não permitido")
+
+    if isinstance(value, list) and "items" in schema:
+        for position, item in enumerate(value):
+            errors.extend(validate_schema(item, schema["items"], f"{path}[{position}]"))
+
+    return errors
+
+
+def _matches_type(value: Any, expected: str) -> bool:
+    if expected == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if expected == "integer":
+        return (isinstance(value, int) and not isinstance(value, bool)) or (isinstance(value, float) and value.is_integer())
+    python_type = _JSON_TYPES.get(expected)
+    return python_type is None or isinstance(value, python_type)
+
+
+class LLMJSONParser:
+    """Parser compartilhado de respostas JSON do LLM, com estatísticas por ponto de chamada"""
+
+    def __init__(self):
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def parse(self, text: str, call_site: str = "unknown", schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Extrai, repara e valida o primeiro objeto JSON da resposta
+
+        Args:
+            text: Resposta bruta do LLM (pode ter markdown e texto em volta)
+            call_site: Rótulo do ponto de chamada (mesmo usado em LLMUsageTracker)
+            schema: JSON Schema opcional para validação
+
+        Returns:
+            Objeto decodificado
+
+        Raises:
+            JSONExtractionError: sem JSON aproveitável ou fora do schema
+        """
+        started = time.perf_counter()
+        stats = self.stats.setdefault(call_site, {
+            "calls": 0, "direct": 0, "repaired": 0, "failed": 0, "schema_invalid": 0,
+            "repairs": Counter(), "parse_ms_total": 0.0
+        })
+        stats["calls"] += 1
+
+        try:
+            value, repairs = self._decode(text or "")
+            if schema:
+                errors = validate_schema(value, schema)
+                if errors:
+                    stats["schema_invalid"] += 1
+                    print(f"⚠️ LLMJSON: {call_site} fora do schema: {errors[:3]}")
+                    raise JSONExtractionError("JSON fora do schema", text, 0, schema_errors=errors)
+
+            if repairs:
+                stats["repaired"] += 1
+                stats["repairs"].update(repairs)
+                print(f"🔧 LLMJSON: {call_site} reparado ({', '.join(sorted(set(repairs)))})")
+            else:
+                stats["direct"] += 1
+            return value
+
+        except JSONExtractionError as e:
+            if not e.schema_errors:
+                stats["failed"] += 1
+                print(f"❌ LLMJSON: {call_site} sem JSON válido: {e.msg} | resposta: {(text or '')[:200]}")
+            raise
+        finally:
+            stats["parse_ms_total"] += (time.perf_counter() - started) * 1000
+
+    def _decode(self, text: str) -> Tuple[Any, List[str]]:
+        start = text.find("{")
+        if start == -1:
+            raise JSONExtractionError("Resposta não contém JSON" if text.strip() else "Resposta vazia", text, 0)
+
+        # Caminho rápido: objeto já válido (decoder em C, ignora o que vier depois)
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+            return value, []
+        except json.JSONDecodeError:
+            pass
+
+        candidate, repairs = repair_json(text, start)
+        try:
+            return json.loads(candidate), repairs
+        except (json.JSONDecodeError, TypeError) as e:
+            raise JSONExtractionError(f"JSON irreparável: {e}", text, start)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Taxas de sucesso direto, reparo e falha por ponto de chamada"""
+        summary = {}
+        for call_site, stats in self.stats.items():
+            calls = stats["calls"] or 1
+            summary[call_site] = {
+                "calls": stats["calls"],
+                "direct": stats["direct"],
+                "repaired": stats["repaired"],
+                "failed": stats["failed"],
+                "schema_invalid": stats["schema_invalid"],
+                "failure_rate": round((stats["failed"] + stats["schema_invalid"]) / calls, 3),
+                "repairs": dict(stats["repairs"]),
+                "avg_parse_ms": round(stats["parse_ms_total"] / calls, 3)
+            }
+        return summary
+
+
+# Instância global do parser
+llm_json_parser = LLMJSONParser()
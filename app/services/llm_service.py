@@ -4,11 +4,16 @@ Suporte a múltiplos provedores com fallback automático
 """
 
 import os
+import json
+import time
 import asyncio
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
 from dotenv import load_dotenv
 import litellm
 from litellm import completion, acompletion
+from app.services.llm_usage import llm_usage_tracker
+from app.services.keyword_matcher import get_keyword_matcher
+from app.services.llm_json import llm_json_parser, JSONExtractionError
 
 
 class LLMService:
@@ -48,15 +53,107 @@ class LLMService:
         # Configurações do LiteLLM
         self.max_retries = 2
         self.base_delay = 1
-        self.timeout = 10
+        self.timeout = int(os.getenv("LLM_DEFAULT_TIMEOUT", "10"))
+        
+        # Camadas de modelo: cada tier tem sua própria cadeia de fallback e timeout
+        self.tiers = {
+            "default": {
+                "providers": self.providers,
+                "timeout": self.timeout
+            },
+            "fast": {
+                "providers": self._build_provider_chain(
+                    anthropic_key,
+                    openai_key,
+                    anthropic_model=os.getenv("LLM_FAST_ANTHROPIC_MODEL", "claude-3-5-haiku-20241022"),
+                    openai_models=[os.getenv("LLM_FAST_OPENAI_MODEL", "gpt-4o-mini")]
+                ),
+                "timeout": int(os.getenv("LLM_FAST_TIMEOUT", "5"))
+            },
+            "fast_vision": {
+                "providers": self._build_provider_chain(
+                    anthropic_key,
+                    openai_key,
+                    anthropic_model=os.getenv("LLM_FAST_VISION_ANTHROPIC_MODEL", "claude-3-haiku-20240307"),
+                    openai_models=[os.getenv("LLM_FAST_VISION_OPENAI_MODEL", "gpt-4o-mini")]
+                ),
+                "timeout": int(os.getenv("LLM_FAST_VISION_TIMEOUT", "8"))
+            }
+        }
+        
+        # Tarefa → tier (sobrescrevível via LLM_TASK_TIERS="classification=fast,extraction=default")
+        self.task_tiers = {
+            "classification": "fast",
+            "extraction": "fast",
+            "summarization": "fast",
+            "image_classification": "fast_vision",
+            "consultation": "default",
+            "image_analysis": "default"
+        }
+        for item in os.getenv("LLM_TASK_TIERS", "").split(","):
+            if "=" in item:
+                task, tier_name = item.split("=", 1)
+                self.task_tiers[task.strip()] = tier_name.strip()
+        
+        # Estatísticas acumuladas de prompt caching (tokens de entrada)
+        self.prompt_cache_stats = {
+            "calls": 0,
+            "input_tokens": 0,
+            "cached_input_tokens": 0,
+            "cache_write_tokens": 0,
+            "uncached_input_tokens": 0
+        }
+        
+        # Saída estruturada nativa (tool calling / json_schema) em call_structured
+        self.structured_output_enabled = os.getenv("LLM_STRUCTURED_OUTPUT", "true").lower() != "false"
+        self.structured_stats = {
+            "calls": 0,
+            "schema_retries": 0,
+            "schema_retry_successes": 0,
+            "failures": 0
+        }
         
         # Configura LiteLLM
         self._setup_litellm()
     
+    def _build_provider_chain(
+        self,
+        anthropic_key: Optional[str],
+        openai_key: Optional[str],
+        anthropic_model: str,
+        openai_models: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Monta cadeia de fallback Anthropic → OpenAI para um tier"""
+        chain = {
+            f"anthropic_{anthropic_model}": {
+                "api_key": anthropic_key,
+                "model": anthropic_model,
+                "priority": 1
+            }
+        }
+        
+        if openai_key and openai_key != "your_openai_api_key_here":
+            for index, model in enumerate(openai_models, start=2):
+                chain[f"openai_{model}"] = {
+                    "api_key": openai_key,
+                    "model": model,
+                    "priority": index
+                }
+        
+        return chain
+    
+    def _resolve_tier(self, tier: Optional[str]) -> Dict[str, Any]:
+        """Resolve nome de tier ou rótulo de tarefa para a configuração do tier"""
+        tier_name = self.task_tiers.get(tier, tier) if tier else "default"
+        if tier_name not in self.tiers:
+            print(f"⚠️ LLMService: Tier '{tier}' desconhecido, usando default")
+            tier_name = "default"
+        return {"name": tier_name, **self.tiers[tier_name]}
+    
     def _setup_litellm(self):
         """Configura LiteLLM com os provedores disponíveis"""
-        # Configura timeout global
-        litellm.request_timeout = self.timeout
+        # Configura timeout global (o maior entre os tiers; cada chamada aplica o seu)
+        litellm.request_timeout = max(tier["timeout"] for tier in self.tiers.values())
         
         # Configura retry automático
         litellm.num_retries = self.max_retries
@@ -73,7 +170,11 @@ class LLMService:
         max_tokens: int = 2000,
         temperature: float = 0.4,
         fallback_response: Optional[str] = None,
-        conversation_context: Optional[str] = None
+        conversation_context: Optional[str] = None,
+        system_prompt: Optional[Union[str, List[Dict[str, Any]]]] = None,
+        call_site: str = "unknown",
+        user_id: Optional[str] = None,
+        tier: Optional[str] = None
     ) -> str:
         """
         Chama LLM com fallback automático entre provedores
@@ -84,13 +185,21 @@ class LLMService:
             temperature: Temperatura para geração
             fallback_response: Resposta de fallback se todos os provedores falharem
             conversation_context: Contexto da conversa para manter continuidade
+            system_prompt: Instruções estáticas enviadas como prompt de sistema.
+                Uma string vira um bloco marcado como cacheável; uma lista de
+                blocos é enviada como está (use build_system_message para montar)
+            call_site: Rótulo do ponto de chamada para contabilidade de tokens/custo
+            user_id: Usuário associado (padrão: usuário da requisição atual)
+            tier: Tier ("default", "fast", "fast_vision") ou rótulo de tarefa
+                ("classification", "extraction", ...) que define modelos e timeout
             
         Returns:
             Resposta da API ou fallback_response se houver erro
         """
-        # Ordena provedores por prioridade
+        # Resolve tier e ordena seus provedores por prioridade
+        tier_config = self._resolve_tier(tier)
         sorted_providers = sorted(
-            self.providers.items(),
+            tier_config["providers"].items(),
             key=lambda x: x[1]["priority"]
         )
         
@@ -104,22 +213,27 @@ class LLMService:
             }
             enhanced_messages = [context_message] + enhanced_messages
         
+        # Prefixo estático vem sempre primeiro para que o cache do provedor seja reaproveitado
+        if system_prompt:
+            enhanced_messages = [self.build_system_message(system_prompt)] + enhanced_messages
+        
         for provider_name, provider_config in sorted_providers:
             if not provider_config["api_key"]:
                 print(f"⚠️ {provider_name} não configurado, pulando...")
                 continue
             
             try:
-                print(f"🚀 Tentando {provider_name} ({provider_config['model']})...")
+                print(f"🚀 Tentando {provider_name} ({provider_config['model']}) [tier {tier_config['name']}]...")
                 
                 # Log das mensagens para debug
                 print(f"🔍 LLMService: Mensagens sendo enviadas:")
                 for i, msg in enumerate(enhanced_messages):
-                    if msg.get("role") == "user" and isinstance(msg.get("content"), list):
+                    if isinstance(msg.get("content"), list):
                         print(f"   Mensagem {i}: {msg['role']} - {len(msg['content'])} itens")
                         for j, item in enumerate(msg["content"]):
                             if item.get("type") == "text":
-                                print(f"     Item {j}: texto ({len(item['text'])} chars)")
+                                cache_flag = " [cache]" if item.get("cache_control") else ""
+                                print(f"     Item {j}: texto ({len(item['text'])} chars){cache_flag}")
                             elif item.get("type") == "image_url":
                                 print(f"     Item {j}: imagem (base64)")
                     else:
@@ -137,19 +251,30 @@ class LLMService:
                     os.environ["OPENAI_API_KEY"] = provider_config["api_key"]
                 
                 # Chama LLM com timeout
+                call_start = time.time()
                 response = await asyncio.wait_for(
                     acompletion(
                         model=model_name,
-                        messages=enhanced_messages,
+                        messages=self._prepare_messages_for_provider(enhanced_messages, provider_name),
                         max_tokens=max_tokens,
                         temperature=temperature
                     ),
-                    timeout=self.timeout
+                    timeout=tier_config["timeout"]
                 )
                 
                 # Extrai resposta
                 content = response.choices[0].message.content
                 print(f"✅ {provider_name} respondeu com sucesso!")
+                
+                # Registra uso de tokens, cache e custo
+                self._record_usage(
+                    provider_name,
+                    model_name,
+                    response,
+                    latency_ms=(time.time() - call_start) * 1000,
+                    call_site=call_site,
+                    user_id=user_id
+                )
                 return content
                 
             except asyncio.TimeoutError:
@@ -189,6 +314,279 @@ class LLMService:
         # Fallback padrão
         return self._get_default_fallback()
     
+    async def call_structured(
+        self,
+        messages: List[Dict[str, Any]],
+        schema: Dict[str, Any],
+        schema_name: str = "resposta",
+        max_tokens: int = 1000,
+        temperature: float = 0.1,
+        system_prompt: Optional[Union[str, List[Dict[str, Any]]]] = None,
+        call_site: str = "unknown",
+        user_id: Optional[str] = None,
+        tier: Optional[str] = None,
+        max_schema_retries: int = 1
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Chama LLM exigindo saída estruturada e retorna o objeto já validado
+        
+        Usa o mecanismo nativo de cada provedor via LiteLLM: tool calling forçado
+        na Anthropic e response_format json_schema na OpenAI. Com
+        LLM_STRUCTURED_OUTPUT=false o schema vai apenas no prompt de sistema.
+        
+        Args:
+            messages: Lista de mensagens para enviar
+            schema: JSON Schema do objeto esperado (raiz "object")
+            schema_name: Nome da ferramenta/schema enviado ao provedor
+            max_tokens: Número máximo de tokens
+            temperature: Temperatura para geração
+            system_prompt: Instruções estáticas (ver call_with_fallback)
+            call_site: Rótulo do ponto de chamada para contabilidade e estatísticas de parse
+            user_id: Usuário associado (padrão: usuário da requisição atual)
+            tier: Tier ou rótulo de tarefa (ver call_with_fallback)
+            max_schema_retries: Novas tentativas no mesmo provedor quando a saída viola o schema
+            
+        Returns:
+            Objeto validado ou None se todos os provedores falharem
+        """
+        tier_config = self._resolve_tier(tier)
+        sorted_providers = sorted(
+            tier_config["providers"].items(),
+            key=lambda x: x[1]["priority"]
+        )
+        
+        if not self.structured_output_enabled:
+            schema_text = json.dumps(schema, ensure_ascii=False)
+            system_prompt = [
+                *(self.build_system_message(system_prompt, cache=False)["content"] if system_prompt else []),
+                {"type": "text", "text": f"Responda APENAS com um objeto JSON que siga este JSON Schema:\n{schema_text}"}
+            ]
+        
+        base_messages = list(messages)
+        if system_prompt:
+            base_messages = [self.build_system_message(system_prompt)] + base_messages
+        
+        self.structured_stats["calls"] += 1
+        for provider_name, provider_config in sorted_providers:
+            if not provider_config["api_key"]:
+                continue
+            
+            model_name = provider_config["model"]
+            if provider_name.startswith("anthropic"):
+                os.environ["ANTHROPIC_API_KEY"] = provider_config["api_key"]
+            elif provider_name.startswith("openai_"):
+                os.environ["OPENAI_API_KEY"] = provider_config["api_key"]
+            
+            request_messages = base_messages
+            for attempt in range(max_schema_retries + 1):
+                try:
+                    print(f"🚀 Tentando {provider_name} ({model_name}) [tier {tier_config['name']}, saída estruturada]...")
+                    call_start = time.time()
+                    response = await asyncio.wait_for(
+                        acompletion(
+                            model=model_name,
+                            messages=self._prepare_messages_for_provider(request_messages, provider_name),
+                            max_tokens=max_tokens,
+                            temperature=temperature,
+                            **self._structured_output_params(provider_name, schema, schema_name)
+                        ),
+                        timeout=tier_config["timeout"]
+                    )
+                    self._record_usage(
+                        provider_name,
+                        model_name,
+                        response,
+                        latency_ms=(time.time() - call_start) * 1000,
+                        call_site=call_site,
+                        user_id=user_id
+                    )
+                except asyncio.TimeoutError:
+                    print(f"⏰ Timeout em {provider_name}")
+                    break
+                except Exception as e:
+                    print(f"❌ Erro em {provider_name}: {str(e)[:200]}...")
+                    break
+                
+                raw_output = self._structured_output_text(response)
+                try:
+                    result = llm_json_parser.parse(raw_output, call_site=call_site, schema=schema)
+                    if attempt:
+                        self.structured_stats["schema_retry_successes"] += 1
+                    print(f"✅ {provider_name} respondeu com saída estruturada válida")
+                    return result
+                except JSONExtractionError as e:
+                    if attempt >= max_schema_retries:
+                        break
+                    # Só violação de schema gera nova tentativa, com os erros como correção
+                    self.structured_stats["schema_retries"] += 1
+                    problems = "; ".join(e.schema_errors[:5]) or e.msg
+                    request_messages = request_messages + [
+                        {"role": "assistant", "content": raw_output or "{}"},
+                        {"role": "user", "content": f"A resposta não segue o schema ({problems}). Responda novamente seguindo exatamente o schema."}
+                    ]
+        
+        self.structured_stats["failures"] += 1
+        print(f"❌ LLMService: Nenhum provedor retornou saída estruturada válida ({call_site})")
+        return None
+    
+    def _structured_output_params(self, provider_name: str, schema: Dict[str, Any], schema_name: str) -> Dict[str, Any]:
+        """Parâmetros de saída estruturada do provedor (formato OpenAI, traduzido pelo LiteLLM)"""
+        if not self.structured_output_enabled:
+            return {}
+        if provider_name.startswith("anthropic"):
+            return {
+                "tools": [{
+                    "type": "function",
+                    "function": {
+                        "name": schema_name,
+                        "description": "Registra a resposta estruturada",
+                        "parameters": schema
+                    }
+                }],
+                "tool_choice": {"type": "function", "function": {"name": schema_name}}
+            }
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": schema_name, "schema": schema}
+            }
+        }
+    
+    @staticmethod
+    def _structured_output_text(response: Any) -> str:
+        """Argumentos da tool call forçada ou conteúdo JSON da mensagem"""
+        message = response.choices[0].message
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            return tool_calls[0].function.arguments or ""
+        return message.content or ""
+    
+    def get_structured_output_stats(self) -> Dict[str, Any]:
+        """Chamadas estruturadas, retries por violação de schema e falhas"""
+        return {"enabled": self.structured_output_enabled, **self.structured_stats}
+    
+    @staticmethod
+    def build_system_message(
+        system_prompt: Union[str, List[Dict[str, Any]]],
+        cache: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Monta mensagem de sistema estruturada com o prefixo estático marcado como cacheável
+        
+        Args:
+            system_prompt: Texto estático ou lista de blocos de conteúdo já montados
+            cache: Se True, marca o último bloco com cache_control (prompt caching)
+            
+        Returns:
+            Mensagem no formato aceito pelo LiteLLM
+        """
+        if isinstance(system_prompt, str):
+            blocks = [{"type": "text", "text": system_prompt.strip()}]
+        else:
+            blocks = [dict(block) for block in system_prompt]
+        
+        if cache and blocks:
+            # O provedor cacheia todo o prefixo até o bloco marcado
+            blocks[-1]["cache_control"] = {"type": "ephemeral"}
+        
+        return {"role": "system", "content": blocks}
+    
+    def _prepare_messages_for_provider(self, messages: List[Dict[str, Any]], provider_name: str) -> List[Dict[str, Any]]:
+        """Adapta mensagens ao provedor (cache_control só é entendido pela Anthropic)"""
+        if provider_name.startswith("anthropic"):
+            return messages
+        
+        prepared = []
+        for msg in messages:
+            content = msg.get("content")
+            if isinstance(content, list):
+                blocks = [{k: v for k, v in item.items() if k != "cache_control"} for item in content]
+                # Mensagens de sistema só com texto viram string simples
+                if msg.get("role") == "system" and all(block.get("type") == "text" for block in blocks):
+                    prepared.append({**msg, "content": "\n\n".join(block["text"] for block in blocks)})
+                else:
+                    prepared.append({**msg, "content": blocks})
+            else:
+                prepared.append(msg)
+        return prepared
+    
+    def _extract_usage(self, response: Any) -> Dict[str, int]:
+        """Extrai tokens de entrada/saída (incluindo cache) do response do LiteLLM"""
+        usage = getattr(response, "usage", None)
+        if not usage:
+            return {}
+        
+        def _get(obj: Any, key: str) -> int:
+            if obj is None:
+                return 0
+            value = obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+            return int(value or 0)
+        
+        prompt_tokens = _get(usage, "prompt_tokens")
+        cache_read = _get(usage, "cache_read_input_tokens")
+        cache_write = _get(usage, "cache_creation_input_tokens")
+        
+        # OpenAI e versões recentes do LiteLLM reportam em prompt_tokens_details
+        if not cache_read:
+            details = usage.get("prompt_tokens_details") if isinstance(usage, dict) else getattr(usage, "prompt_tokens_details", None)
+            cache_read = _get(details, "cached_tokens")
+        
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": _get(usage, "completion_tokens"),
+            "cached_input_tokens": cache_read,
+            "cache_write_tokens": cache_write,
+            "uncached_input_tokens": max(prompt_tokens - cache_read, 0)
+        }
+    
+    def _record_usage(
+        self,
+        provider_name: str,
+        model_name: str,
+        response: Any,
+        latency_ms: float,
+        call_site: str,
+        user_id: Optional[str] = None
+    ) -> None:
+        """Acumula tokens de entrada cacheados vs. não cacheados e registra uso/custo da chamada"""
+        try:
+            usage = self._extract_usage(response)
+            if not usage:
+                return
+            
+            llm_usage_tracker.record(
+                call_site=call_site,
+                provider=provider_name,
+                model=model_name,
+                usage=usage,
+                latency_ms=latency_ms,
+                response=response,
+                user_id=user_id
+            )
+            
+            stats = self.prompt_cache_stats
+            stats["calls"] += 1
+            stats["input_tokens"] += usage["prompt_tokens"]
+            stats["cached_input_tokens"] += usage["cached_input_tokens"]
+            stats["cache_write_tokens"] += usage["cache_write_tokens"]
+            stats["uncached_input_tokens"] += usage["uncached_input_tokens"]
+            
+            print(
+                f"💾 LLMService: {provider_name} tokens de entrada - "
+                f"cacheados: {usage['cached_input_tokens']}, "
+                f"gravados no cache: {usage['cache_write_tokens']}, "
+                f"não cacheados: {usage['uncached_input_tokens']}"
+            )
+        except Exception as e:
+            print(f"⚠️ LLMService: Erro ao registrar uso: {e}")
+    
+    def get_prompt_cache_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas acumuladas de prompt caching"""
+        stats = dict(self.prompt_cache_stats)
+        total = stats["input_tokens"]
+        stats["cache_hit_ratio"] = round(stats["cached_input_tokens"] / total, 3) if total else 0.0
+        return stats
+    
     def _is_retryable_error(self, error_str: str) -> bool:
         """Verifica se o erro é retriável"""
         retryable_patterns = [
@@ -229,11 +627,11 @@ Desculpe, todos os serviços de IA estão com alta demanda no momento.
     
     def get_contextual_fallback(self, content: str, user_name: str, profile: Dict[str, Any]) -> str:
         """Retorna fallback contextual baseado no conteúdo da mensagem"""
-        content_lower = content.lower()
+        topic = get_keyword_matcher("contextual_fallback").first_match(content)
         
-        if any(word in content_lower for word in ["treino", "exercício", "musculação", "academia"]):
+        if topic == "training":
             return self._get_training_fallback_sync(user_name, profile)
-        elif any(word in content_lower for word in ["comida", "alimentação", "dieta", "nutrição"]):
+        elif topic == "nutrition":
             return self._get_nutrition_fallback_sync(user_name, profile)
         else:
             return self._get_general_fallback_sync(user_name, profile)
@@ -334,6 +732,23 @@ Baseado no seu perfil:
                 "priority": provider_config["priority"]
             }
         return info
+    
+    def get_tier_info(self) -> Dict[str, Any]:
+        """Retorna cadeia de modelos e timeout de cada tier, e o mapeamento de tarefas"""
+        return {
+            "tiers": {
+                tier_name: {
+                    "timeout": tier_config["timeout"],
+                    "models": [
+                        provider_config["model"]
+                        for _, provider_config in sorted(tier_config["providers"].items(), key=lambda x: x[1]["priority"])
+                        if provider_config["api_key"]
+                    ]
+                }
+                for tier_name, tier_config in self.tiers.items()
+            },
+            "task_tiers": dict(self.task_tiers)
+        }
 
 
 # Instância global do serviço
@@ -0,0 +1,242 @@
+"""
+Contabilidade de tokens e custo das chamadas LLM
+Agrega uso por ponto de chamada, provedor, modelo e usuário com flush periódico
+"""
+
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, Tuple
+
+# Acumulador da requisição atual (aberto pelo RouterNode e herdado pelas corrotinas)
+_request_usage: ContextVar[Optional[Dict[str, Any]]] = ContextVar("llm_request_usage", default=None)
+
+# Preço aproximado em USD por 1M de tokens (entrada, saída), usado quando o LiteLLM não souber calcular
+MODEL_PRICES_PER_MILLION = {
+    "claude-3-5-sonnet-20241022": (3.00, 15.00),
+    "claude-3-5-haiku-20241022": (0.80, 4.00),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+# Multiplicadores do preço de entrada para tokens lidos/gravados no cache
+CACHE_READ_PRICE_FACTOR = 0.1
+CACHE_WRITE_PRICE_FACTOR = 1.25
+
+
+class LLMUsageTracker:
+    """Registra uso de tokens, latência e custo de cada chamada LLM"""
+
+    def __init__(self):
+        self.flush_interval = int(os.getenv("LLM_USAGE_FLUSH_INTERVAL", "60"))
+        self.last_flush = time.time()
+
+        # Janela atual (zerada a cada flush) e totais desde o início do processo
+        self.window: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self.totals: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self.user_totals: Dict[str, Dict[str, Any]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def begin_request(self, user_id: str):
+        """Abre acumulador de uso para a requisição atual"""
+        return _request_usage.set({
+            "user_id": user_id,
+            "calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_input_tokens": 0,
+            "total_tokens": 0,
+            "cost_usd": 0.0
+        })
+
+    def end_request(self, token) -> Dict[str, Any]:
+        """Fecha o acumulador da requisição e retorna os totais"""
+        usage = _request_usage.get() or {}
+        _request_usage.reset(token)
+        return usage
+
+    def current_user_id(self) -> Optional[str]:
+        """Usuário da requisição atual, se houver"""
+        usage = _request_usage.get()
+        return usage.get("user_id") if usage else None
+
+    def record(
+        self,
+        call_site: str,
+        provider: str,
+        model: str,
+        usage: Dict[str, int],
+        latency_ms: float,
+        response: Any = None,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Registra o uso de uma chamada
+
+        Args:
+            call_site: Rótulo do ponto de chamada (ex.: "text_orchestrator.intent")
+            provider: Nome do provedor usado
+            model: Modelo usado
+            usage: Tokens extraídos do response (ver LLMService._extract_usage)
+            latency_ms: Latência da chamada em ms
+            response: Response do LiteLLM (para cálculo de custo)
+            user_id: Usuário associado (padrão: usuário da requisição atual)
+
+        Returns:
+            Registro da chamada
+        """
+        user_id = user_id or self.current_user_id() or "unknown"
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        cost = self._calculate_cost(model, usage, response)
+
+        record = {
+            "call_site": call_site,
+            "provider": provider,
+            "model": model,
+            "user_id": user_id,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_input_tokens": usage.get("cached_input_tokens", 0),
+            "cache_write_tokens": usage.get("cache_write_tokens", 0),
+            "total_tokens": prompt_tokens + completion_tokens,
+            "latency_ms": round(latency_ms, 1),
+            "cost_usd": cost
+        }
+
+        key = (call_site, provider, model)
+        self._accumulate(self.window.setdefault(key, self._empty_bucket()), record)
+        self._accumulate(self.totals.setdefault(key, self._empty_bucket()), record)
+        self._accumulate(self.user_totals.setdefault(user_id, self._empty_bucket()), record)
+
+        request_usage = _request_usage.get()
+        if request_usage is not None:
+            request_usage["calls"] += 1
+            request_usage["prompt_tokens"] += prompt_tokens
+            request_usage["completion_tokens"] += completion_tokens
+            request_usage["cached_input_tokens"] += record["cached_input_tokens"]
+            request_usage["total_tokens"] += record["total_tokens"]
+            request_usage["cost_usd"] += cost
+
+        print(
+            f"💰 LLMUsage: {call_site} [{provider}/{model}] "
+            f"in={prompt_tokens} (cache={record['cached_input_tokens']}) out={completion_tokens} "
+            f"{record['latency_ms']}ms ${cost:.5f}"
+        )
+
+        self._maybe_schedule_flush()
+        return record
+
+    def _empty_bucket(self) -> Dict[str, Any]:
+        return {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_input_tokens": 0,
+            "cache_write_tokens": 0,
+            "total_tokens": 0,
+            "latency_ms_total": 0.0,
+            "cost_usd": 0.0
+        }
+
+    def _accumulate(self, bucket: Dict[str, Any], record: Dict[str, Any]) -> None:
+        bucket["calls"] += 1
+        for field in ("prompt_tokens", "completion_tokens", "cached_input_tokens", "cache_write_tokens", "total_tokens", "cost_usd"):
+            bucket[field] += record[field]
+        bucket["latency_ms_total"] += record["latency_ms"]
+
+    def _merge_bucket(self, target: Dict[str, Any], bucket: Dict[str, Any]) -> None:
+        for field, value in bucket.items():
+            target[field] += value
+
+    def _calculate_cost(self, model: str, usage: Dict[str, int], response: Any) -> float:
+        """Calcula custo em USD (LiteLLM primeiro, tabela local como fallback)"""
+        if response is not None:
+            try:
+                import litellm
+                cost = litellm.completion_cost(completion_response=response)
+                if cost:
+                    return float(cost)
+            except Exception:
+                pass
+
+        input_price, output_price = MODEL_PRICES_PER_MILLION.get(model, (0.0, 0.0))
+        cached = usage.get("cached_input_tokens", 0)
+        cache_write = usage.get("cache_write_tokens", 0)
+        uncached = max(usage.get("prompt_tokens", 0) - cached - cache_write, 0)
+
+        input_cost = (
+            uncached
+            + cached * CACHE_READ_PRICE_FACTOR
+            + cache_write * CACHE_WRITE_PRICE_FACTOR
+        ) * input_price
+        output_cost = usage.get("completion_tokens", 0) * output_price
+        return (input_cost + output_cost) / 1_000_000
+
+    def _maybe_schedule_flush(self) -> None:
+        """Agenda flush em background quando o intervalo expira"""
+        if time.time() - self.last_flush < self.flush_interval:
+            return
+        if self._flush_task and not self._flush_task.done():
+            return
+        try:
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+        except RuntimeError:
+            # Sem event loop ativo: o próximo registro tenta novamente
+            pass
+
+    async def flush(self) -> int:
+        """Envia agregados da janela atual para a observabilidade e zera a janela"""
+        window, self.window = self.window, {}
+        self.last_flush = time.time()
+        if not window:
+            return 0
+
+        sent = []
+        try:
+            from app.services.supabase_observability import supabase_observability_service
+
+            for key, bucket in window.items():
+                call_site, provider, model = key
+                await supabase_observability_service.log_llm_usage(
+                    call_site=call_site,
+                    provider=provider,
+                    model=model,
+                    usage=self._format_bucket(bucket)
+                )
+                sent.append(key)
+            print(f"📤 LLMUsage: {len(window)} agregados enviados para observabilidade")
+        except Exception as e:
+            # Agregados não enviados voltam para a janela (somados ao que chegou nesse meio tempo)
+            for key, bucket in window.items():
+                if key not in sent:
+                    self._merge_bucket(self.window.setdefault(key, self._empty_bucket()), bucket)
+            print(f"⚠️ LLMUsage: Erro ao enviar agregados ({len(window) - len(sent)} mantidos para o próximo flush): {e}")
+
+        return len(sent)
+
+    def _format_bucket(self, bucket: Dict[str, Any]) -> Dict[str, Any]:
+        formatted = dict(bucket)
+        formatted["cost_usd"] = round(bucket["cost_usd"], 6)
+        formatted["avg_latency_ms"] = round(bucket["latency_ms_total"] / bucket["calls"], 1) if bucket["calls"] else 0.0
+        formatted.pop("latency_ms_total", None)
+        return formatted
+
+    def get_summary(self) -> Dict[str, Any]:
+        """Resumo acumulado por ponto de chamada e por usuário"""
+        return {
+            "by_call_site": {
+                f"{call_site}|{provider}|{model}": self._format_bucket(bucket)
+                for (call_site, provider, model), bucket in self.totals.items()
+            },
+            "by_user": {
+                user_id: self._format_bucket(bucket)
+                for user_id, bucket in self.user_totals.items()
+            }
+        }
+
+
+# Instância global do rastreador de uso
+llm_usage_tracker = LLMUsageTracker()
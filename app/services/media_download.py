@@ -0,0 +1,165 @@
+"""
+Download de mídia por streaming com limite de tamanho
+Aborta cedo (Content-Length, bytes recebidos ou dimensões da imagem lidas do cabeçalho),
+acumula em SpooledTemporaryFile (arquivos grandes vão para disco) e registra vazão e pico
+de memória por download
+"""
+
+import os
+import tempfile
+import time
+from typing import Dict, Any, Optional, Tuple
+
+import httpx
+from PIL import Image, ImageFile
+
+
+class MediaTooLargeError(Exception):
+    """Mídia acima do limite configurado (bytes ou pixels)"""
+
+
+class MediaDownloader:
+    """Baixa arquivos de mídia (Telegram, Twilio) sem carregar respostas ilimitadas em memória"""
+
+    def __init__(self):
+        self.max_bytes = int(os.getenv("MEDIA_MAX_BYTES", str(20 * 1024 * 1024)))
+        # Acima disso o conteúdo recebido vai para arquivo temporário em disco
+        self.spool_threshold = int(os.getenv("MEDIA_SPOOL_THRESHOLD", str(1024 * 1024)))
+        self.max_pixels = int(os.getenv("MEDIA_MAX_PIXELS", str(40_000_000)))
+        self.timeout = float(os.getenv("MEDIA_DOWNLOAD_TIMEOUT", "30"))
+        self.chunk_size = 64 * 1024
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            # Twilio redireciona a URL da mídia para o CDN
+            self._client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=True)
+        return self._client
+
+    async def download(
+        self,
+        url: str,
+        source: str = "unknown",
+        auth: Optional[Tuple[str, str]] = None,
+        expect_image: bool = True
+    ) -> Optional[bytes]:
+        """
+        Baixa a mídia respeitando MEDIA_MAX_BYTES
+
+        Args:
+            url: URL do arquivo
+            source: Rótulo para as estatísticas ("telegram", "twilio")
+            auth: Credenciais HTTP básicas (opcional)
+            expect_image: Lê o cabeçalho da imagem durante o download e aborta se passar de MEDIA_MAX_PIXELS
+
+        Returns:
+            Bytes do arquivo ou None (erro HTTP, limite excedido ou falha de rede)
+        """
+        started = time.perf_counter()
+        stats = self._stats_for(source)
+        stats["downloads"] += 1
+        received = 0
+
+        try:
+            async with self._get_client().stream("GET", url, auth=auth) as response:
+                if response.status_code != 200:
+                    stats["http_errors"] += 1
+                    print(f"❌ MediaDownloader: HTTP {response.status_code} ao baixar mídia ({source})")
+                    return None
+
+                # Recusa antes de receber o corpo quando o servidor informa o tamanho
+                content_length = response.headers.get("Content-Length")
+                if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                    raise MediaTooLargeError(f"Content-Length {content_length} > {self.max_bytes}")
+
+                parser = ImageFile.Parser() if expect_image else None
+                with tempfile.SpooledTemporaryFile(max_size=self.spool_threshold) as spool:
+                    async for chunk in response.aiter_bytes(self.chunk_size):
+                        received += len(chunk)
+                        if received > self.max_bytes:
+                            raise MediaTooLargeError(f"{received} bytes recebidos > {self.max_bytes}")
+                        spool.write(chunk)
+
+                        # Cabeçalho da imagem decodificado incrementalmente: dimensões antes do fim
+                        if parser is not None:
+                            parser = self._check_image_header(parser, chunk)
+
+                    spool.seek(0)
+                    data = spool.read()
+                    # O spool limita a memória só durante o download: o retorno traz o arquivo inteiro
+                    peak_buffer = len(data)
+
+            elapsed = time.perf_counter() - started
+            self._record_success(stats, received, elapsed, peak_buffer)
+            print(
+                f"📥 MediaDownloader: {received} bytes ({source}) em {elapsed * 1000:.0f}ms "
+                f"({received / max(elapsed, 1e-6) / 1024 / 1024:.1f} MB/s)"
+            )
+            return data
+
+        except MediaTooLargeError as e:
+            stats["too_large"] += 1
+            print(f"⚠️ MediaDownloader: Download abortado ({source}): {e}")
+            return None
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"❌ MediaDownloader: Erro ao baixar mídia ({source}): {e}")
+            return None
+
+    def _check_image_header(self, parser: ImageFile.Parser, chunk: bytes) -> Optional[ImageFile.Parser]:
+        """Alimenta o parser até conhecer as dimensões; devolve None quando não precisa mais dele"""
+        try:
+            parser.feed(chunk)
+        except (Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+            # O PIL recusa cabeçalhos muito acima do seu limite antes de devolver as dimensões
+            raise MediaTooLargeError(f"imagem acima do limite de pixels do PIL: {e}")
+        except Exception:
+            # Formato que o parser incremental não entende: a validação fica para depois
+            return None
+        if parser.image is None:
+            return parser
+        width, height = parser.image.size
+        if width * height > self.max_pixels:
+            raise MediaTooLargeError(f"imagem {width}x{height} > {self.max_pixels} pixels")
+        return None
+
+    def _stats_for(self, source: str) -> Dict[str, Any]:
+        return self.stats.setdefault(source, {
+            "downloads": 0, "completed": 0, "too_large": 0, "http_errors": 0, "errors": 0,
+            "bytes_total": 0, "seconds_total": 0.0, "peak_buffer_bytes": 0
+        })
+
+    @staticmethod
+    def _record_success(stats: Dict[str, Any], received: int, elapsed: float, peak_buffer: int) -> None:
+        stats["completed"] += 1
+        stats["bytes_total"] += received
+        stats["seconds_total"] += elapsed
+        stats["peak_buffer_bytes"] = max(stats["peak_buffer_bytes"], peak_buffer)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Downloads, abortos, vazão média e maior buffer em memória por origem"""
+        summary = {}
+        for source, stats in self.stats.items():
+            completed = stats["completed"] or 1
+            summary[source] = {
+                "downloads": stats["downloads"],
+                "completed": stats["completed"],
+                "too_large": stats["too_large"],
+                "http_errors": stats["http_errors"],
+                "errors": stats["errors"],
+                "avg_bytes": round(stats["bytes_total"] / completed),
+                "throughput_mb_s": round(stats["bytes_total"] / 1024 / 1024 / stats["seconds_total"], 2) if stats["seconds_total"] else 0.0,
+                "peak_buffer_bytes": stats["peak_buffer_bytes"]
+            }
+        return {"max_bytes": self.max_bytes, "sources": summary}
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Instância global do downloader
+media_downloader = MediaDownloader()
@@ -0,0 +1,73 @@
+"""
+Agrupamento de álbuns do Telegram (media_group_id)
+O Telegram entrega um update por foto do álbum; o primeiro update do grupo aguarda uma janela
+curta, recolhe os demais e processa todas as imagens juntas (uma análise, uma resposta)
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+
+class MediaGroupCollector:
+    """Coleta itens de um mesmo media_group_id; o primeiro a chegar (líder) recebe o lote"""
+
+    def __init__(self):
+        # Silêncio (s) após o último item antes de fechar o álbum
+        self.window_seconds = float(os.getenv("TELEGRAM_MEDIA_GROUP_WINDOW", "1.2"))
+        # Espera máxima total do líder (downloads lentos não seguram a resposta indefinidamente)
+        self.max_wait_seconds = float(os.getenv("TELEGRAM_MEDIA_GROUP_MAX_WAIT", "5"))
+        self.max_items = int(os.getenv("TELEGRAM_MEDIA_GROUP_MAX_IMAGES", "10"))
+
+        self.groups: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"groups": 0, "items": 0, "late_items": 0}
+
+    async def add(self, group_id: str, item: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Registra um item do álbum
+
+        Args:
+            group_id: media_group_id do Telegram
+            item: Dados do update (precisa de "message_id" para ordenar)
+
+        Returns:
+            Lista ordenada de itens para o líder; None para os demais (já entregues ao líder)
+        """
+        self.stats["items"] += 1
+        group = self.groups.get(group_id)
+        if group is not None:
+            if group["closed"]:
+                # Chegou depois do fechamento: processado sozinho pelo fluxo normal
+                self.stats["late_items"] += 1
+                return [item]
+            group["items"].append(item)
+            group["last_seen"] = time.monotonic()
+            return None
+
+        started = time.monotonic()
+        group = {"items": [item], "last_seen": started, "closed": False}
+        self.groups[group_id] = group
+        self.stats["groups"] += 1
+
+        while len(group["items"]) < self.max_items:
+            now = time.monotonic()
+            remaining = min(group["last_seen"] + self.window_seconds, started + self.max_wait_seconds) - now
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+
+        group["closed"] = True
+        # Mantém o registro fechado por um tempo para reconhecer retardatários
+        asyncio.get_running_loop().call_later(60, self.groups.pop, group_id, None)
+
+        items = sorted(group["items"], key=lambda entry: entry.get("message_id", 0))
+        print(f"🖼️ MediaGroupCollector: Álbum {group_id} com {len(items)} imagens")
+        return items
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "open_groups": sum(1 for group in self.groups.values() if not group["closed"])}
+
+
+# Instância global do coletor
+media_group_collector = MediaGroupCollector()
@@ -15,7 +15,8 @@ class MemoryManager:
             Config.SUPABASE_KEY
         )
     
-    async def save_message(self, phone: str, body: str, direction: str, image_url: Optional[str] = None) -> bool:
+    async def save_message(self, phone: str, body: str, direction: str, image_url: Optional[str] = None,
+                           created_at: Optional[str] = None) -> bool:
         """
         Salva uma mensagem no banco de dados
         
@@ -24,6 +25,7 @@ class MemoryManager:
             body: Conteúdo da mensagem
             direction: 'inbound' ou 'outbound'
             image_url: URL da imagem (opcional)
+            created_at: Timestamp ISO da mensagem (padrão: agora); identifica a linha em update_message_image_url
         
         Returns:
             bool: True se salvou com sucesso
@@ -37,7 +39,7 @@ class MemoryManager:
                 "phone": phone,
                 "body": truncated_body,
                 "direction": direction[:20] if len(direction) > 20 else direction,  # Limita direction para evitar erro de tamanho
-                "created_at": datetime.utcnow().isoformat()
+                "created_at": created_at or datetime.utcnow().isoformat()
             }
             
             # Adiciona image_url se fornecido
@@ -59,6 +61,32 @@ class MemoryManager:
             return False
 
 
+    async def update_message_image_url(self, phone: str, created_at: str, image_url: str) -> bool:
+        """
+        Anexa a URL da imagem a uma mensagem já gravada (upload concluído depois da gravação)
+        
+        Args:
+            phone: Número do telefone
+            created_at: Timestamp usado em save_message
+            image_url: URL da imagem
+        
+        Returns:
+            bool: True se atualizou alguma linha
+        """
+        try:
+            result = self.supabase.table("messages")\
+                .update({"image_url": image_url})\
+                .eq("phone", phone)\
+                .eq("created_at", created_at)\
+                .execute()
+            
+            success = len(result.data) > 0
+            print(f"📸 MemoryManager: URL da imagem anexada à mensagem de {phone}: {success}")
+            return success
+        except Exception as e:
+            print(f"Erro ao anexar URL da imagem: {e}")
+            return False
+
     async def get_user_history(self, phone: str, limit: int = 5) -> List[Dict[str, Any]]:
         """
         Busca o histórico de mensagens do usuário
@@ -290,6 +318,20 @@ class MemoryManager:
             print(f"Erro ao atualizar resumo da sessão: {e}")
             return False
     
+    async def update_session_topic(self, user_id: str, active_topic: str) -> bool:
+        """Atualiza só o assunto e a última interação (o resumo é mantido pelo SessionSummarizer)"""
+        try:
+            data = {
+                "active_topic": active_topic[:100],
+                "last_interaction_at": datetime.now().isoformat()
+            }
+            
+            result = self.supabase.table("sessions").update(data).eq("user_id", user_id).eq("active", True).execute()
+            return len(result.data) > 0
+        except Exception as e:
+            print(f"Erro ao atualizar assunto da sessão: {e}")
+            return False
+    
     async def update_user_profile(self, user_id: str, profile_data: Dict[str, Any]) -> bool:
         """Atualiza perfil do usuário na tabela user_profile"""
         try:
@@ -0,0 +1,166 @@
+"""
+Calculadoras metabólicas determinísticas (TMB, gasto diário, meta calórica e macros)
+Fórmulas fechadas a partir do perfil; o resultado é calculado uma vez por versão do perfil
+e entra pronto no prompt da consulta, em vez de o LLM refazer as contas a cada resposta
+"""
+
+import os
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from app.services.keyword_matcher import normalize_text
+
+# Fator de atividade (TDEE = TMB x fator) por nível de treino
+ACTIVITY_FACTORS = {"iniciante": 1.375, "intermediario": 1.55, "avancado": 1.725}
+DEFAULT_ACTIVITY_FACTOR = 1.375
+
+# Ajuste da meta calórica sobre o TDEE e proteína (g/kg) por objetivo
+GOAL_CALORIE_ADJUSTMENTS = {"emagrecimento": -0.20, "hipertrofia": 0.10, "condicionamento": -0.05, "manutencao": 0.0}
+GOAL_PROTEIN_PER_KG = {"emagrecimento": 2.0, "hipertrofia": 2.0, "condicionamento": 1.6, "manutencao": 1.6}
+DEFAULT_PROTEIN_PER_KG = 1.6
+
+# Gordura: g/kg, respeitando um mínimo de 20% das calorias
+FAT_PER_KG = 0.8
+MIN_FAT_CALORIE_SHARE = 0.20
+
+# Constante sexual da Mifflin-St Jeor; sem sexo informado usa o ponto médio (erro máximo de ~83 kcal)
+MIFFLIN_SEX_CONSTANTS = {"masculino": 5, "feminino": -161}
+MIFFLIN_NEUTRAL_CONSTANT = -78
+
+SEX_SYNONYMS = {
+    "m": "masculino", "masculino": "masculino", "homem": "masculino", "male": "masculino",
+    "f": "feminino", "feminino": "feminino", "mulher": "feminino", "female": "feminino"
+}
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        number = float(str(value).replace(",", ".")) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+    return number if number and number > 0 else None
+
+
+def _choice(value: Any) -> str:
+    return normalize_text(str(value or ""))
+
+
+class MetabolicCalculator:
+    """Calcula metas metabólicas do perfil, com cache pela assinatura dos campos usados"""
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("METABOLIC_CACHE_MAX_ENTRIES", "5000"))
+        self._cache: "OrderedDict[Tuple, Optional[Dict[str, Any]]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "incomplete": 0}
+
+    @staticmethod
+    def profile_signature(profile: Dict[str, Any]) -> Tuple:
+        """Campos que alteram o cálculo (qualquer mudança neles invalida o cache)"""
+        return (
+            _number(profile.get("current_weight_kg")),
+            _number(profile.get("height_cm")),
+            _number(profile.get("age")),
+            _number(profile.get("current_body_fat_percent")),
+            _choice(profile.get("sex") or profile.get("gender")),
+            _choice(profile.get("training_level")),
+            _choice(profile.get("goal"))
+        )
+
+    def targets_for(self, profile: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Metas do perfil (do cache quando o perfil não mudou)
+
+        Returns:
+            Dicionário com bmr, tdee, target_calories, macros e método; None sem peso/altura/idade
+        """
+        signature = self.profile_signature(profile or {})
+        if signature in self._cache:
+            self._cache.move_to_end(signature)
+            self.stats["hits"] += 1
+            return self._cache[signature]
+
+        self.stats["misses"] += 1
+        targets = self._calculate(*signature)
+        if targets is None:
+            self.stats["incomplete"] += 1
+
+        self._cache[signature] = targets
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return targets
+
+    def _calculate(
+        self,
+        weight: Optional[float],
+        height: Optional[float],
+        age: Optional[float],
+        body_fat: Optional[float],
+        sex: str,
+        training_level: str,
+        goal: str
+    ) -> Optional[Dict[str, Any]]:
+        if weight is None:
+            return None
+
+        # Katch-McArdle usa massa magra (gordura da bioimpedância); senão Mifflin-St Jeor
+        if body_fat is not None and 3 <= body_fat <= 60:
+            lean_mass = weight * (1 - body_fat / 100)
+            bmr = 370 + 21.6 * lean_mass
+            method = "katch_mcardle"
+        elif height is not None and age is not None:
+            sex = SEX_SYNONYMS.get(sex, "")
+            bmr = 10 * weight + 6.25 * height - 5 * age + MIFFLIN_SEX_CONSTANTS.get(sex, MIFFLIN_NEUTRAL_CONSTANT)
+            method = "mifflin_st_jeor" if sex else "mifflin_st_jeor_neutral"
+        else:
+            return None
+
+        activity_factor = ACTIVITY_FACTORS.get(training_level, DEFAULT_ACTIVITY_FACTOR)
+        tdee = bmr * activity_factor
+        target_calories = tdee * (1 + GOAL_CALORIE_ADJUSTMENTS.get(goal, 0.0))
+
+        protein_per_kg = GOAL_PROTEIN_PER_KG.get(goal, DEFAULT_PROTEIN_PER_KG)
+        protein = weight * protein_per_kg
+        fat = max(weight * FAT_PER_KG, target_calories * MIN_FAT_CALORIE_SHARE / 9)
+        carbs = max(0.0, (target_calories - protein * 4 - fat * 9) / 4)
+
+        return {
+            "bmr": round(bmr),
+            "tdee": round(tdee),
+            "target_calories": round(target_calories),
+            "activity_factor": activity_factor,
+            "goal": goal or None,
+            "protein_g": round(protein),
+            "protein_per_kg": protein_per_kg,
+            "carbs_g": round(carbs),
+            "fat_g": round(fat),
+            "water_l": round(weight * 0.035, 1),
+            "method": method
+        }
+
+    def format_for_prompt(self, targets: Optional[Dict[str, Any]]) -> str:
+        """Bloco compacto com as metas para o prompt da consulta (vazio sem metas)"""
+        if not targets:
+            return ""
+
+        method_labels = {
+            "katch_mcardle": "Katch-McArdle, massa magra da bioimpedância",
+            "mifflin_st_jeor": "Mifflin-St Jeor",
+            "mifflin_st_jeor_neutral": "Mifflin-St Jeor, sexo não informado, ±80 kcal"
+        }
+        goal_text = f" ({targets['goal']})" if targets.get("goal") else ""
+        return f"""
+METAS CALCULADAS (use estes valores, não refaça os cálculos):
+- TMB: {targets['bmr']} kcal ({method_labels[targets['method']]})
+- Gasto diário estimado: {targets['tdee']} kcal (fator de atividade {targets['activity_factor']})
+- Meta calórica{goal_text}: {targets['target_calories']} kcal/dia
+- Macros/dia: proteína {targets['protein_g']} g ({targets['protein_per_kg']} g/kg), carboidratos {targets['carbs_g']} g, gordura {targets['fat_g']} g
+- Água: {targets['water_l']} L/dia
+"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = (self.stats["hits"] + self.stats["misses"]) or 1
+        return {**self.stats, "cached_profiles": len(self._cache), "hit_rate": round(self.stats["hits"] / lookups, 3)}
+
+
+# Instância global da calculadora
+metabolic_calculator = MetabolicCalculator()
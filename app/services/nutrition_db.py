@@ -0,0 +1,247 @@
+"""
+Base nutricional local (tabela de composição estilo TACO/USDA em arrays NumPy)
+O LLM só identifica os alimentos e as porções; calorias e macros são calculados aqui,
+de forma determinística e vetorizada
+"""
+
+import csv
+import os
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.keyword_matcher import normalize_text
+from app.services.food_search import NgramIndex, load_or_build_index
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "food_composition.csv")
+
+# Colunas numéricas da tabela (valores por 100 g)
+NUTRIENT_COLUMNS = ["kcal", "protein", "carbs", "fat", "fiber"]
+
+# Linha usada quando o item não casa com nenhum alimento da tabela
+GENERIC_FOOD = "refeição mista"
+
+# Margem do range de calorias (o mínimo é o valor calculado)
+CALORIE_RANGE_MARGIN = 0.25
+
+
+class NutritionDatabase:
+    """Tabela de composição em memória com índice fuzzy de nomes (n-gramas de caracteres)"""
+
+    def __init__(self, table_path: Optional[str] = None):
+        self.table_path = table_path or os.getenv("NUTRITION_TABLE_PATH", DEFAULT_TABLE_PATH)
+        # Artefato .npz do índice (opcional): evita reconstruir o índice de tabelas grandes a cada boot
+        self.index_path = os.getenv("NUTRITION_INDEX_PATH")
+        # Similaridade mínima para aceitar o alimento encontrado (abaixo disso usa GENERIC_FOOD)
+        self.min_score = float(os.getenv("NUTRITION_MATCH_MIN_SCORE", "0.5"))
+
+        self.names: List[str] = []
+        self.categories: List[str] = []
+        self.portions = np.zeros(0, dtype=np.float32)
+        self.nutrients = np.zeros((0, len(NUTRIENT_COLUMNS)), dtype=np.float32)
+        self.generic_row = 0
+
+        # Nome/alias normalizado -> linha; cada nome/alias é um documento do índice de n-gramas
+        self._exact: Dict[str, int] = {}
+        self._document_rows = np.zeros(0, dtype=np.int32)
+        self.index: Optional[NgramIndex] = None
+
+        self.stats = {
+            "lookups": 0, "exact": 0, "fuzzy": 0, "unmatched": 0, "search_ms_total": 0.0,
+            "computations": 0, "compute_ms_total": 0.0
+        }
+
+        self._load()
+
+    @property
+    def is_ready(self) -> bool:
+        return bool(self.names)
+
+    def _load(self) -> None:
+        try:
+            with open(self.table_path, "r", encoding="utf-8") as table_file:
+                rows = list(csv.DictReader(table_file))
+        except Exception as e:
+            print(f"❌ NutritionDatabase: Erro ao carregar {self.table_path}: {e}")
+            return
+
+        self.names = [row["name"] for row in rows]
+        self.categories = [row["category"] for row in rows]
+        self.portions = np.array([float(row["portion_g"]) for row in rows], dtype=np.float32)
+        self.nutrients = np.array([[float(row[column]) for column in NUTRIENT_COLUMNS] for row in rows], dtype=np.float32)
+        self.generic_row = self.names.index(GENERIC_FOOD) if GENERIC_FOOD in self.names else len(rows) - 1
+
+        documents, document_rows = [], []
+        for index, row in enumerate(rows):
+            aliases = [alias for alias in row["aliases"].split("|") if alias.strip()]
+            for phrase in [row["name"], *aliases]:
+                self._exact.setdefault(normalize_text(phrase), index)
+                documents.append(phrase)
+                document_rows.append(index)
+        self._document_rows = np.array(document_rows, dtype=np.int32)
+
+        started = time.perf_counter()
+        self.index = load_or_build_index(documents, self.index_path)
+        print(
+            f"🥗 NutritionDatabase: {len(self.names)} alimentos, {len(documents)} nomes indexados "
+            f"({len(self.index.vocabulary)} n-gramas, {(time.perf_counter() - started) * 1000:.0f}ms)"
+        )
+
+    # ------------------------------------------------------------------
+    # Busca
+    # ------------------------------------------------------------------
+
+    def lookup(self, name: str) -> Tuple[int, float]:
+        """
+        Encontra o alimento da tabela mais parecido com o nome
+
+        Returns:
+            (linha, similaridade 0-1); linha de GENERIC_FOOD quando nada passa de min_score
+        """
+        self.stats["lookups"] += 1
+        exact = self._exact.get(normalize_text(name))
+        if exact is not None:
+            self.stats["exact"] += 1
+            return exact, 1.0
+
+        started = time.perf_counter()
+        results = self.index.search(name) if self.index is not None else []
+        self.stats["search_ms_total"] += (time.perf_counter() - started) * 1000
+
+        best_row, best_score = self.generic_row, 0.0
+        if results:
+            document_id, best_score = results[0]
+            best_row = int(self._document_rows[document_id])
+
+        if best_score < self.min_score:
+            self.stats["unmatched"] += 1
+            return self.generic_row, best_score
+        self.stats["fuzzy"] += 1
+        return best_row, best_score
+
+    # ------------------------------------------------------------------
+    # Cálculo nutricional
+    # ------------------------------------------------------------------
+
+    def compute(self, items: List[Dict[str, Any]], confidence: float = 0.7, reasoning: str = "") -> Dict[str, Any]:
+        """
+        Calcula calorias e macros dos itens identificados pelo LLM
+
+        Args:
+            items: [{"name": str, "quantity_grams": float | None}] (sem gramas usa a porção padrão)
+            confidence: Confiança da identificação (reduzida quando há itens sem correspondência)
+            reasoning: Explicação do LLM (complementada com os alimentos usados no cálculo)
+
+        Returns:
+            Análise no formato consumido pelo agente (food_items, estimated_calories,
+            calorie_range, macronutrients, confidence, analysis_method, reasoning)
+        """
+        items = [item for item in items if isinstance(item, dict) and str(item.get("name", "")).strip()]
+        if not items or not self.is_ready:
+            return {
+                "food_items": ["unknown"],
+                "estimated_calories": 0,
+                "calorie_range": {"min": 0, "max": 0},
+                "macronutrients": {"protein": 0, "carbs": 0, "fat": 0},
+                "confidence": min(confidence, 0.2),
+                "analysis_method": "local_nutrition_db",
+                "reasoning": reasoning or "Nenhum alimento identificado na imagem"
+            }
+
+        started = time.perf_counter()
+        matches = [self.lookup(item["name"]) for item in items]
+        rows = np.array([row for row, _ in matches], dtype=np.intp)
+        scores = np.array([score for _, score in matches], dtype=np.float32)
+        grams = np.array([
+            item["quantity_grams"] if isinstance(item.get("quantity_grams"), (int, float)) and item["quantity_grams"] > 0 else np.nan
+            for item in items
+        ], dtype=np.float32)
+        grams = np.where(np.isnan(grams), self.portions[rows], grams)
+
+        # Valores por item: (n, nutrientes) = tabela[linhas] * gramas / 100
+        values = self.nutrients[rows] * (grams / 100.0)[:, None]
+        totals = values.sum(axis=0)
+
+        matched = scores >= self.min_score
+        food_items = [
+            {
+                "name": item["name"],
+                "matched_food": self.names[row] if is_matched else None,
+                "quantity_grams": round(float(item_grams)),
+                "calories": round(float(item_values[0])),
+                "protein": round(float(item_values[1]), 1),
+                "carbs": round(float(item_values[2]), 1),
+                "fat": round(float(item_values[3]), 1),
+                "fiber": round(float(item_values[4]), 1)
+            }
+            for item, row, is_matched, item_grams, item_values in zip(items, rows, matched, grams, values)
+        ]
+
+        calories = round(float(totals[0]))
+        matched_names = [f"{item['name']} → {item['matched_food']}" for item in food_items if item["matched_food"]]
+        unmatched_names = [item["name"] for item in food_items if not item["matched_food"]]
+        notes = f"Valores calculados pela tabela nutricional local ({'; '.join(matched_names) or 'sem correspondências'})."
+        if unmatched_names:
+            notes += f" Sem correspondência na tabela (estimativa genérica): {', '.join(unmatched_names)}."
+
+        self.stats["computations"] += 1
+        self.stats["compute_ms_total"] += (time.perf_counter() - started) * 1000
+
+        return {
+            "food_items": food_items,
+            "estimated_calories": calories,
+            "calorie_range": {"min": calories, "max": round(calories * (1 + CALORIE_RANGE_MARGIN))},
+            "macronutrients": {
+                "protein": round(float(totals[1]), 1),
+                "carbs": round(float(totals[2]), 1),
+                "fat": round(float(totals[3]), 1),
+                "fiber": round(float(totals[4]), 1)
+            },
+            # Itens sem correspondência entram com valores genéricos: menos confiança no total
+            "confidence": round(confidence * (0.7 + 0.3 * float(matched.mean())), 2),
+            "analysis_method": "local_nutrition_db",
+            "reasoning": f"{reasoning} {notes}".strip()
+        }
+
+    def annotate_label(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Anexa ao rótulo o alimento equivalente da tabela ("reference_food", valores por 100 g),
+        para comparar o produto industrializado com a versão de referência
+        """
+        product_name = str(analysis.get("product_name") or "")
+        if not product_name or not self.is_ready:
+            return analysis
+
+        row, score = self.lookup(product_name)
+        if score < self.min_score:
+            return analysis
+
+        return {
+            **analysis,
+            "reference_food": {
+                "name": self.names[row],
+                "similarity": round(score, 2),
+                "per_100g": {column: round(float(value), 1) for column, value in zip(NUTRIENT_COLUMNS, self.nutrients[row])}
+            }
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Tamanho da tabela, taxa de correspondência dos nomes e tempo médio de cálculo"""
+        lookups = self.stats["lookups"] or 1
+        searches = (self.stats["fuzzy"] + self.stats["unmatched"]) or 1
+        computations = self.stats["computations"] or 1
+        return {
+            "foods": len(self.names),
+            "lookups": self.stats["lookups"],
+            "exact_rate": round(self.stats["exact"] / lookups, 3),
+            "fuzzy_rate": round(self.stats["fuzzy"] / lookups, 3),
+            "unmatched_rate": round(self.stats["unmatched"] / lookups, 3),
+            "avg_search_ms": round(self.stats["search_ms_total"] / searches, 3),
+            "computations": self.stats["computations"],
+            "avg_compute_ms": round(self.stats["compute_ms_total"] / computations, 3)
+        }
+
+
+# Instância global da base nutricional
+nutrition_db = NutritionDatabase()
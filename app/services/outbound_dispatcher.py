@@ -0,0 +1,481 @@
+"""
+Fila de envio de mensagens (Telegram Bot API e Twilio REST para WhatsApp)
+Fila de prioridade atendida por workers, com token bucket global e por chat (Telegram: ~30
+mensagens/s no total e ~1/s por chat), respeito ao retry_after dos 429, backoff exponencial
+para erros transitórios e spool JSONL com o que ainda não foi entregue (sobrevive a reinícios).
+As partes de uma resposta e as respostas de um mesmo chat saem em ordem
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+from app.core.channels import ChannelConfig
+from app.services.outbound_formatter import outbound_formatter, to_telegram_html, to_plain_text, to_whatsapp
+
+# Prioridades (menor sai primeiro): respostas a mensagens do usuário antes de avisos em massa
+PRIORITY_REPLY = 0
+PRIORITY_NOTIFICATION = 5
+
+# Amostras de latência guardadas por canal para os percentis
+LATENCY_SAMPLES = 500
+
+# Status do Twilio que encerram o acompanhamento de uma mensagem
+FINAL_PROVIDER_STATUSES = {"read", "failed", "undelivered"}
+
+
+class TokenBucket:
+    """Balde de fichas: `rate` envios/s sustentados, rajadas de até `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        """Segundos até haver uma ficha (0 = disponível agora)"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def is_full(self) -> bool:
+        return self.wait_time() == 0 and self.tokens >= self.capacity
+
+
+class TelegramTransport:
+    """sendMessage em HTML; se o Telegram recusar as entidades, reenvia a parte como texto simples"""
+
+    channel = "telegram"
+    # O Telegram não envia confirmação de entrega
+    tracks_status = False
+
+    def __init__(self):
+        self.bot_token = ChannelConfig.TELEGRAM_CONFIG.get("bot_token", "")
+        self.api_base = ChannelConfig.TELEGRAM_CONFIG["api_base"]
+
+    async def send(self, client: httpx.AsyncClient, chat_id: str, part: str) -> Dict[str, Any]:
+        """
+        Envia uma parte
+
+        Returns:
+            {"status": "sent" | "retry" | "failed", "retry_after", "plain_fallback", "message_id", "error"}
+        """
+        url = f"{self.api_base}/bot{self.bot_token}/sendMessage"
+        payload = {"chat_id": chat_id, "text": to_telegram_html(part), "parse_mode": "HTML"}
+        plain_fallback = False
+
+        try:
+            response = await client.post(url, json=payload)
+            if response.status_code == 400 and "parse entities" in response.text:
+                print(f"⚠️ TelegramTransport: HTML recusado, reenviando como texto simples: {response.text[:200]}")
+                plain_fallback = True
+                response = await client.post(url, json={"chat_id": chat_id, "text": to_plain_text(part)})
+        except Exception as e:
+            return {"status": "retry", "error": str(e), "plain_fallback": plain_fallback}
+
+        result = {"plain_fallback": plain_fallback, "error": response.text[:200] if response.status_code != 200 else None}
+        if response.status_code == 200:
+            message_id = (response.json().get("result") or {}).get("message_id")
+            return {**result, "status": "sent", "message_id": str(message_id) if message_id else None}
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.json().get("parameters", {}).get("retry_after", 1))
+            except Exception:
+                retry_after = 1.0
+            return {**result, "status": "retry", "retry_after": retry_after}
+        if response.status_code >= 500:
+            return {**result, "status": "retry"}
+        # 400/403 (chat inexistente, bot bloqueado): não adianta tentar de novo
+        return {**result, "status": "failed"}
+
+
+class TwilioTransport:
+    """Messages API do Twilio para WhatsApp (corpo com a formatação do WhatsApp)"""
+
+    channel = "whatsapp"
+    # Status de entrega chegam pelo StatusCallback (correlacionados pelo MessageSid)
+    tracks_status = True
+
+    def __init__(self):
+        self.account_sid = os.getenv("TWILIO_ACCOUNT_SID", "")
+        self.auth_token = os.getenv("TWILIO_AUTH_TOKEN", "")
+        self.from_number = os.getenv("TWILIO_WHATSAPP_FROM", "")
+        self.status_callback_url = os.getenv("TWILIO_STATUS_CALLBACK_URL", "")
+
+    async def send(self, client: httpx.AsyncClient, chat_id: str, part: str) -> Dict[str, Any]:
+        if not (self.account_sid and self.auth_token and self.from_number):
+            return {"status": "failed", "error": "TWILIO_ACCOUNT_SID/TWILIO_AUTH_TOKEN/TWILIO_WHATSAPP_FROM não configurados"}
+
+        prefix = ChannelConfig.WHATSAPP_CONFIG["phone_prefix"]
+        data = {
+            "From": self.from_number if self.from_number.startswith(prefix) else f"{prefix}{self.from_number}",
+            "To": chat_id if chat_id.startswith(prefix) else f"{prefix}{chat_id}",
+            "Body": to_whatsapp(part)
+        }
+        if self.status_callback_url:
+            data["StatusCallback"] = self.status_callback_url
+
+        url = f"https://api.twilio.com/2010-04-01/Accounts/{self.account_sid}/Messages.json"
+        try:
+            response = await client.post(url, data=data, auth=(self.account_sid, self.auth_token))
+        except Exception as e:
+            return {"status": "retry", "error": str(e)}
+
+        if response.status_code in (200, 201):
+            return {"status": "sent", "message_id": response.json().get("sid")}
+        result = {"error": response.text[:200]}
+        if response.status_code == 429:
+            retry_after = response.headers.get("Retry-After")
+            return {**result, "status": "retry", "retry_after": float(retry_after) if retry_after and retry_after.isdigit() else 1.0}
+        if response.status_code >= 500:
+            return {**result, "status": "retry"}
+        return {**result, "status": "failed"}
+
+
+class OutboundDispatcher:
+    """Fila de prioridade de envios com limites de taxa, novas tentativas e spool em disco"""
+
+    def __init__(self):
+        self.worker_count = int(os.getenv("OUTBOUND_WORKERS", "8"))
+        self.max_attempts = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "6"))
+        self.backoff_base = float(os.getenv("OUTBOUND_BACKOFF_BASE", "1.0"))
+        self.backoff_max = float(os.getenv("OUTBOUND_BACKOFF_MAX", "60"))
+        self.spool_path = os.getenv("OUTBOUND_SPOOL_PATH", os.path.join("logs", "outbound_spool.jsonl"))
+        # Respostas mais velhas que isso no spool não são mais enviadas (chegariam fora de contexto)
+        self.spool_max_age = float(os.getenv("OUTBOUND_SPOOL_MAX_AGE", "3600"))
+
+        self.transports = {"telegram": TelegramTransport(), "whatsapp": TwilioTransport()}
+        self.global_buckets = {
+            "telegram": TokenBucket(float(os.getenv("OUTBOUND_TELEGRAM_GLOBAL_RATE", "30")), 30),
+            "whatsapp": TokenBucket(float(os.getenv("OUTBOUND_TWILIO_GLOBAL_RATE", "10")), 10)
+        }
+        self.chat_rate = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+        self.chat_burst = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        # Chats com entrega em andamento -> jobs que chegaram nesse meio tempo (mantém a ordem por chat)
+        self.chat_backlog: Dict[str, deque] = {}
+        self._sequence = itertools.count()
+        self._workers: List[asyncio.Task] = []
+        self._client: Optional[httpx.AsyncClient] = None
+        self._done_since_compaction = 0
+        # MessageSid -> envio (para correlacionar os status callbacks)
+        self.provider_messages: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.max_tracked_messages = int(os.getenv("OUTBOUND_MAX_TRACKED_MESSAGES", "5000"))
+
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Restaura o spool e inicia os workers (chamado no startup; enqueue também inicia sob demanda)"""
+        if self.queue is not None:
+            return
+        self.queue = asyncio.PriorityQueue()
+        restored = self._restore_spool()
+        for job in restored:
+            self.queue.put_nowait((job["priority"], next(self._sequence), job["id"]))
+        self._workers = [asyncio.get_running_loop().create_task(self._worker()) for _ in range(self.worker_count)]
+        print(f"📮 OutboundDispatcher: {self.worker_count} workers iniciados, {len(restored)} envios restaurados do spool")
+
+    async def stop(self) -> None:
+        """Para os workers; o que não foi entregue continua no spool"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self.queue = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def enqueue(self, channel: str, chat_id: str, text: str, priority: int = PRIORITY_REPLY) -> Optional[str]:
+        """
+        Enfileira uma resposta (dividida em partes pelo limite do canal)
+
+        Returns:
+            Id do envio ou None (texto vazio ou canal sem transporte)
+        """
+        if channel not in self.transports:
+            print(f"❌ OutboundDispatcher: Canal sem transporte: {channel}")
+            return None
+        parts = outbound_formatter.split_message(text, channel)
+        if not parts:
+            return None
+
+        self.start()
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "channel": channel,
+            "chat_id": str(chat_id),
+            "parts": parts,
+            "sent": 0,
+            "priority": priority,
+            "created_at": time.time()
+        }
+        self.jobs[job["id"]] = job
+        self._append_spool({"op": "enqueue", "job": job})
+        self._stats_for(channel)["enqueued"] += 1
+        self.queue.put_nowait((priority, next(self._sequence), job["id"]))
+        return job["id"]
+
+    # ------------------------------------------------------------------
+    # Entrega
+    # ------------------------------------------------------------------
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self.queue.get()
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+
+            key = f"{job['channel']}:{job['chat_id']}"
+            if key in self.chat_backlog:
+                # Outro worker está entregando para esse chat: entra na fila dele
+                self.chat_backlog[key].append(job_id)
+                continue
+
+            self.chat_backlog[key] = deque([job_id])
+            try:
+                while self.chat_backlog[key]:
+                    next_job = self.jobs.get(self.chat_backlog[key].popleft())
+                    if next_job is not None:
+                        await self._deliver(next_job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ OutboundDispatcher: Erro inesperado na entrega para {key}: {e}")
+            finally:
+                self.chat_backlog.pop(key, None)
+
+    async def _deliver(self, job: Dict[str, Any]) -> None:
+        """Envia as partes restantes em ordem; retry_after/backoff entre tentativas da mesma parte"""
+        channel = job["channel"]
+        stats = self._stats_for(channel)
+        transport = self.transports[channel]
+        attempts = 0
+
+        while job["sent"] < len(job["parts"]):
+            await self._acquire(channel, job["chat_id"])
+            result = await transport.send(self._get_client(), job["chat_id"], job["parts"][job["sent"]])
+            stats["plain_fallbacks"] += int(bool(result.get("plain_fallback")))
+
+            if result["status"] == "sent":
+                if job["sent"] == 0:
+                    stats["first_part_ms"].append((time.time() - job["created_at"]) * 1000)
+                if transport.tracks_status and result.get("message_id"):
+                    self._track_provider_message(result["message_id"], job)
+                job["sent"] += 1
+                stats["parts_sent"] += 1
+                attempts = 0
+                self._append_spool({"op": "progress", "id": job["id"], "sent": job["sent"]})
+                continue
+
+            attempts += 1
+            if result["status"] == "failed" or attempts >= self.max_attempts:
+                stats["failed"] += 1
+                print(f"❌ OutboundDispatcher: Envio {job['id']} para {channel}:{job['chat_id']} descartado "
+                      f"na parte {job['sent'] + 1}/{len(job['parts'])}: {result.get('error')}")
+                self._finish(job)
+                return
+
+            if result.get("retry_after") is not None:
+                stats["rate_limited"] += 1
+                delay = result["retry_after"]
+            else:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            stats["retries"] += 1
+            print(f"⏳ OutboundDispatcher: Nova tentativa {attempts}/{self.max_attempts - 1} para "
+                  f"{channel}:{job['chat_id']} em {delay:.1f}s ({result.get('error') or 'rate limit'})")
+            await asyncio.sleep(delay)
+
+        stats["delivered"] += 1
+        stats["delivery_ms"].append((time.time() - job["created_at"]) * 1000)
+        self._finish(job)
+
+    async def _acquire(self, channel: str, chat_id: str) -> None:
+        """Espera uma ficha do balde global do canal e do balde do chat"""
+        key = f"{channel}:{chat_id}"
+        chat_bucket = self.chat_buckets.get(key)
+        if chat_bucket is None:
+            if len(self.chat_buckets) > 10000:
+                # Baldes cheios equivalem a baldes novos: podem ser descartados
+                self.chat_buckets = {name: bucket for name, bucket in self.chat_buckets.items() if not bucket.is_full()}
+            chat_bucket = self.chat_buckets[key] = TokenBucket(self.chat_rate, self.chat_burst)
+        global_bucket = self.global_buckets[channel]
+
+        while True:
+            wait = max(global_bucket.wait_time(), chat_bucket.wait_time())
+            if wait <= 0:
+                global_bucket.consume()
+                chat_bucket.consume()
+                return
+            await asyncio.sleep(wait)
+
+    def _finish(self, job: Dict[str, Any]) -> None:
+        self.jobs.pop(job["id"], None)
+        self._append_spool({"op": "done", "id": job["id"]})
+        self._done_since_compaction += 1
+        if self._done_since_compaction >= 500:
+            self._compact_spool()
+
+    # ------------------------------------------------------------------
+    # Status de entrega do provedor
+    # ------------------------------------------------------------------
+
+    def _track_provider_message(self, message_id: str, job: Dict[str, Any]) -> None:
+        self.provider_messages[message_id] = {"channel": job["channel"], "job_id": job["id"], "created_at": job["created_at"]}
+        while len(self.provider_messages) > self.max_tracked_messages:
+            self.provider_messages.popitem(last=False)
+
+    def record_status(self, message_id: str, status: str, error_code: Optional[str] = None) -> bool:
+        """
+        Registra um status callback (queued, sent, delivered, read, failed, undelivered)
+
+        A latência até "delivered" é medida desde o enfileiramento da resposta
+
+        Returns:
+            True se a mensagem foi enviada pela fila
+        """
+        tracked = self.provider_messages.get(message_id)
+        stats = self._stats_for(tracked["channel"] if tracked else "whatsapp")
+        stats["provider_statuses"][status] = stats["provider_statuses"].get(status, 0) + 1
+        if tracked is None:
+            stats["untracked_statuses"] += 1
+            return False
+
+        if status in ("delivered", "read") and not tracked.get("delivered"):
+            tracked["delivered"] = True
+            stats["handset_delivery_ms"].append((time.time() - tracked["created_at"]) * 1000)
+        elif status in ("failed", "undelivered"):
+            print(f"❌ OutboundDispatcher: Mensagem {message_id} ({tracked['job_id']}) não entregue: {status} {error_code or ''}")
+        if status in FINAL_PROVIDER_STATUSES:
+            self.provider_messages.pop(message_id, None)
+        return True
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=20.0,
+                limits=httpx.Limits(max_connections=self.worker_count * 2, max_keepalive_connections=self.worker_count)
+            )
+        return self._client
+
+    # ------------------------------------------------------------------
+    # Spool (JSONL: enqueue / progress / done)
+    # ------------------------------------------------------------------
+
+    def _append_spool(self, record: Dict[str, Any]) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.spool_path) or ".", exist_ok=True)
+            with open(self.spool_path, "a", encoding="utf-8") as spool_file:
+                spool_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"⚠️ OutboundDispatcher: Erro ao gravar spool: {e}")
+
+    def _restore_spool(self) -> List[Dict[str, Any]]:
+        """Envios não concluídos do spool (retomados a partir da próxima parte)"""
+        if not os.path.exists(self.spool_path):
+            return []
+
+        pending: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.spool_path, "r", encoding="utf-8") as spool_file:
+                for line in spool_file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if record["op"] == "enqueue":
+                        pending[record["job"]["id"]] = record["job"]
+                    elif record["op"] == "progress" and record["id"] in pending:
+                        pending[record["id"]]["sent"] = record["sent"]
+                    elif record["op"] == "done":
+                        pending.pop(record["id"], None)
+        except Exception as e:
+            print(f"⚠️ OutboundDispatcher: Erro ao ler spool: {e}")
+            return []
+
+        now = time.time()
+        restored = []
+        for job in pending.values():
+            if now - job["created_at"] > self.spool_max_age:
+                self._stats_for(job["channel"])["expired"] += 1
+                continue
+            self.jobs.setdefault(job["id"], job)
+            self._stats_for(job["channel"])["restored"] += 1
+            restored.append(job)
+
+        self._compact_spool()
+        return restored
+
+    def _compact_spool(self) -> None:
+        """Reescreve o spool só com os envios pendentes"""
+        self._done_since_compaction = 0
+        try:
+            os.makedirs(os.path.dirname(self.spool_path) or ".", exist_ok=True)
+            temp_path = f"{self.spool_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as spool_file:
+                for job in self.jobs.values():
+                    spool_file.write(json.dumps({"op": "enqueue", "job": job}, ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.spool_path)
+        except Exception as e:
+            print(f"⚠️ OutboundDispatcher: Erro ao compactar spool: {e}")
+
+    # ------------------------------------------------------------------
+    # Estatísticas
+    # ------------------------------------------------------------------
+
+    def _stats_for(self, channel: str) -> Dict[str, Any]:
+        return self.stats.setdefault(channel, {
+            "enqueued": 0, "delivered": 0, "failed": 0, "parts_sent": 0, "retries": 0,
+            "rate_limited": 0, "plain_fallbacks": 0, "restored": 0, "expired": 0,
+            "provider_statuses": {}, "untracked_statuses": 0,
+            "first_part_ms": deque(maxlen=LATENCY_SAMPLES), "delivery_ms": deque(maxlen=LATENCY_SAMPLES),
+            "handset_delivery_ms": deque(maxlen=LATENCY_SAMPLES)
+        })
+
+    @staticmethod
+    def _percentiles(samples: deque) -> Dict[str, Optional[int]]:
+        ordered = sorted(samples)
+        if not ordered:
+            return {"p50": None, "p95": None}
+        return {"p50": round(ordered[len(ordered) // 2]), "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))])}
+
+    def get_stats(self) -> Dict[str, Any]:
+        channels = {}
+        for channel, stats in self.stats.items():
+            channels[channel] = {
+                name: self._percentiles(value) if isinstance(value, deque) else value
+                for name, value in stats.items()
+            }
+        return {
+            "running": self.queue is not None,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "pending_jobs": len(self.jobs),
+            "active_chats": len(self.chat_backlog),
+            "tracked_provider_messages": len(self.provider_messages),
+            "channels": channels
+        }
+
+
+# Instância global da fila de envio
+outbound_dispatcher = OutboundDispatcher()
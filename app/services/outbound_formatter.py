@@ -0,0 +1,149 @@
+"""
+Formatação das respostas para envio
+Divide respostas longas em partes dentro do limite do canal (em fronteiras de parágrafo,
+linha, frase e palavra, sem quebrar negrito) e converte o markdown que os agentes emitem
+(**negrito**, ### títulos, [texto](url), listas com "* ") para o formato do canal:
+HTML do Telegram (parse_mode="HTML"), *negrito* do WhatsApp ou texto simples
+"""
+
+import html
+import os
+import re
+from typing import Dict, Any, Callable, List
+
+_BOLD_PATTERN = re.compile(r"\*\*(.+?)\*\*")
+_HEADER_PATTERN = re.compile(r"^#{1,6}\s+(.+?)\s*#*$", re.MULTILINE)
+_LINK_PATTERN = re.compile(r"\[([^\]\n]+)\]\((https?://[^)\s]+)\)")
+_BULLET_PATTERN = re.compile(r"^(\s*)[*-]\s+", re.MULTILINE)
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?…])\s+")
+
+# Níveis de divisão, do mais natural ao último recurso: (separador usado ao remontar, como dividir)
+_SPLIT_LEVELS = [
+    ("\n\n", lambda text: re.split(r"\n\s*\n", text)),
+    ("\n", lambda text: text.split("\n")),
+    (" ", lambda text: _SENTENCE_PATTERN.split(text)),
+    (" ", lambda text: text.split(" "))
+]
+
+
+def _utf16_length(text: str) -> int:
+    """O Telegram conta o limite em unidades UTF-16 (emojis contam 2)"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def to_telegram_html(text: str) -> str:
+    """Markdown dos agentes -> HTML aceito pelo Telegram (texto escapado antes das tags)"""
+    converted = html.escape(text, quote=False)
+    converted = _LINK_PATTERN.sub(lambda match: f'<a href="{match.group(2).replace(chr(34), "%22")}">{match.group(1)}</a>', converted)
+    converted = _HEADER_PATTERN.sub(lambda match: f"<b>{match.group(1).replace('**', '')}</b>", converted)
+    converted = _BOLD_PATTERN.sub(r"<b>\1</b>", converted)
+    return _BULLET_PATTERN.sub(r"\1• ", converted)
+
+
+def to_whatsapp(text: str) -> str:
+    """Markdown dos agentes -> formatação do WhatsApp (*negrito*, links por extenso)"""
+    converted = _LINK_PATTERN.sub(r"\1: \2", text)
+    converted = _HEADER_PATTERN.sub(lambda match: f"**{match.group(1).replace('**', '')}**", converted)
+    converted = _BULLET_PATTERN.sub(r"\1• ", converted)
+    return _BOLD_PATTERN.sub(r"*\1*", converted)
+
+
+def to_plain_text(text: str) -> str:
+    """Markdown dos agentes -> texto simples (fallback quando a formatação é recusada)"""
+    converted = _LINK_PATTERN.sub(r"\1: \2", text)
+    converted = _HEADER_PATTERN.sub(lambda match: match.group(1).replace("**", ""), converted)
+    converted = _BULLET_PATTERN.sub(r"\1• ", converted)
+    return _BOLD_PATTERN.sub(r"\1", converted)
+
+
+def _pack(text: str, limit: int, measure: Callable[[str], int], level: int = 0) -> List[str]:
+    """Junta pedaços do nível atual até o limite; pedaços grandes demais descem de nível"""
+    if measure(text) <= limit:
+        return [text]
+    if level >= len(_SPLIT_LEVELS):
+        # Palavra maior que o limite: corte por caracteres
+        step = max(1, limit // 2)
+        return [text[start:start + step] for start in range(0, len(text), step)]
+
+    separator, split = _SPLIT_LEVELS[level]
+    chunks: List[str] = []
+    current = ""
+    for piece in split(text):
+        if not piece.strip():
+            continue
+        candidate = f"{current}{separator}{piece}" if current else piece
+        if measure(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        if measure(piece) <= limit:
+            current = piece
+        else:
+            pieces = _pack(piece, limit, measure, level + 1)
+            chunks.extend(pieces[:-1])
+            current = pieces[-1]
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _balance_bold(chunks: List[str]) -> List[str]:
+    """Fecha o negrito aberto no fim de uma parte e reabre na parte seguinte"""
+    balanced = []
+    carry = False
+    for chunk in chunks:
+        if carry:
+            chunk = f"**{chunk}"
+        carry = chunk.count("**") % 2 == 1
+        balanced.append(f"{chunk}**" if carry else chunk)
+    return balanced
+
+
+class OutboundFormatter:
+    """Divide e formata respostas por canal, com estatísticas de partes"""
+
+    def __init__(self):
+        # Telegram: 4096 unidades UTF-16 após o parse das entidades; Twilio: 1600 caracteres por Body
+        self.limits = {
+            "telegram": int(os.getenv("OUTBOUND_TELEGRAM_MAX_CHARS", "4096")),
+            "whatsapp": int(os.getenv("OUTBOUND_WHATSAPP_MAX_CHARS", "1600"))
+        }
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def split_message(self, text: str, channel: str) -> List[str]:
+        """
+        Partes (ainda em markdown) que cabem no limite do canal depois de formatadas
+
+        O tamanho é medido no texto renderizado: o que o usuário vê no Telegram,
+        o corpo já convertido no WhatsApp
+        """
+        text = (text or "").strip()
+        if not text:
+            return []
+
+        if channel == "telegram":
+            measure = lambda chunk: _utf16_length(to_plain_text(chunk))
+        else:
+            measure = lambda chunk: len(to_whatsapp(chunk))
+        # Margem para o "**" de fechamento/reabertura do negrito
+        limit = self.limits.get(channel, self.limits["whatsapp"]) - 4
+
+        parts = _balance_bold([chunk.strip() for chunk in _pack(text, limit, measure) if chunk.strip()])
+
+        stats = self._stats_for(channel)
+        stats["messages"] += 1
+        stats["parts"] += len(parts)
+        stats["split_messages"] += int(len(parts) > 1)
+        stats["max_parts"] = max(stats["max_parts"], len(parts))
+        return parts
+
+    def _stats_for(self, channel: str) -> Dict[str, Any]:
+        return self.stats.setdefault(channel, {"messages": 0, "parts": 0, "split_messages": 0, "max_parts": 0})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"limits": self.limits, "channels": self.stats}
+
+
+# Instância global do formatador
+outbound_formatter = OutboundFormatter()
@@ -0,0 +1,347 @@
+"""
+Extratores determinísticos de campos do perfil (camada rápida antes do LLM)
+Cada extrator retorna (valor, confiança); abaixo do limiar o chamador consulta o LLM
+"""
+
+import os
+import re
+from difflib import get_close_matches
+from typing import Dict, Any, Optional, Tuple, List
+
+from app.services.keyword_matcher import normalize_text
+
+# Confiança mínima para aceitar o resultado sem consultar o LLM
+MIN_CONFIDENCE = float(os.getenv("PROFILE_PARSER_MIN_CONFIDENCE", "0.8"))
+
+# Intervalo (em extrações) entre logs de taxa de acerto por camada
+HIT_RATE_LOG_EVERY = 50
+
+GOAL_SYNONYMS = {
+    "emagrecimento": [
+        "emagrecimento", "emagrecer", "perder peso", "perder gordura", "queimar gordura",
+        "perder barriga", "secar", "ficar magro", "ficar magra", "ficar fininha", "ficar fininho",
+        "diminuir peso", "baixar peso", "reduzir peso", "reduzir gordura", "definir", "definicao",
+        "perder uns quilos", "perder quilos", "cutting", "emagrece"
+    ],
+    "hipertrofia": [
+        "hipertrofia", "ganhar massa", "ganho de massa", "massa muscular", "ganhar musculo",
+        "ganhar musculos", "crescer", "ficar forte", "ficar grande", "ficar maromba", "maromba",
+        "bulking", "ganhar peso", "aumentar massa", "ficar monstro", "ficar sarado", "ficar sarada"
+    ],
+    "condicionamento": [
+        "condicionamento", "resistencia", "folego", "cardio", "saude", "bem estar", "bem-estar",
+        "disposicao", "performance", "desempenho", "correr", "corrida", "qualidade de vida"
+    ],
+    "manutencao": [
+        "manutencao", "manter", "manter peso", "manter o peso", "equilibrar", "estabilizar",
+        "continuar como estou", "nao mudar"
+    ]
+}
+
+TRAINING_LEVEL_SYNONYMS = {
+    "iniciante": [
+        "iniciante", "comecando", "novato", "novata", "primeira vez", "nunca treinei", "sou novo",
+        "sou nova", "sedentario", "sedentaria", "parado", "parada", "leigo", "leiga", "nunca fiz",
+        "beginner", "basico"
+    ],
+    "intermediario": [
+        "intermediario", "ja treino", "tenho experiencia", "meio termo", "mais ou menos",
+        "medio", "media", "regular", "treino as vezes"
+    ],
+    "avancado": [
+        "avancado", "avancada", "experiente", "treino ha anos", "sou forte", "atleta",
+        "competidor", "competidora", "treino ha muito tempo"
+    ]
+}
+
+NO_RESTRICTION_ANSWERS = {
+    "nenhuma", "nenhum", "nao", "nao tenho", "nao tenho nenhuma", "nao tenho nenhum", "nada",
+    "sem restricoes", "sem restricao", "sem restricoes alimentares", "nenhuma restricao",
+    "none", "n", "negativo", "nao possuo", "nao nenhuma", "tudo tranquilo", "como de tudo"
+}
+
+KNOWN_RESTRICTIONS = {
+    "lactose": "intolerância à lactose",
+    "gluten": "intolerância ao glúten",
+    "celiac": "doença celíaca",
+    "vegetarian": "vegetariano",
+    "vegan": "vegano",
+    "diabet": "diabetes",
+    "hipertens": "hipertensão",
+    "pressao alta": "hipertensão",
+    "amendoim": "alergia a amendoim",
+    "frutos do mar": "alergia a frutos do mar",
+    "camarao": "alergia a frutos do mar",
+    "joelho": "lesão no joelho",
+    "coluna": "problema na coluna",
+    "lombar": "problema na coluna",
+    "ombro": "lesão no ombro",
+}
+
+# Negação antes do termo ("nao sou vegetariano", "nao tenho problema no joelho", "sem lactose")
+NEGATION_CUES = {"nao", "nem", "nenhum", "nenhuma", "sem", "nunca"}
+NEGATION_WINDOW = 4
+
+NUMBER_WORDS = {
+    "um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "quatro": 4, "cinco": 5, "seis": 6,
+    "sete": 7, "oito": 8, "nove": 9, "dez": 10, "onze": 11, "doze": 12, "treze": 13,
+    "quatorze": 14, "catorze": 14, "quinze": 15, "dezesseis": 16, "dezessete": 17,
+    "dezoito": 18, "dezenove": 19, "vinte": 20, "trinta": 30, "quarenta": 40,
+    "cinquenta": 50, "sessenta": 60, "setenta": 70, "oitenta": 80, "noventa": 90
+}
+
+
+def _to_float(raw: str) -> float:
+    return float(raw.replace(",", "."))
+
+
+class ProfileFieldExtractor:
+    """Extratores baseados em regex/sinônimos com score de confiança e estatísticas por camada"""
+
+    def __init__(self):
+        self.min_confidence = MIN_CONFIDENCE
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._total_records = 0
+
+        self._parsers = {
+            "age": self.parse_age,
+            "height_cm": self.parse_height,
+            "current_weight_kg": self.parse_weight,
+            "goal": self.parse_goal,
+            "training_level": self.parse_training_level,
+            "restrictions": self.parse_restrictions
+        }
+
+        self._goal_index = self._build_synonym_index(GOAL_SYNONYMS)
+        self._level_index = self._build_synonym_index(TRAINING_LEVEL_SYNONYMS)
+
+    def _build_synonym_index(self, synonyms: Dict[str, List[str]]) -> Dict[str, str]:
+        """Sinônimo normalizado → valor canônico (frases mais longas primeiro)"""
+        index = {}
+        for canonical, words in synonyms.items():
+            for word in words:
+                index[normalize_text(word)] = canonical
+        return dict(sorted(index.items(), key=lambda item: -len(item[0])))
+
+    def extract(self, field_name: str, content: str) -> Dict[str, Any]:
+        """
+        Extrai valor de um campo sem LLM
+
+        Returns:
+            {"value": valor ou None, "confidence": 0.0-1.0, "confident": bool}
+        """
+        parser = self._parsers.get(field_name)
+        if not parser or not content:
+            return {"value": None, "confidence": 0.0, "confident": False}
+
+        try:
+            value, confidence = parser(normalize_text(content))
+        except Exception:
+            value, confidence = None, 0.0
+
+        return {
+            "value": value,
+            "confidence": confidence,
+            "confident": value is not None and confidence >= self.min_confidence
+        }
+
+    # ------------------------------------------------------------------
+    # Números
+    # ------------------------------------------------------------------
+
+    def _parse_number_words(self, text: str) -> Optional[int]:
+        """Converte números por extenso simples ("trinta e dois") em inteiro"""
+        tokens = [token for token in re.split(r"[\s-]+", text) if token not in ("e", "anos", "ano")]
+        if not tokens or any(token not in NUMBER_WORDS for token in tokens):
+            return None
+        return sum(NUMBER_WORDS[token] for token in tokens)
+
+    def parse_age(self, text: str) -> Tuple[Optional[int], float]:
+        """Idade: "30", "30 anos", "tenho 30", "trinta e dois" """
+        # "N anos" que não seja duração ("há 3 anos", "faz 2 anos")
+        for match in re.finditer(r"(?<![\d.,])(\d{1,3})\s*anos?\b", text):
+            prefix = text[:match.start()].rstrip()
+            if re.search(r"\b(?:ha|faz|por|durante)$", prefix):
+                continue
+            return int(match.group(1)), 0.95
+
+        # "tenho 85 kg" / "tenho 175cm" são peso e altura, não idade
+        match = re.search(
+            r"\b(?:tenho|idade\s*:?|idade e)\s*(\d{1,3})(?![\d.,])(?!\s*(?:kg|quilos?|kilos?|cm|m\b|metros?))", text
+        )
+        if match:
+            return int(match.group(1)), 0.9
+
+        if re.fullmatch(r"\d{1,3}", text):
+            return int(text), 0.9
+
+        words_value = self._parse_number_words(text)
+        if words_value:
+            return words_value, 0.85
+
+        numbers = re.findall(r"(?<![\d.,])\d{1,3}(?![\d.,])", text)
+        if len(numbers) == 1:
+            return int(numbers[0]), 0.6
+        if numbers:
+            return int(numbers[0]), 0.3
+        return None, 0.0
+
+    def parse_height(self, text: str) -> Tuple[Optional[float], float]:
+        """Altura em cm: "1,80", "1.80m", "1m80", "1 metro e 80", "180cm", "180" """
+        match = re.search(r"\b([12])\s*(?:m|metro|metros)\s*(?:e\s*)?(\d{1,2})\b", text)
+        if match:
+            centimeters = match.group(2).ljust(2, "0") if len(match.group(2)) == 1 else match.group(2)
+            return float(int(match.group(1)) * 100 + int(centimeters)), 0.95
+
+        match = re.search(r"\b([12][.,]\d{1,2})\s*(m|mt|mts|metro|metros)?\b", text)
+        if match:
+            confidence = 0.95 if match.group(2) or text == match.group(1) else 0.85
+            return round(_to_float(match.group(1)) * 100, 1), confidence
+
+        match = re.search(r"\b(\d{2,3}(?:[.,]\d)?)\s*(?:cm|centimetros?)\b", text)
+        if match:
+            return _to_float(match.group(1)), 0.95
+
+        if re.fullmatch(r"\d{3}", text):
+            return float(text), 0.9
+
+        match = re.search(r"\b(?:altura|meco|tenho)\s*:?\s*(\d{3})\b", text)
+        if match:
+            return float(match.group(1)), 0.85
+
+        numbers = re.findall(r"(?<![\d.,])\d{3}(?![\d.,])", text)
+        if len(numbers) == 1:
+            return float(numbers[0]), 0.6
+        return None, 0.0
+
+    def parse_weight(self, text: str) -> Tuple[Optional[float], float]:
+        """Peso em kg: "85kg", "85 kg", "85,5 quilos", "85" """
+        match = re.search(r"\b(\d{2,3}(?:[.,]\d{1,2})?)\s*(?:kg|kgs|k|quilos?|kilos?|quilogramas?)\b", text)
+        if match:
+            return _to_float(match.group(1)), 0.95
+
+        if re.fullmatch(r"\d{2,3}(?:[.,]\d{1,2})?", text):
+            return _to_float(text), 0.9
+
+        match = re.search(r"\b(?:peso|pesando|estou com)\s*:?\s*(\d{2,3}(?:[.,]\d{1,2})?)\b", text)
+        if match:
+            return _to_float(match.group(1)), 0.9
+
+        numbers = re.findall(r"(?<![\d.,])\d{2,3}(?:[.,]\d{1,2})?(?![\d.,])", text)
+        if len(numbers) == 1:
+            return _to_float(numbers[0]), 0.6
+        return None, 0.0
+
+    # ------------------------------------------------------------------
+    # Escolhas
+    # ------------------------------------------------------------------
+
+    def _match_choice(self, text: str, index: Dict[str, str], options: List[str]) -> Tuple[Optional[str], float]:
+        """Sinônimos exatos primeiro; depois similaridade para erros de digitação"""
+        found = set()
+        negated = False
+        remaining = f" {text} "
+        for synonym, canonical in index.items():
+            if f" {synonym} " in remaining or (len(synonym) >= 6 and synonym in remaining):
+                found.add(canonical)
+                remaining = remaining.replace(synonym, " ")
+                positions = [match.start() for match in re.finditer(re.escape(synonym), text)]
+                negated = negated or (bool(positions) and all(self._is_negated(text, position) for position in positions))
+
+        # Opção negada ("nao quero emagrecer", "nao sou iniciante") → deixa o LLM decidir
+        if negated:
+            return sorted(found)[0], 0.4
+        if len(found) == 1:
+            return found.pop(), 0.95
+        if len(found) > 1:
+            # Mais de uma categoria (ex.: "perder gordura e ganhar massa") → deixa o LLM decidir
+            return sorted(found)[0], 0.4
+
+        # Erros de digitação: compara cada palavra com as opções canônicas e sinônimos de uma palavra
+        single_words = {word: canonical for word, canonical in index.items() if " " not in word and len(word) >= 5}
+        for token in re.finditer(r"[a-z]{5,}", text):
+            confidence_cap = 0.4 if self._is_negated(text, token.start()) else 1.0
+            close = get_close_matches(token.group(), options, n=1, cutoff=0.8)
+            if close:
+                return close[0], min(0.85, confidence_cap)
+            close = get_close_matches(token.group(), list(single_words), n=1, cutoff=0.8)
+            if close:
+                return single_words[close[0]], min(0.7, confidence_cap)
+
+        return None, 0.0
+
+    def parse_goal(self, text: str) -> Tuple[Optional[str], float]:
+        """Objetivo: emagrecimento, hipertrofia, condicionamento ou manutencao"""
+        return self._match_choice(text, self._goal_index, list(GOAL_SYNONYMS))
+
+    def parse_training_level(self, text: str) -> Tuple[Optional[str], float]:
+        """Nível de treino; também interpreta tempo de treino ("treino há 3 anos")"""
+        match = re.search(r"\b(?:ha|faz)\s*(\d{1,2})\s*(anos?|mes(?:es)?)\b", text)
+        if match:
+            months = int(match.group(1)) * (12 if match.group(2).startswith("ano") else 1)
+            if months < 6:
+                return "iniciante", 0.85
+            if months <= 24:
+                return "intermediario", 0.85
+            return "avancado", 0.85
+
+        return self._match_choice(text, self._level_index, list(TRAINING_LEVEL_SYNONYMS))
+
+    def parse_restrictions(self, text: str) -> Tuple[Optional[Any], float]:
+        """Restrições: {} para respostas negativas; lista canônica para restrições conhecidas"""
+        cleaned = re.sub(r"[^\w\s]", "", text).strip()
+        if cleaned in NO_RESTRICTION_ANSWERS:
+            return {}, 0.95
+
+        found = []
+        negated = False
+        for keyword, restriction in KNOWN_RESTRICTIONS.items():
+            positions = [match.start() for match in re.finditer(re.escape(keyword), text)]
+            if not positions:
+                continue
+            if all(self._is_negated(text, position) for position in positions):
+                negated = True
+            elif restriction not in found:
+                found.append(restriction)
+
+        # Termo negado ("nao sou vegetariano") ou ambíguo ("como sem lactose"): o LLM decide
+        if found:
+            return ", ".join(found), 0.5 if negated else 0.85
+        if negated:
+            return {}, 0.5
+
+        return None, 0.0
+
+    def _is_negated(self, text: str, position: int) -> bool:
+        """Pista de negação nas palavras anteriores ao termo, dentro da mesma oração"""
+        clause = re.split(r"[,.;!?]|\b(?:mas|porem|e)\b", text[:position])[-1]
+        return any(word in NEGATION_CUES for word in clause.split()[-NEGATION_WINDOW:])
+
+    # ------------------------------------------------------------------
+    # Estatísticas por camada
+    # ------------------------------------------------------------------
+
+    def record_layer(self, field_name: str, layer: str) -> None:
+        """Registra qual camada resolveu o campo: deterministic, llm ou miss"""
+        field_stats = self.stats.setdefault(field_name, {"deterministic": 0, "llm": 0, "miss": 0})
+        field_stats[layer] = field_stats.get(layer, 0) + 1
+        self._total_records += 1
+
+        if self._total_records % HIT_RATE_LOG_EVERY == 0:
+            print(f"📊 ProfileExtractor: taxa de acerto por camada: {self.get_hit_rates()}")
+
+    def get_hit_rates(self) -> Dict[str, Dict[str, float]]:
+        """Proporção de extrações resolvidas por camada, por campo"""
+        rates = {}
+        for field_name, field_stats in self.stats.items():
+            total = sum(field_stats.values())
+            rates[field_name] = {
+                layer: round(count / total, 3) if total else 0.0
+                for layer, count in field_stats.items()
+            }
+            rates[field_name]["total"] = total
+        return rates
+
+
+# Instância global do extrator
+profile_extractor = ProfileFieldExtractor()
@@ -0,0 +1,212 @@
+"""
+Montagem de prompts com orçamento de tokens
+Seções com prioridade; as de menor prioridade são truncadas ou descartadas quando o total
+estimado passa do orçamento. Histórico aparece uma única vez: turnos recentes completos,
+turnos antigos reduzidos a uma linha
+"""
+
+import math
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+# Palavras e símbolos contam separadamente; palavras em português quebram em ~1,35 tokens
+_WORD_PATTERN = re.compile(r"\w+")
+_SYMBOL_PATTERN = re.compile(r"[^\w\s]")
+TOKENS_PER_WORD = 1.35
+
+# Papéis das mensagens da memória de curto prazo (direction da tabela messages)
+HISTORY_SPEAKERS = {"inbound": "Paciente", "user": "Paciente", "outbound": "Trainer", "assistant": "Trainer"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa local e rápida de tokens (sem tokenizer do provedor)"""
+    if not text:
+        return 0
+    # Palavras longas sem espaço (URLs, ids, base64) quebram em ~1 token a cada 4 caracteres
+    words = sum(max(TOKENS_PER_WORD, len(word) / 4) for word in _WORD_PATTERN.findall(text))
+    symbols = len(_SYMBOL_PATTERN.findall(text))
+    return math.ceil(words + symbols)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Corta o texto no limite estimado, em fronteira de palavra, com reticências"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    # Proporção de caracteres como ponto de partida; ajusta até caber
+    cut = int(len(text) * max_tokens / estimate_tokens(text))
+    while cut > 0:
+        candidate = text[:cut].rsplit(" ", 1)[0].rstrip() + "…"
+        if estimate_tokens(candidate) <= max_tokens:
+            return candidate
+        cut = int(cut * 0.9)
+    return ""
+
+
+def truncate_oldest_lines(text: str, max_tokens: int) -> str:
+    """
+    Corta pelo início: mantém a primeira linha (título da seção) e as linhas mais recentes,
+    descartando as mais antigas; "…" marca o corte
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    title, _, body = text.partition("\n")
+    lines = body.split("\n") if body else []
+
+    kept: List[str] = []
+    used = estimate_tokens(f"{title}\n…")
+    for line in reversed(lines):
+        line_tokens = estimate_tokens(line)
+        if used + line_tokens > max_tokens:
+            if not kept:
+                # Nem a linha mais recente cabe inteira: fica com o final dela
+                words = line.split(" ")
+                while words and used + estimate_tokens("… " + " ".join(words)) > max_tokens:
+                    words.pop(0)
+                if words:
+                    kept.append("… " + " ".join(words))
+            break
+        kept.append(line)
+        used += line_tokens
+    if not kept:
+        return ""
+    return "\n".join([title, "…", *reversed(kept)])
+
+
+def format_history(
+    short_term: List[Dict[str, Any]],
+    full_turns: int = 2,
+    full_turn_chars: int = 600,
+    older_turn_chars: int = 90,
+    max_messages: Optional[int] = None
+) -> str:
+    """
+    Histórico em ordem cronológica: os `full_turns` turnos mais recentes completos
+    (até full_turn_chars) e os anteriores reduzidos a uma linha; `max_messages` limita
+    a janela (quando há resumo da sessão cobrindo o restante)
+    """
+    messages = [message for message in short_term or [] if message.get("content")]
+    # A memória de curto prazo vem da mais recente para a mais antiga
+    messages = sorted(messages, key=lambda message: message.get("timestamp") or "")
+    if max_messages is not None:
+        messages = messages[-max_messages:] if max_messages > 0 else []
+
+    lines = []
+    for position, message in enumerate(messages):
+        speaker = HISTORY_SPEAKERS.get(message.get("role"), "Paciente")
+        content = " ".join(str(message["content"]).split())
+        limit = full_turn_chars if position >= len(messages) - full_turns else older_turn_chars
+        if len(content) > limit:
+            content = content[:limit].rsplit(" ", 1)[0] + "…"
+        lines.append(f"{speaker}: {content}")
+    return "\n".join(lines)
+
+
+class PromptAssembler:
+    """Acumula seções e monta o prompt dentro do orçamento"""
+
+    def __init__(self, budget_tokens: int, call_site: str = "unknown"):
+        self.budget_tokens = budget_tokens
+        self.call_site = call_site
+        self.sections: List[Dict[str, Any]] = []
+
+    def add(
+        self,
+        name: str,
+        text: str,
+        priority: int,
+        required: bool = False,
+        min_tokens: int = 40,
+        keep_recent: bool = False
+    ) -> None:
+        """
+        Adiciona uma seção
+
+        Args:
+            name: Rótulo da seção (log e estatísticas)
+            priority: Menor valor = mais importante (entra primeiro no orçamento)
+            required: Sempre incluída inteira, mesmo estourando o orçamento
+            min_tokens: Abaixo desse espaço restante a seção é descartada em vez de truncada
+            keep_recent: Seção em ordem cronológica (histórico): truncada pelo início, descartando
+                as linhas mais antigas
+        """
+        text = (text or "").strip()
+        if text:
+            self.sections.append({
+                "name": name, "text": text, "priority": priority, "required": required,
+                "min_tokens": min_tokens, "keep_recent": keep_recent, "order": len(self.sections)
+            })
+
+    def assemble(self) -> Tuple[str, Dict[str, Any]]:
+        """Monta o prompt (seções na ordem de inclusão) e devolve o relatório de tokens por seção"""
+        remaining = self.budget_tokens
+        report = {"sections": {}, "truncated": [], "dropped": []}
+
+        for section in sorted(self.sections, key=lambda item: (not item["required"], item["priority"], item["order"])):
+            tokens = estimate_tokens(section["text"])
+            if section["required"] or tokens <= remaining:
+                section["final"] = section["text"]
+            elif remaining >= section["min_tokens"]:
+                truncate = truncate_oldest_lines if section["keep_recent"] else truncate_to_tokens
+                section["final"] = truncate(section["text"], remaining)
+                report["truncated"].append(section["name"])
+            else:
+                section["final"] = ""
+                report["dropped"].append(section["name"])
+
+            used = estimate_tokens(section["final"])
+            remaining -= used
+            report["sections"][section["name"]] = {"original": tokens, "final": used}
+
+        text = "\n\n".join(section["final"] for section in self.sections if section["final"])
+        report["total_tokens"] = estimate_tokens(text)
+        report["budget_tokens"] = self.budget_tokens
+
+        parts = ", ".join(f"{name}={counts['final']}" for name, counts in report["sections"].items())
+        flags = ""
+        if report["truncated"]:
+            flags += f" | truncadas: {', '.join(report['truncated'])}"
+        if report["dropped"]:
+            flags += f" | descartadas: {', '.join(report['dropped'])}"
+        print(f"📐 PromptAssembler [{self.call_site}]: {report['total_tokens']}/{self.budget_tokens} tokens ({parts}){flags}")
+
+        prompt_assembly_stats.record(self.call_site, report)
+        return text, report
+
+
+class PromptAssemblyStats:
+    """Médias de tokens por seção e por ponto de chamada"""
+
+    def __init__(self):
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, call_site: str, report: Dict[str, Any]) -> None:
+        stats = self.stats.setdefault(call_site, {
+            "prompts": 0, "tokens_total": 0, "over_budget": 0, "truncations": 0, "drops": 0, "sections": {}
+        })
+        stats["prompts"] += 1
+        stats["tokens_total"] += report["total_tokens"]
+        stats["over_budget"] += int(report["total_tokens"] > report["budget_tokens"])
+        stats["truncations"] += len(report["truncated"])
+        stats["drops"] += len(report["dropped"])
+        for name, counts in report["sections"].items():
+            stats["sections"][name] = stats["sections"].get(name, 0) + counts["final"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        summary = {}
+        for call_site, stats in self.stats.items():
+            prompts = stats["prompts"] or 1
+            summary[call_site] = {
+                "prompts": stats["prompts"],
+                "avg_tokens": round(stats["tokens_total"] / prompts),
+                "over_budget": stats["over_budget"],
+                "truncations": stats["truncations"],
+                "drops": stats["drops"],
+                "avg_tokens_by_section": {name: round(total / prompts) for name, total in stats["sections"].items()}
+            }
+        return summary
+
+
+# Instância global das estatísticas de montagem
+prompt_assembly_stats = PromptAssemblyStats()
@@ -0,0 +1,138 @@
+"""
+Resumo incremental da sessão (memória de médio prazo)
+Os turnos se acumulam em memória e, a cada N turnos, um modelo rápido funde os novos turnos
+ao resumo anterior em segundo plano (depois de a resposta ter sido gerada). Os agentes usam
+o resumo no lugar do histórico bruto, então o contexto do prompt não cresce com a conversa
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+from app.services.llm_service import llm_service
+from app.services.memory import memory_manager
+
+SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string", "description": "Resumo atualizado da conversa (até 600 caracteres)"},
+        "topic": {"type": "string", "description": "Assunto atual em poucas palavras"}
+    },
+    "required": ["summary", "topic"]
+}
+
+SUMMARY_SYSTEM_PROMPT = """
+Você mantém o resumo de uma conversa entre um paciente e o SUPER PERSONAL TRAINER (nutrição e treino).
+Receberá o resumo anterior (pode estar vazio) e os turnos novos. Devolva o resumo ATUALIZADO:
+- No máximo 600 caracteres, em português, em frases curtas
+- Mantenha fatos úteis para as próximas respostas: objetivos, preferências, restrições, refeições e
+  treinos relatados, números combinados (calorias, metas), orientações já dadas e perguntas pendentes
+- Descarte cumprimentos, repetições e detalhes que não mudam as próximas respostas
+- Não invente informações que não estejam no resumo anterior ou nos turnos
+"""
+
+# Limite de caracteres de cada mensagem enviada ao resumidor
+TURN_CHARS = 500
+
+
+class SessionSummarizer:
+    """Acumula turnos por usuário e atualiza sessions.summary a cada N turnos, fora do caminho da resposta"""
+
+    def __init__(self):
+        self.enabled = os.getenv("SESSION_SUMMARY", "true").lower() != "false"
+        self.every_n_turns = int(os.getenv("SESSION_SUMMARY_EVERY_N_TURNS", "3"))
+        # Turnos pendentes guardados no máximo (falhas seguidas não crescem sem limite)
+        self.max_pending_turns = self.every_n_turns * 4
+
+        self.pending: Dict[str, List[Dict[str, str]]] = {}
+        self.running: Dict[str, asyncio.Task] = {}
+        self.stats = {"turns": 0, "runs": 0, "failures": 0, "run_ms_total": 0.0}
+
+    def record_turn(self, user_id: str, user_message: str, response: str, topic: Optional[str] = None) -> None:
+        """
+        Registra um turno (mensagem + resposta) e agenda o resumo quando há N turnos pendentes
+
+        Não bloqueia: o resumo roda em uma task separada
+        """
+        if not self.enabled or not user_id or not response:
+            return
+
+        self.stats["turns"] += 1
+        turns = self.pending.setdefault(user_id, [])
+        turns.append({"user": (user_message or "")[:TURN_CHARS], "assistant": response[:TURN_CHARS], "topic": topic or ""})
+        del turns[:-self.max_pending_turns]
+
+        if len(turns) >= self.every_n_turns and user_id not in self.running:
+            self.running[user_id] = asyncio.create_task(self._summarize(user_id))
+
+    def reset(self, user_id: str) -> None:
+        """Descarta turnos pendentes e cancela o resumo em andamento (nova sessão)"""
+        self.pending.pop(user_id, None)
+        # Um resumo da sessão anterior ainda rodando gravaria o resumo antigo na sessão nova
+        task = self.running.get(user_id)
+        if task is not None and not task.done():
+            task.cancel()
+
+    async def _summarize(self, user_id: str) -> None:
+        started = time.perf_counter()
+        turns = self.pending.pop(user_id, [])
+        try:
+            session = await memory_manager.get_active_session(user_id) or {}
+            previous = session.get("summary") or ""
+
+            transcript = "\n".join(
+                f"Paciente: {turn['user']}\nTrainer: {turn['assistant']}" for turn in turns
+            )
+            result = await llm_service.call_structured(
+                messages=[{
+                    "role": "user",
+                    "content": f"RESUMO ANTERIOR:\n{previous or '(vazio)'}\n\nTURNOS NOVOS:\n{transcript}"
+                }],
+                schema=SUMMARY_SCHEMA,
+                schema_name="resumo_sessao",
+                max_tokens=300,
+                temperature=0.2,
+                system_prompt=SUMMARY_SYSTEM_PROMPT,
+                call_site="session_summary",
+                user_id=user_id,
+                tier="summarization"
+            )
+            if result is None:
+                raise Exception("LLM não retornou resumo estruturado válido")
+
+            topic = result.get("topic") or turns[-1]["topic"]
+            await memory_manager.update_session_summary(user_id, result["summary"], topic)
+            print(f"📝 SessionSummarizer: Resumo atualizado para {user_id} ({len(turns)} turnos, {len(result['summary'])} chars)")
+            self.stats["runs"] += 1
+
+        except Exception as e:
+            # Devolve os turnos para a próxima tentativa (junto com os que chegaram nesse meio tempo)
+            self.stats["failures"] += 1
+            self.pending[user_id] = (turns + self.pending.get(user_id, []))[-self.max_pending_turns:]
+            print(f"⚠️ SessionSummarizer: Falha ao resumir sessão de {user_id}: {e}")
+
+        except asyncio.CancelledError:
+            # reset(): os turnos eram da sessão anterior e são descartados
+            print(f"🧹 SessionSummarizer: Resumo da sessão anterior de {user_id} cancelado")
+
+        finally:
+            self.stats["run_ms_total"] += (time.perf_counter() - started) * 1000
+            if self.running.get(user_id) is asyncio.current_task():
+                self.running.pop(user_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        runs = (self.stats["runs"] + self.stats["failures"]) or 1
+        return {
+            "enabled": self.enabled,
+            "every_n_turns": self.every_n_turns,
+            "turns": self.stats["turns"],
+            "runs": self.stats["runs"],
+            "failures": self.stats["failures"],
+            "avg_run_ms": round(self.stats["run_ms_total"] / runs),
+            "pending_users": len(self.pending)
+        }
+
+
+# Instância global do resumidor
+session_summarizer = SessionSummarizer()
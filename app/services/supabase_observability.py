@@ -175,6 +175,33 @@ class SupabaseObservabilityService:
             self.observability_logger.error(f"Erro ao registrar métrica: {e}")
             return False
     
+    async def log_llm_usage(
+        self,
+        call_site: str,
+        provider: str,
+        model: str,
+        usage: Dict[str, Any]
+    ) -> bool:
+        """
+        Registra agregado de uso de tokens/custo de LLM
+        """
+        try:
+            log_data = {
+                "event_type": "llm_usage",
+                "call_site": call_site,
+                "provider": provider,
+                "model": model,
+                "usage": usage,
+                "timestamp": datetime.now().isoformat()
+            }
+            
+            self.observability_logger.info(f"LLM_USAGE: {json.dumps(log_data)}")
+            return True
+            
+        except Exception as e:
+            self.observability_logger.error(f"Erro ao registrar uso de LLM: {e}")
+            return False
+    
     async def log_session_event(
         self,
         user_id: str,
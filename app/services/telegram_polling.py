@@ -0,0 +1,282 @@
+"""
+Ingestão do Telegram por long polling (getUpdates), alternativa ao webhook
+Uma conexão mantém o getUpdates aberto; cada lote retornado é processado em paralelo entre
+chats e em ordem dentro de cada chat (fotos de um mesmo álbum juntas, para o agrupamento de
+media_group_id), e o offset só avança e é gravado em disco depois do lote processado.
+Chats com álbum rodam em segundo plano (o líder do álbum espera a janela de agrupamento sem
+segurar o próximo getUpdates): fotos do mesmo álbum que chegam no lote seguinte entram no
+grupo ainda aberto e os demais updates do chat esperam o álbum terminar. Esses updates já
+estão confirmados no offset; um reinício no meio da janela perde só o álbum em andamento
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple
+
+import httpx
+
+from app.core.channels import ChannelConfig
+
+UpdateHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+def _chat_key(update: Dict[str, Any]) -> str:
+    """Chat do update (updates sem chat formam uma fila própria)"""
+    message = update.get("message") or update.get("edited_message") or {}
+    chat_id = (message.get("chat") or {}).get("id")
+    return str(chat_id) if chat_id is not None else f"update:{update.get('update_id')}"
+
+
+class TelegramPoller:
+    """Long polling de getUpdates com offset persistido e processamento em lote"""
+
+    def __init__(self):
+        # Segundos que o Telegram segura o getUpdates aberto esperando updates
+        self.poll_timeout = int(os.getenv("TELEGRAM_POLL_TIMEOUT", "30"))
+        self.batch_limit = int(os.getenv("TELEGRAM_POLL_LIMIT", "100"))
+        # Chats processados ao mesmo tempo dentro de um lote
+        self.concurrency = int(os.getenv("TELEGRAM_POLL_CONCURRENCY", "16"))
+        self.offset_path = os.getenv("TELEGRAM_OFFSET_PATH", os.path.join("logs", "telegram_offset.json"))
+        self.api_url = f"{ChannelConfig.TELEGRAM_CONFIG['api_base']}/bot{ChannelConfig.TELEGRAM_CONFIG['bot_token']}"
+
+        self.offset: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Trabalho em segundo plano por chat (álbum aguardando a janela e o que veio depois dele)
+        self._chat_tails: Dict[str, asyncio.Task] = {}
+        # media_group_id do álbum ainda aberto no fim do trabalho em segundo plano do chat
+        self._open_albums: Dict[str, str] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats = {
+            "polls": 0, "empty_polls": 0, "batches": 0, "updates": 0, "max_batch": 0,
+            "poll_errors": 0, "handler_errors": 0, "background_lanes": 0, "batch_ms_total": 0.0
+        }
+
+    def start(self, handler: UpdateHandler) -> None:
+        """Inicia o loop de polling (handler recebe cada update, como o corpo do webhook)"""
+        if self._task is not None and not self._task.done():
+            return
+        self.offset = self._load_offset()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.get_running_loop().create_task(self._run(handler))
+        print(f"📡 TelegramPoller: Long polling iniciado (offset {self.offset}, timeout {self.poll_timeout}s)")
+
+    async def stop(self) -> None:
+        """Para o polling; um lote interrompido é reentregue pelo Telegram (offset não avançou)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Álbuns em andamento já foram confirmados no offset: termina de processá-los
+        if self._chat_tails:
+            await asyncio.gather(*self._chat_tails.values(), return_exceptions=True)
+            self._chat_tails.clear()
+            self._open_albums.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ------------------------------------------------------------------
+    # Loop
+    # ------------------------------------------------------------------
+
+    async def _run(self, handler: UpdateHandler) -> None:
+        # getUpdates responde 409 enquanto houver webhook configurado
+        await self._call("deleteWebhook", {"drop_pending_updates": False})
+
+        failures = 0
+        while True:
+            updates, retry_after = await self._get_updates()
+            if updates is None:
+                failures += 1
+                delay = retry_after if retry_after is not None else min(30.0, 2 ** (failures - 1))
+                await asyncio.sleep(delay)
+                continue
+            failures = 0
+            if not updates:
+                self.stats["empty_polls"] += 1
+                continue
+
+            started = time.perf_counter()
+            await self._process_batch(updates, handler)
+
+            # Confirma o lote: o próximo getUpdates com esse offset descarta os updates no Telegram
+            self.offset = max(update["update_id"] for update in updates) + 1
+            self._save_offset()
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats["batches"] += 1
+            self.stats["updates"] += len(updates)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(updates))
+            self.stats["batch_ms_total"] += elapsed_ms
+            print(f"📡 TelegramPoller: Lote de {len(updates)} updates processado em {elapsed_ms:.0f}ms (offset {self.offset})")
+
+    async def _get_updates(self) -> Tuple[Optional[List[Dict[str, Any]]], Optional[float]]:
+        """
+        Returns:
+            (updates, retry_after): updates None em caso de erro
+        """
+        self.stats["polls"] += 1
+        payload = {"timeout": self.poll_timeout, "limit": self.batch_limit, "allowed_updates": ["message"]}
+        if self.offset is not None:
+            payload["offset"] = self.offset
+
+        try:
+            response = await self._get_client().post(f"{self.api_url}/getUpdates", json=payload)
+        except httpx.TimeoutException:
+            # Long poll sem resposta dentro do timeout do cliente: só tenta de novo
+            return [], None
+        except Exception as e:
+            self.stats["poll_errors"] += 1
+            print(f"⚠️ TelegramPoller: Erro de rede no getUpdates: {e}")
+            return None, None
+
+        if response.status_code == 200:
+            return response.json().get("result", []), None
+
+        self.stats["poll_errors"] += 1
+        retry_after = None
+        if response.status_code == 429:
+            retry_after = float(response.json().get("parameters", {}).get("retry_after", 1))
+        elif response.status_code == 409:
+            print("⚠️ TelegramPoller: Conflito no getUpdates (webhook ativo ou outra instância fazendo polling)")
+            retry_after = 5.0
+        print(f"⚠️ TelegramPoller: getUpdates HTTP {response.status_code}: {response.text[:200]}")
+        return None, retry_after
+
+    async def _process_batch(self, updates: List[Dict[str, Any]], handler: UpdateHandler) -> None:
+        """
+        Chats em paralelo (até TELEGRAM_POLL_CONCURRENCY), updates de um chat em ordem
+
+        O lote termina quando os chats sem álbum terminam; chats com álbum (ou com álbum ainda
+        pendente de um lote anterior) seguem em segundo plano, encadeados por chat
+        """
+        lanes: Dict[str, List[Tuple[Optional[str], List[Dict[str, Any]]]]] = {}
+        for update in sorted(updates, key=lambda item: item["update_id"]):
+            steps = lanes.setdefault(_chat_key(update), [])
+            media_group_id = (update.get("message") or {}).get("media_group_id")
+            # Fotos consecutivas do mesmo álbum rodam juntas: o líder do álbum espera pelas demais
+            if media_group_id and steps and steps[-1][0] == media_group_id:
+                steps[-1][1].append(update)
+            else:
+                steps.append((media_group_id, [update]))
+
+        inline = []
+        for chat, steps in lanes.items():
+            tail = self._chat_tails.get(chat)
+            if tail is not None and steps[0][0] and steps[0][0] == self._open_albums.get(chat):
+                # Continuação do álbum aberto no lote anterior: entra já no grupo (o líder ainda espera)
+                _, joined = steps.pop(0)
+                inline.append(asyncio.gather(*(self._handle(handler, update) for update in joined)))
+                if not steps:
+                    continue
+
+            if tail is None and not any(media_group_id for media_group_id, _ in steps):
+                inline.append(self._run_lane(handler, steps))
+                continue
+
+            self.stats["background_lanes"] += 1
+            task = asyncio.create_task(self._run_lane(handler, steps, after=tail))
+            task.add_done_callback(lambda done, chat=chat: self._forget_tail(chat, done))
+            self._chat_tails[chat] = task
+            if steps[-1][0]:
+                self._open_albums[chat] = steps[-1][0]
+            else:
+                self._open_albums.pop(chat, None)
+
+        await asyncio.gather(*inline)
+
+    async def _run_lane(
+        self,
+        handler: UpdateHandler,
+        steps: List[Tuple[Optional[str], List[Dict[str, Any]]]],
+        after: Optional[asyncio.Task] = None
+    ) -> None:
+        """
+        Passos de um chat em ordem, depois do trabalho anterior do mesmo chat
+
+        Álbuns ficam fora do limite de concorrência: o líder passa a maior parte do tempo
+        esperando a janela de agrupamento e ocuparia uma vaga dos demais chats
+        """
+        if after is not None:
+            await asyncio.gather(after, return_exceptions=True)
+        for media_group_id, step in steps:
+            if media_group_id:
+                await asyncio.gather(*(self._handle(handler, update) for update in step))
+                continue
+            async with self._semaphore:
+                for update in step:
+                    await self._handle(handler, update)
+
+    def _forget_tail(self, chat: str, task: asyncio.Task) -> None:
+        """Remove o trabalho em segundo plano do chat quando ele termina (se nada foi encadeado depois)"""
+        if self._chat_tails.get(chat) is task:
+            self._chat_tails.pop(chat, None)
+            self._open_albums.pop(chat, None)
+
+    async def _handle(self, handler: UpdateHandler, update: Dict[str, Any]) -> None:
+        try:
+            await handler(update)
+        except Exception as e:
+            # Um update com erro não segura o offset (seria reentregue para sempre)
+            self.stats["handler_errors"] += 1
+            print(f"❌ TelegramPoller: Erro ao processar update {update.get('update_id')}: {e}")
+
+    # ------------------------------------------------------------------
+    # Bot API e offset
+    # ------------------------------------------------------------------
+
+    async def _call(self, method: str, payload: Dict[str, Any]) -> bool:
+        try:
+            response = await self._get_client().post(f"{self.api_url}/{method}", json=payload)
+            if response.status_code == 200:
+                return True
+            print(f"⚠️ TelegramPoller: {method} HTTP {response.status_code}: {response.text[:200]}")
+        except Exception as e:
+            print(f"⚠️ TelegramPoller: Erro em {method}: {e}")
+        return False
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            # Uma conexão: o timeout de leitura cobre o tempo que o Telegram segura o long poll
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(10.0, read=self.poll_timeout + 10.0),
+                limits=httpx.Limits(max_connections=1, max_keepalive_connections=1)
+            )
+        return self._client
+
+    def _load_offset(self) -> Optional[int]:
+        try:
+            with open(self.offset_path, "r", encoding="utf-8") as offset_file:
+                return int(json.load(offset_file)["offset"])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ TelegramPoller: Erro ao ler offset de {self.offset_path}: {e}")
+            return None
+
+    def _save_offset(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.offset_path) or ".", exist_ok=True)
+            temp_path = f"{self.offset_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as offset_file:
+                json.dump({"offset": self.offset, "updated_at": time.time()}, offset_file)
+            os.replace(temp_path, self.offset_path)
+        except Exception as e:
+            print(f"⚠️ TelegramPoller: Erro ao gravar offset: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        batches = self.stats["batches"] or 1
+        return {
+            **{name: value for name, value in self.stats.items() if name != "batch_ms_total"},
+            "running": self._task is not None and not self._task.done(),
+            "offset": self.offset,
+            "avg_batch_ms": round(self.stats["batch_ms_total"] / batches),
+            "avg_batch_size": round(self.stats["updates"] / batches, 1)
+        }
+
+
+# Instância global do poller
+telegram_poller = TelegramPoller()
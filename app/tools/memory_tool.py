@@ -161,6 +161,14 @@ class MemoryTool(Tool):
         except Exception as e:
             return False
     
+    async def update_session_topic(self, user_id: str, active_topic: str) -> bool:
+        """Atualiza assunto da sessão sem tocar no resumo (médio prazo)"""
+        try:
+            await memory_manager.update_session_topic(user_id, active_topic)
+            return True
+        except Exception as e:
+            return False
+    
     async def update_user_profile(self, user_id: str, profile_data: Dict[str, Any]) -> bool:
         """Atualiza perfil do usuário (longo prazo)"""
         try:
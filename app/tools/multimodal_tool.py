@@ -3,12 +3,264 @@ Tool Multimodal para ADK (placeholder para análise de imagens)
 """
 
 import asyncio
-from typing import Dict, Any, Optional
+import os
+from typing import Dict, Any, List, Optional
 from app.adk.simple_adk import Tool
-from PIL import Image
-import io
-import base64
 from app.services.llm_service import llm_service
+from app.services.image_preprocessing import image_preprocessor, inspect_image
+from app.services.image_workers import image_worker_pool
+from app.services.image_cache import image_analysis_cache
+from app.services.llm_json import validate_schema
+from app.services.nutrition_db import nutrition_db
+
+# As instruções de cada análise vão no prompt de sistema (cacheável);
+# a mensagem do usuário leva apenas a imagem e este texto curto
+IMAGE_ANALYSIS_INSTRUCTION = "Analise a imagem anexada seguindo exatamente as instruções e o formato de saída definidos."
+
+# Prompt de classificação (compartilhado com a análise em passada única)
+CLASSIFICATION_PROMPT = """
+Você é um especialista em análise visual de imagens relacionadas à nutrição, treino e saúde.
+Sua tarefa é identificar o conteúdo principal da imagem e classificá-la em exatamente uma das categorias abaixo:
+	•	food → comida, pratos, refeições, ingredientes ou alimentos (mesmo que apareçam mãos, pés, mesas ou outros elementos secundários).
+	•	bioimpedancia → relatórios ou gráficos de composição corporal, tabelas médicas de percentual de gordura, massa magra, etc.
+	•	exercise → pessoas realizando exercícios físicos, academias ou equipamentos de treino em uso.
+	•	body → fotos corporais ou selfies de pessoas, desde que não haja comida nem prática de exercício.
+	•	label → rótulos de produtos, informações nutricionais, tabelas de ingredientes impressas em embalagens.
+	•	treino_planilha → planilhas, tabelas ou listas de treino (em papel, foto de caderno, print digital ou aplicativo).
+
+Regras de Classificação
+	1.	Se houver qualquer presença de comida/alimento → classifique como food.
+	2.	Se for relatório de composição corporal → bioimpedancia.
+	3.	Se mostrar pessoa treinando ou equipamento de treino → exercise.
+	4.	Se for uma foto de corpo/selfie sem comida → body.
+	5.	Se for rótulo ou tabela nutricional → label.
+	6.	Se for planilha ou tabela de treino (mesmo manuscrita ou digital) → treino_planilha.
+
+"""
+
+# Schemas de saída estruturada de cada análise (enviados ao provedor via LLMService.call_structured)
+_NUMBER_OR_NULL = {"type": ["number", "null"]}
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+_CONFIDENCE = {"type": "number", "minimum": 0, "maximum": 1, "description": "Grau de confiança da análise (0.0 a 1.0)"}
+_REASONING = {"type": "string", "description": "Explicação detalhada da análise realizada"}
+
+CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "enum": ["food", "bioimpedancia", "exercise", "body", "label", "treino_planilha"]},
+        "confidence": _CONFIDENCE,
+        "reasoning": {"type": "string", "description": "Explicação breve"}
+    },
+    "required": ["type", "confidence"]
+}
+
+BIOIMPEDANCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "weight_kg": {**_NUMBER_OR_NULL, "description": "Peso corporal em kg"},
+        "body_fat_percent": {**_NUMBER_OR_NULL, "description": "Percentual de gordura corporal"},
+        "muscle_mass_kg": {**_NUMBER_OR_NULL, "description": "Massa muscular em kg"},
+        "visceral_fat_level": {**_NUMBER_OR_NULL, "description": "Nível de gordura visceral (1-59)"},
+        "basal_metabolic_rate": {**_NUMBER_OR_NULL, "description": "Taxa metabólica basal em kcal"},
+        "hydration_percent": {**_NUMBER_OR_NULL, "description": "Percentual de hidratação"},
+        "bone_mass_kg": {**_NUMBER_OR_NULL, "description": "Massa óssea em kg"},
+        "date": {"type": "string", "description": "Data do exame (DD/MM/YYYY) ou \"unknown\""},
+        "confidence": _CONFIDENCE,
+        "analysis_method": {"type": "string", "enum": ["llm_analysis"]},
+        "reasoning": _REASONING
+    },
+    "required": ["weight_kg", "body_fat_percent", "muscle_mass_kg", "date", "confidence", "analysis_method", "reasoning"]
+}
+
+# O LLM só identifica alimentos e porções; calorias e macros vêm da base nutricional local
+FOOD_ITEMS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "food_items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "Nome do alimento em português (ex.: \"arroz branco\", \"frango grelhado\")"},
+                    "quantity_grams": {**_NUMBER_OR_NULL, "description": "Quantidade estimada em gramas (null se impossível estimar)"}
+                },
+                "required": ["name", "quantity_grams"]
+            }
+        },
+        "confidence": _CONFIDENCE,
+        "reasoning": _REASONING
+    },
+    "required": ["food_items", "confidence", "reasoning"]
+}
+
+_LEVEL = {"type": "string", "enum": ["iniciante", "intermediário", "avançado", "indeterminado"]}
+
+EXERCISE_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "exercise_name": {"type": "string"},
+        "muscle_groups": _STRING_LIST,
+        "execution_analysis": {
+            "type": "object",
+            "properties": {
+                "form_score": {"type": "number", "minimum": 1, "maximum": 10},
+                "posture_notes": {"type": "string"},
+                "technique_notes": {"type": "string"}
+            },
+            "required": ["form_score", "posture_notes", "technique_notes"]
+        },
+        "suggestions": _STRING_LIST,
+        "safety_notes": {"type": "string"},
+        "difficulty_level": _LEVEL,
+        "equipment_needed": {"type": "string"},
+        "confidence": _CONFIDENCE,
+        "reasoning": _REASONING
+    },
+    "required": ["exercise_name", "muscle_groups", "execution_analysis", "suggestions", "safety_notes", "confidence"]
+}
+
+BODY_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "body_composition": {
+            "type": "object",
+            "properties": {
+                "muscle_definition": {"type": "string", "enum": ["baixa", "média", "alta"]},
+                "body_fat_estimate": {"type": "string", "enum": ["baixo", "médio", "alto"]},
+                "overall_condition": {"type": "string"}
+            },
+            "required": ["muscle_definition", "body_fat_estimate", "overall_condition"]
+        },
+        "development_areas": _STRING_LIST,
+        "diet_suggestions": _STRING_LIST,
+        "training_suggestions": _STRING_LIST,
+        "positive_notes": {"type": "string"},
+        "confidence": _CONFIDENCE,
+        "reasoning": _REASONING
+    },
+    "required": ["body_composition", "development_areas", "diet_suggestions", "training_suggestions", "positive_notes", "confidence"]
+}
+
+LABEL_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "product_name": {"type": "string"},
+        "nutritional_info": {
+            "type": "object",
+            "properties": {
+                "calories_per_serving": _NUMBER_OR_NULL,
+                "protein": {"type": "string"},
+                "carbs": {"type": "string"},
+                "fat": {"type": "string"},
+                "sugar": {"type": "string"},
+                "sodium": {"type": "string"},
+                "fiber": {"type": "string"}
+            },
+            "required": ["calories_per_serving", "protein", "carbs", "fat"]
+        },
+        "serving_size": {"type": "string"},
+        "ingredients": _STRING_LIST,
+        "health_notes": _STRING_LIST,
+        "red_flags": _STRING_LIST,
+        "overall_rating": {"type": "string", "enum": ["ruim", "regular", "bom", "excelente"]},
+        "confidence": _CONFIDENCE,
+        "reasoning": _REASONING
+    },
+    "required": ["product_name", "nutritional_info", "serving_size", "health_notes", "overall_rating", "confidence"]
+}
+
+WORKOUT_SHEET_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "workout_type": {"type": "string"},
+        "exercises": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "sets": _NUMBER_OR_NULL,
+                    "reps": {"type": "string"},
+                    "weight": {"type": "string"},
+                    "notes": {"type": "string"}
+                },
+                "required": ["name", "sets", "reps"]
+            }
+        },
+        "workout_structure": {
+            "type": "object",
+            "properties": {
+                "total_exercises": {"type": "number"},
+                "estimated_duration": {"type": "string"},
+                "difficulty_level": _LEVEL
+            },
+            "required": ["total_exercises", "estimated_duration", "difficulty_level"]
+        },
+        "progression_notes": {"type": "string"},
+        "suggestions": _STRING_LIST,
+        "overall_assessment": {"type": "string"},
+        "confidence": _CONFIDENCE,
+        "reasoning": _REASONING
+    },
+    "required": ["workout_type", "exercises", "workout_structure", "suggestions", "overall_assessment", "confidence"]
+}
+
+# Schema de cada classe de imagem (bloco preenchido na análise em passada única)
+ANALYSIS_SCHEMAS_BY_CLASS = {
+    "food": FOOD_ITEMS_SCHEMA,
+    "bioimpedancia": BIOIMPEDANCE_SCHEMA,
+    "exercise": EXERCISE_ANALYSIS_SCHEMA,
+    "body": BODY_ANALYSIS_SCHEMA,
+    "label": LABEL_ANALYSIS_SCHEMA,
+    "treino_planilha": WORKOUT_SHEET_SCHEMA,
+}
+
+# Classificação + extração em uma chamada: "analysis" traz só o bloco da classe detectada
+COMBINED_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        **CLASSIFICATION_SCHEMA["properties"],
+        "analysis": {
+            "type": "object",
+            "description": "Preencha apenas a chave igual ao campo type",
+            "properties": ANALYSIS_SCHEMAS_BY_CLASS
+        }
+    },
+    "required": ["type", "confidence", "analysis"]
+}
+
+COMBINED_ANALYSIS_PROMPT = CLASSIFICATION_PROMPT + """
+Depois de classificar, faça a análise completa da imagem no campo `analysis`, preenchendo
+APENAS o bloco cuja chave é a categoria escolhida em `type` (ex.: type = "food" → analysis.food).
+
+Instruções por categoria:
+- food: liste cada alimento separadamente, com nome simples em português e quantidade estimada
+  em gramas (na dúvida, escolha a porção maior). NÃO calcule calorias nem macros: os valores
+  nutricionais são calculados pelo sistema a partir da lista.
+- bioimpedancia: use os valores exatos do relatório nas unidades padrão (kg, %, kcal); valores
+  ilegíveis ficam null e a data ilegível fica "unknown". `analysis_method` = "llm_analysis".
+- exercise: identifique o exercício, músculos trabalhados, nota de execução (1-10), postura,
+  técnica, sugestões e cuidados de segurança.
+- body: avalie composição corporal de forma respeitosa e construtiva, com áreas a desenvolver e
+  sugestões de dieta e treino.
+- label: transcreva a tabela nutricional por porção, ingredientes, pontos de atenção
+  (açúcar, sódio, gordura) e dê uma avaliação geral.
+- treino_planilha: transcreva cada exercício com séries, repetições e carga, estime duração e
+  nível, e sugira melhorias.
+
+Em todos os casos inclua `confidence` (0.0 a 1.0) e `reasoning`. Imagem borrada ou ilegível
+deve ter confiança baixa (0.1-0.3).
+"""
+
+# Mensagem do usuário quando várias imagens chegam juntas (álbum do Telegram)
+ALBUM_ANALYSIS_INSTRUCTION = (
+    "As {count} imagens anexadas foram enviadas juntas na mesma mensagem. Trate-as como um conjunto: "
+    "escolha a categoria que descreve o conjunto e produza uma única análise consolidada "
+    "(ex.: some todos os alimentos das fotos; junte frente e verso ou páginas do mesmo relatório)."
+)
+
+# Chave do resultado de cada análise separada (extract_bioimpedance_data usa "data")
+ANALYSIS_RESULT_KEYS = {"bioimpedancia": "data"}
 
 class MultimodalTool(Tool):
     """Tool multimodal para análise de imagens"""
@@ -18,6 +270,8 @@ class MultimodalTool(Tool):
             name="multimodal_tool",
             description="Analisa imagens para classificação e extração de dados"
         )
+        # Classificação e análise na mesma chamada de visão (false volta às duas chamadas)
+        self.single_pass_enabled = os.getenv("IMAGE_SINGLE_PASS_ANALYSIS", "true").lower() != "false"
     
     async def execute(self, *args, **kwargs):
         """Implementação do método abstrato execute"""
@@ -28,25 +282,17 @@ class MultimodalTool(Tool):
         Classifica tipo de imagem (bioimpedância, alimentos, etc.)
         """
         try:
-            # Placeholder: análise básica da imagem
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Análise básica de dimensões e formato
-            width, height = image.size
-            format_type = image.format
+            # Análise básica de dimensões e formato (decodificação fora do event loop)
+            image_info = await image_worker_pool.run("inspect", inspect_image, image_data)
             
-            # Placeholder para classificação real
-            classification = await self._placeholder_classify(image, image_type)
+            # Classificação precisa de pouca resolução
+            prepared = await image_preprocessor.prepare(image_data, "classification")
+            classification = await self._placeholder_classify(image_info, image_type, prepared["data_url"])
             
             return {
                 "success": True,
                 "classification": classification,
-                "image_info": {
-                    "width": width,
-                    "height": height,
-                    "format": format_type,
-                    "size_bytes": len(image_data)
-                },
+                "image_info": image_info,
                 "confidence": classification.get("confidence", 0.5)
             }
             
@@ -57,6 +303,146 @@ class MultimodalTool(Tool):
                 "classification": {"type": "unknown", "confidence": 0.0}
             }
     
+    async def classify_and_analyze(self, image_data: bytes, image_type: str = "unknown") -> Dict[str, Any]:
+        """
+        Classifica e analisa a imagem em uma única chamada de visão
+        
+        Returns:
+            Mesmo formato de classify_image, mais "analysis_result" no formato da análise
+            separada da classe (ex.: analyze_food_image) ou None quando o bloco da classe
+            veio ausente/inválido e a análise separada precisa ser feita
+        """
+        try:
+            image_info = await image_worker_pool.run("inspect", inspect_image, image_data)
+        except Exception:
+            image_info = None
+        
+        # Imagem repetida (ou quase igual): reaproveita classificação e análise anteriores
+        fingerprint = await image_analysis_cache.fingerprint(image_data)
+        cached = image_analysis_cache.get(fingerprint, "classify_and_analyze")
+        if cached is not None:
+            return {
+                "success": True,
+                "classification": cached["classification"],
+                "image_info": cached["image_info"],
+                "confidence": cached["confidence"],
+                "analysis_result": cached["analysis_result"],
+                "cache_hit": True
+            }
+        
+        if not self.single_pass_enabled or image_info is None:
+            classification = await self.classify_image(image_data, image_type)
+            return {**classification, "analysis_result": None}
+        
+        try:
+            # Resolução intermediária: a classe (e o detalhe necessário) ainda é desconhecida
+            prepared = await image_preprocessor.prepare(image_data, "combined")
+            result = await llm_service.call_structured(
+                messages=[{
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": IMAGE_ANALYSIS_INSTRUCTION},
+                        {"type": "image_url", "image_url": {"url": prepared["data_url"]}}
+                    ]
+                }],
+                schema=COMBINED_ANALYSIS_SCHEMA,
+                schema_name="classificacao_e_analise_imagem",
+                max_tokens=900,
+                temperature=0.1,
+                system_prompt=COMBINED_ANALYSIS_PROMPT,
+                call_site="multimodal.classify_and_analyze",
+                tier="image_analysis"
+            )
+        except Exception as e:
+            print(f"❌ Erro na análise em passada única: {e}")
+            result = None
+        
+        if result is None:
+            # Sem resposta estruturada: caminho antigo (classificação + análise separadas)
+            print("⚠️ MultimodalTool: Passada única falhou, usando classificação separada")
+            classification = await self.classify_image(image_data, image_type)
+            return {**classification, "analysis_result": None}
+        
+        combined = self._build_combined_result(result, image_info)
+        if combined["analysis_result"] is not None:
+            image_analysis_cache.set(fingerprint, "classify_and_analyze", {
+                "image_class": combined["classification"]["type"],
+                **{key: combined[key] for key in ("classification", "image_info", "confidence", "analysis_result")}
+            })
+        return combined
+    
+    async def classify_and_analyze_batch(self, images: List[bytes], image_type: str = "unknown") -> Dict[str, Any]:
+        """
+        Classifica e analisa um álbum (várias imagens da mesma mensagem) em uma única chamada de visão
+        
+        As imagens são tratadas como um conjunto: pratos de uma mesma refeição somados, páginas
+        de um mesmo relatório consolidadas. Mesmo retorno de classify_and_analyze; se a chamada
+        falhar, analisa apenas a primeira imagem pelo fluxo normal.
+        """
+        if len(images) == 1 or not self.single_pass_enabled:
+            return await self.classify_and_analyze(images[0], image_type)
+        
+        try:
+            image_info = await image_worker_pool.run("inspect", inspect_image, images[0])
+            prepared_images = await asyncio.gather(*[image_preprocessor.prepare(image, "combined") for image in images])
+            result = await llm_service.call_structured(
+                messages=[{
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": ALBUM_ANALYSIS_INSTRUCTION.format(count=len(images))},
+                        *[{"type": "image_url", "image_url": {"url": prepared["data_url"]}} for prepared in prepared_images]
+                    ]
+                }],
+                schema=COMBINED_ANALYSIS_SCHEMA,
+                schema_name="classificacao_e_analise_imagem",
+                max_tokens=1200,
+                temperature=0.1,
+                system_prompt=COMBINED_ANALYSIS_PROMPT,
+                call_site="multimodal.classify_and_analyze_album",
+                tier="image_analysis"
+            )
+        except Exception as e:
+            print(f"❌ Erro na análise do álbum: {e}")
+            result = None
+        
+        if result is None:
+            print(f"⚠️ MultimodalTool: Análise do álbum falhou, analisando só a primeira de {len(images)} imagens")
+            return await self.classify_and_analyze(images[0], image_type)
+        
+        return self._build_combined_result(result, {**image_info, "image_count": len(images)})
+    
+    def _build_combined_result(self, result: Dict[str, Any], image_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Separa classificação e bloco da classe detectada da resposta combinada"""
+        image_class = result["type"]
+        classification = {key: result[key] for key in ("type", "confidence", "reasoning") if key in result}
+        analysis = (result.get("analysis") or {}).get(image_class)
+        
+        # O schema combinado não obriga o bloco da classe detectada: valida aqui
+        errors = validate_schema(analysis, ANALYSIS_SCHEMAS_BY_CLASS[image_class]) if isinstance(analysis, dict) else ["bloco ausente"]
+        if errors:
+            print(f"⚠️ MultimodalTool: Bloco '{image_class}' inválido na passada única ({errors[:3]}), análise separada será feita")
+            analysis_result = None
+        else:
+            print(f"✅ MultimodalTool: Classificação e análise em passada única ({image_class}, {result['confidence']:.1%})")
+            if image_class == "food":
+                # O LLM só listou alimentos e porções: calorias e macros pela tabela local
+                analysis = nutrition_db.compute(analysis["food_items"], analysis.get("confidence", 0.7), analysis.get("reasoning", ""))
+            elif image_class == "label":
+                analysis = nutrition_db.annotate_label(analysis)
+            analysis_result = {
+                "success": True,
+                ANALYSIS_RESULT_KEYS.get(image_class, "analysis"): analysis,
+                "confidence": analysis.get("confidence", 0.7)
+            }
+        
+        return {
+            "success": True,
+            "classification": classification,
+            "image_info": image_info,
+            "confidence": result["confidence"],
+            "analysis_result": analysis_result
+        }
+    
     async def extract_bioimpedance_data(self, image_data: bytes) -> Dict[str, Any]:
         """
         Extrai dados de relatório de bioimpedância usando LLM
@@ -65,12 +451,11 @@ class MultimodalTool(Tool):
             print(f"📊 MultimodalTool: Iniciando análise de bioimpedância...")
             print(f"📊 Tamanho da imagem: {len(image_data)} bytes")
             
-            # Converte imagem para base64 para envio ao LLM
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            print(f"🔄 MultimodalTool: Imagem convertida para base64 ({len(image_base64)} caracteres)")
+            # Orientação, tamanho e formato ajustados ao tipo de análise
+            prepared = await image_preprocessor.prepare(image_data, "bioimpedancia")
             
             # Analisa usando LLM
-            analysis = await self._analyze_bioimpedance_with_llm(image_base64)
+            analysis = await self._analyze_bioimpedance_with_llm(prepared["data_url"])
             
             print(f"✅ MultimodalTool: Análise de bioimpedância finalizada com sucesso!")
             print(f"📋 Resultado final: {analysis}")
@@ -97,12 +482,11 @@ class MultimodalTool(Tool):
             print(f"🍽️ MultimodalTool: Iniciando análise de imagem de comida...")
             print(f"📊 Tamanho da imagem: {len(image_data)} bytes")
             
-            # Converte imagem para base64 para envio ao LLM
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            print(f"🔄 MultimodalTool: Imagem convertida para base64 ({len(image_base64)} caracteres)")
+            # Orientação, tamanho e formato ajustados ao tipo de análise
+            prepared = await image_preprocessor.prepare(image_data, "food")
             
             # Analisa usando LLM da Anthropic
-            analysis = await self._analyze_food_with_llm(image_base64)
+            analysis = await self._analyze_food_with_llm(prepared["data_url"])
             
             print(f"✅ MultimodalTool: Análise de comida finalizada com sucesso!")
             print(f"📋 Resultado final: {analysis}")
@@ -131,12 +515,11 @@ class MultimodalTool(Tool):
             print(f"💪 MultimodalTool: Iniciando análise de imagem de exercício...")
             print(f"📊 Tamanho da imagem: {len(image_data)} bytes")
             
-            # Converte imagem para base64 para envio ao LLM
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            print(f"🔄 MultimodalTool: Imagem convertida para base64 ({len(image_base64)} caracteres)")
+            # Orientação, tamanho e formato ajustados ao tipo de análise
+            prepared = await image_preprocessor.prepare(image_data, "exercise")
             
             # Analisa usando LLM
-            analysis = await self._analyze_exercise_with_llm(image_base64)
+            analysis = await self._analyze_exercise_with_llm(prepared["data_url"])
             
             print(f"✅ MultimodalTool: Análise de exercício finalizada com sucesso!")
             print(f"📋 Resultado final: {analysis}")
@@ -163,12 +546,11 @@ class MultimodalTool(Tool):
             print(f"👤 MultimodalTool: Iniciando análise de imagem corporal...")
             print(f"📊 Tamanho da imagem: {len(image_data)} bytes")
             
-            # Converte imagem para base64 para envio ao LLM
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            print(f"🔄 MultimodalTool: Imagem convertida para base64 ({len(image_base64)} caracteres)")
+            # Orientação, tamanho e formato ajustados ao tipo de análise
+            prepared = await image_preprocessor.prepare(image_data, "body")
             
             # Analisa usando LLM
-            analysis = await self._analyze_body_with_llm(image_base64)
+            analysis = await self._analyze_body_with_llm(prepared["data_url"])
             
             print(f"✅ MultimodalTool: Análise corporal finalizada com sucesso!")
             print(f"📋 Resultado final: {analysis}")
@@ -195,12 +577,14 @@ class MultimodalTool(Tool):
             print(f"🏷️ MultimodalTool: Iniciando análise de rótulo nutricional...")
             print(f"📊 Tamanho da imagem: {len(image_data)} bytes")
             
-            # Converte imagem para base64 para envio ao LLM
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            print(f"🔄 MultimodalTool: Imagem convertida para base64 ({len(image_base64)} caracteres)")
+            # Orientação, tamanho e formato ajustados ao tipo de análise
+            prepared = await image_preprocessor.prepare(image_data, "label")
             
             # Analisa usando LLM
-            analysis = await self._analyze_label_with_llm(image_base64)
+            analysis = await self._analyze_label_with_llm(prepared["data_url"])
+            
+            # Alimento equivalente da tabela local para comparação (busca fuzzy pelo nome do produto)
+            analysis = nutrition_db.annotate_label(analysis)
             
             print(f"✅ MultimodalTool: Análise de rótulo finalizada com sucesso!")
             print(f"📋 Resultado final: {analysis}")
@@ -227,12 +611,11 @@ class MultimodalTool(Tool):
             print(f"📋 MultimodalTool: Iniciando análise de planilha de treino...")
             print(f"📊 Tamanho da imagem: {len(image_data)} bytes")
             
-            # Converte imagem para base64 para envio ao LLM
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            print(f"🔄 MultimodalTool: Imagem convertida para base64 ({len(image_base64)} caracteres)")
+            # Orientação, tamanho e formato ajustados ao tipo de análise
+            prepared = await image_preprocessor.prepare(image_data, "treino_planilha")
             
             # Analisa usando LLM
-            analysis = await self._analyze_treino_planilha_with_llm(image_base64)
+            analysis = await self._analyze_treino_planilha_with_llm(prepared["data_url"])
             
             print(f"✅ MultimodalTool: Análise de planilha finalizada com sucesso!")
             print(f"📋 Resultado final: {analysis}")
@@ -251,86 +634,43 @@ class MultimodalTool(Tool):
                 "analysis": {}
             }
     
-    async def _placeholder_classify(self, image: Image.Image, image_type: str) -> Dict[str, Any]:
+    async def _placeholder_classify(self, image_info: Dict[str, Any], image_type: str, image_url: str) -> Dict[str, Any]:
         """
         Classificação robusta de imagem usando LLM
         """
         try:
-            # Converte imagem para base64 para análise com LLM
-            import base64
-            img_buffer = io.BytesIO()
-            image.save(img_buffer, format='JPEG', quality=85)
-            img_base64 = base64.b64encode(img_buffer.getvalue()).decode()
-            
             # Prompt robusto para classificação
-            prompt = f"""
-Você é um especialista em análise visual de imagens relacionadas à nutrição, treino e saúde.
-Sua tarefa é identificar o conteúdo principal da imagem e classificá-la em exatamente uma das categorias abaixo:
-	•	food → comida, pratos, refeições, ingredientes ou alimentos (mesmo que apareçam mãos, pés, mesas ou outros elementos secundários).
-	•	bioimpedancia → relatórios ou gráficos de composição corporal, tabelas médicas de percentual de gordura, massa magra, etc.
-	•	exercise → pessoas realizando exercícios físicos, academias ou equipamentos de treino em uso.
-	•	body → fotos corporais ou selfies de pessoas, desde que não haja comida nem prática de exercício.
-	•	label → rótulos de produtos, informações nutricionais, tabelas de ingredientes impressas em embalagens.
-	•	treino_planilha → planilhas, tabelas ou listas de treino (em papel, foto de caderno, print digital ou aplicativo).
-
-Regras de Classificação
-	1.	Se houver qualquer presença de comida/alimento → classifique como food.
-	2.	Se for relatório de composição corporal → bioimpedancia.
-	3.	Se mostrar pessoa treinando ou equipamento de treino → exercise.
-	4.	Se for uma foto de corpo/selfie sem comida → body.
-	5.	Se for rótulo ou tabela nutricional → label.
-	6.	Se for planilha ou tabela de treino (mesmo manuscrita ou digital) → treino_planilha.
-
-Saída esperada
-
-Responda apenas com a categoria final:
-food, bioimpedancia, exercise, body, label, ou treino_planilha.
-
-⸻
-
-RESPONDA APENAS COM JSON:
-{{
-    "type": "categoria_principal",
-    "confidence": 0.8,
-    "reasoning": "explicação_breve"
-}}
-"""
+            prompt = CLASSIFICATION_PROMPT
             
             # Usa LLM para classificação robusta
-            response = await llm_service.call_with_fallback(
+            classification = await llm_service.call_structured(
                 messages=[
                     {
                         "role": "user", 
                         "content": [
-                            {"type": "text", "text": prompt},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"}}
+                            {"type": "text", "text": IMAGE_ANALYSIS_INSTRUCTION},
+                            {"type": "image_url", "image_url": {"url": image_url}}
                         ]
                     }
                 ],
+                schema=CLASSIFICATION_SCHEMA,
+                schema_name="classificacao_imagem",
                 max_tokens=200,
-                temperature=0.1
+                temperature=0.1,
+                system_prompt=prompt,
+                call_site="multimodal.classify",
+                tier="image_classification"
             )
             
-            # Extrai JSON da resposta
-            import json
-            try:
-                if "```json" in response:
-                    response = response.split("```json")[1].split("```")[0]
-                elif "```" in response:
-                    response = response.split("```")[1].split("```")[0]
-                
-                classification = json.loads(response.strip())
-                return classification
-                
-            except json.JSONDecodeError:
-                # Fallback se não conseguir parsear JSON
+            if classification is None:
+                # Fallback se nenhum provedor retornar classificação válida
                 return {"type": "food", "confidence": 0.6, "reasoning": "LLM response parse error"}
+            return classification
                 
         except Exception as e:
             print(f"❌ Erro na classificação LLM: {e}")
             # Fallback para classificação básica
-            width, height = image.size
-            aspect_ratio = width / height
+            aspect_ratio = image_info["width"] / image_info["height"]
             
             if image_type == "bioimpedancia":
                 return {"type": "bioimpedancia", "confidence": 0.8}
@@ -351,7 +691,7 @@ RESPONDA APENAS COM JSON:
                 else:  # Quadrado ou pouco horizontal/vertical
                     return {"type": "food", "confidence": 0.4}
     
-    async def _analyze_bioimpedance_with_llm(self, image_base64: str) -> Dict[str, Any]:
+    async def _analyze_bioimpedance_with_llm(self, image_url: str) -> Dict[str, Any]:
         """
         Analisa imagem de relatório de bioimpedância usando LiteLLM
         """
@@ -362,11 +702,10 @@ Analise cuidadosamente a **imagem de relatório de bioimpedância** e extraia to
 **Regras obrigatórias para a análise**:
 1. Identifique todos os valores numéricos relacionados à composição corporal.
 2. Use os valores exatos mostrados na imagem quando possível.
-3. Se um valor não estiver visível ou legível, use "unknown" e faça estimativa conservadora.
+3. Se um valor não estiver visível ou legível, faça estimativa conservadora ou use null.
 4. Sempre inclua um campo `"confidence"` entre 0.0 e 1.0 para indicar o grau de confiança da análise.
-5. Retorne **apenas** um JSON válido (nenhum texto fora do JSON).
-6. Inclua o campo `"analysis_method": "llm_analysis"` fixo.
-7. Inclua o campo `"reasoning"` com explicação detalhada da análise realizada.
+5. Inclua o campo `"analysis_method": "llm_analysis"` fixo.
+6. Inclua o campo `"reasoning"` com explicação detalhada da análise realizada.
 
 **CAMPOS OBRIGATÓRIOS PARA EXTRAIR**:
 - `weight_kg`: Peso corporal em kg
@@ -378,32 +717,6 @@ Analise cuidadosamente a **imagem de relatório de bioimpedância** e extraia to
 - `bone_mass_kg`: Massa óssea em kg
 - `date`: Data do exame (formato DD/MM/YYYY)
 
-**IMPORTANTE - FORMATO JSON OBRIGATÓRIO**:
-- Use apenas aspas duplas (")
-- NUNCA use vírgulas finais após o último item de arrays ou objetos
-- Todos os números devem ser números, não strings
-- Certifique-se de que o JSON está bem formado
-- Evite caracteres especiais ou quebras de linha dentro de strings
-- SEMPRE termine com } (chave de fechamento)
-- SEMPRE termine arrays com ] (colchete de fechamento)
-- Exemplo de estrutura correta:
-
-```json
-{
-  "weight_kg": 70.5,
-  "body_fat_percent": 15.2,
-  "muscle_mass_kg": 58.3,
-  "visceral_fat_level": 8,
-  "basal_metabolic_rate": 1650,
-  "hydration_percent": 60.1,
-  "bone_mass_kg": 2.8,
-  "date": "15/12/2024",
-  "confidence": 0.8,
-  "analysis_method": "llm_analysis",
-  "reasoning": "Identifiquei claramente todos os valores principais do relatório de bioimpedância"
-}
-```
-
 **ESTRATÉGIA DE ESTIMATIVA CONSERVADORA**:
 - **Peso**: Se não conseguir ler, estime baseado no contexto visual
 - **Gordura corporal**: Se não conseguir ler, use estimativa conservadora baseada no visual
@@ -416,118 +729,51 @@ Analise cuidadosamente a **imagem de relatório de bioimpedância** e extraia to
 - Se houver múltiplas medições, use a mais recente ou principal
 - Se valores estiverem em diferentes unidades, converta para as unidades padrão
 - Se a imagem estiver borrada ou ilegível, indique baixa confiança (0.1-0.3)
-
-Retorne apenas o JSON válido, sem texto adicional.
 """
             
             # Usa LiteLLM para análise multimodal com formato compatível
-            response = await llm_service.call_with_fallback(
+            analysis = await llm_service.call_structured(
                 messages=[{
                     "role": "user",
                     "content": [
                         {
                             "type": "text",
-                            "text": prompt
+                            "text": IMAGE_ANALYSIS_INSTRUCTION
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
+                                "url": image_url
                             }
                         }
                     ]
                 }],
+                schema=BIOIMPEDANCE_SCHEMA,
+                schema_name="analise_bioimpedancia",
                 max_tokens=500,
-                temperature=0.1
+                temperature=0.1,
+                system_prompt=prompt,
+                call_site="multimodal.bioimpedance"
             )
             
-            # Log da resposta bruta do LLM
-            print(f"📊 MultimodalTool: Resposta bruta do LLM para análise de bioimpedância:")
-            print(f"📝 Resposta: {response[:500]}...")
+            if analysis is None:
+                raise Exception("LLM não retornou análise estruturada válida")
+            
+            # Log do resultado da análise
+            print(f"✅ MultimodalTool: Análise de bioimpedância concluída com sucesso!")
+            print(f"📊 Peso: {analysis.get('weight_kg', 'N/A')} kg")
+            print(f"📊 Gordura corporal: {analysis.get('body_fat_percent', 'N/A')}%")
+            print(f"📊 Massa muscular: {analysis.get('muscle_mass_kg', 'N/A')} kg")
+            print(f"📊 Gordura visceral: {analysis.get('visceral_fat_level', 'N/A')}")
+            print(f"📊 Taxa metabólica: {analysis.get('basal_metabolic_rate', 'N/A')} kcal")
+            print(f"📊 Hidratação: {analysis.get('hydration_percent', 'N/A')}%")
+            print(f"📊 Massa óssea: {analysis.get('bone_mass_kg', 'N/A')} kg")
+            print(f"📅 Data: {analysis.get('date', 'N/A')}")
+            print(f"📈 Confiança: {analysis.get('confidence', 0):.1%}")
+            print(f"🔧 Método: {analysis.get('analysis_method', 'unknown')}")
+            print(f"🧠 Reasoning: {analysis.get('reasoning', 'Não fornecido')}")
             
-            # Extrai JSON da resposta com limpeza robusta
-            import json
-            import re
-            
-            # Limpa a resposta removendo texto antes e depois do JSON
-            cleaned_response = response.strip()
-            
-            # Remove possíveis markdown ou texto extra
-            if "```json" in cleaned_response:
-                cleaned_response = cleaned_response.split("```json")[1].split("```")[0]
-            elif "```" in cleaned_response:
-                cleaned_response = cleaned_response.split("```")[1].split("```")[0]
-            
-            # Procura por JSON na resposta usando múltiplas estratégias
-            json_str = None
-            
-            # Estratégia 1: Procura por JSON completo
-            json_match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-            
-            # Estratégia 2: Se não encontrou, tenta encontrar o primeiro { até o último }
-            if not json_str:
-                start_idx = cleaned_response.find('{')
-                end_idx = cleaned_response.rfind('}')
-                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                    json_str = cleaned_response[start_idx:end_idx+1]
-            
-            if json_str:
-                # Limpa o JSON de possíveis caracteres problemáticos
-                json_str = json_str.strip()
-                
-                # Remove vírgulas finais problemáticas
-                json_str = re.sub(r',\s*}', '}', json_str)
-                json_str = re.sub(r',\s*]', ']', json_str)
-                
-                # Verifica se o JSON está completo
-                open_braces = json_str.count('{')
-                close_braces = json_str.count('}')
-                open_brackets = json_str.count('[')
-                close_brackets = json_str.count(']')
-                
-                # Se o JSON está incompleto, tenta completar
-                if open_braces > close_braces:
-                    missing_braces = open_braces - close_braces
-                    json_str += '}' * missing_braces
-                
-                if open_brackets > close_brackets:
-                    missing_brackets = open_brackets - close_brackets
-                    json_str += ']' * missing_brackets
-                
-                # Log do JSON limpo para debug
-                print(f"🔍 MultimodalTool: JSON extraído e limpo:")
-                print(f"📝 JSON: {json_str[:300]}...")
-                
-                try:
-                    analysis = json.loads(json_str)
-                    
-                    # Log do resultado da análise
-                    print(f"✅ MultimodalTool: Análise de bioimpedância concluída com sucesso!")
-                    print(f"📊 Peso: {analysis.get('weight_kg', 'N/A')} kg")
-                    print(f"📊 Gordura corporal: {analysis.get('body_fat_percent', 'N/A')}%")
-                    print(f"📊 Massa muscular: {analysis.get('muscle_mass_kg', 'N/A')} kg")
-                    print(f"📊 Gordura visceral: {analysis.get('visceral_fat_level', 'N/A')}")
-                    print(f"📊 Taxa metabólica: {analysis.get('basal_metabolic_rate', 'N/A')} kcal")
-                    print(f"📊 Hidratação: {analysis.get('hydration_percent', 'N/A')}%")
-                    print(f"📊 Massa óssea: {analysis.get('bone_mass_kg', 'N/A')} kg")
-                    print(f"📅 Data: {analysis.get('date', 'N/A')}")
-                    print(f"📈 Confiança: {analysis.get('confidence', 0):.1%}")
-                    print(f"🔧 Método: {analysis.get('analysis_method', 'unknown')}")
-                    print(f"🧠 Reasoning: {analysis.get('reasoning', 'Não fornecido')}")
-                    
-                    return analysis
-                    
-                except json.JSONDecodeError as json_error:
-                    print(f"❌ MultimodalTool: Erro ao parsear JSON: {json_error}")
-                    print(f"❌ MultimodalTool: JSON problemático: {json_str}")
-                    print(f"❌ MultimodalTool: Resposta original: {response[:500]}...")
-                    raise Exception(f"JSON inválido retornado pelo LLM: {str(json_error)}")
-            else:
-                print(f"❌ MultimodalTool: Resposta não contém JSON válido")
-                print(f"📝 Resposta completa: {response}")
-                raise Exception("Resposta não contém JSON válido")
+            return analysis
                     
         except Exception as e:
             print(f"❌ Erro na análise LLM: {e}")
@@ -546,7 +792,7 @@ Retorne apenas o JSON válido, sem texto adicional.
                 "reasoning": f"Erro na análise LLM: {str(e)}"
             }
     
-    async def _analyze_food_with_llm(self, image_base64: str) -> Dict[str, Any]:
+    async def _analyze_food_with_llm(self, image_url: str) -> Dict[str, Any]:
         """
         Analisa imagem de comida usando LiteLLM
         """
@@ -555,219 +801,59 @@ Retorne apenas o JSON válido, sem texto adicional.
 Analise cuidadosamente a **imagem enviada de comida** e identifique todos os alimentos visíveis.  
 
 **Regras obrigatórias para a análise**:  
-1. Liste cada alimento identificado em `"food_items"`.  
-2.	Para cada alimento, estime a quantidade aproximada em gramas usando faixas comuns de porções (ex.: 50g, 100g, 150g, 200g).
+1. Liste cada alimento identificado em `"food_items"`, um item por alimento (ex.: arroz, feijão e frango são 3 itens).  
+2. Use nomes simples em português, como em tabelas nutricionais (ex.: "arroz branco", "feijão carioca", "frango grelhado").  
+3.	Para cada alimento, estime a quantidade aproximada em gramas usando faixas comuns de porções (ex.: 50g, 100g, 150g, 200g).
 	•	**SEMPRE ESTIME PARA CIMA**: Se houver dúvida entre duas quantidades, escolha a maior.
-	•	Se não for possível estimar, use "quantity_grams": "unknown" e faça estimativas conservadoras de calorias e macros.
-3. Use tabelas nutricionais padrão (USDA, TACO ou equivalentes) como referência para calcular calorias e macronutrientes.  
-4. Some os valores de cada item para calcular o **total** (campo `"estimated_calories"` e `"macronutrients"`).  
-5. Se não conseguir identificar claramente um alimento, use `"unknown"` e faça uma estimativa conservadora.  
-6. **ESTIMATIVA CONSERVADORA**: Sempre arredonde calorias e macronutrientes para cima quando houver dúvida.
-7. Sempre inclua um campo `"confidence"` entre 0.0 e 1.0 para indicar o grau de confiança da análise.  
-8. Retorne **apenas** um JSON válido (nenhum texto fora do JSON).  
-9. Inclua o campo `"analysis_method": "llm_analysis"` fixo.
-
-**IMPORTANTE - FORMATO JSON OBRIGATÓRIO:**
-- Use apenas aspas duplas (")
-- NUNCA use vírgulas finais após o último item de arrays ou objetos
-- Todos os números devem ser números, não strings
-- Certifique-se de que o JSON está bem formado
-- Evite caracteres especiais ou quebras de linha dentro de strings
-- SEMPRE termine com } (chave de fechamento)
-- SEMPRE termine arrays com ] (colchete de fechamento)
-- Exemplo de estrutura correta:
-
-```json
-{
-  "food_items": [
-    {
-      "name": "arroz branco",
-      "quantity_grams": 150,
-      "calories": 200,
-      "protein": 4,
-      "carbs": 45,
-      "fat": 0.5
-    },
-    {
-      "name": "frango grelhado",
-      "quantity_grams": 120,
-      "calories": 200,
-      "protein": 30,
-      "carbs": 0,
-      "fat": 8
-    },
-    {
-      "name": "feijão",
-      "quantity_grams": 100,
-      "calories": 130,
-      "protein": 8,
-      "carbs": 20,
-      "fat": 1
-    }
-  ],
-  "estimated_calories": 530,
-  "calorie_range": {
-    "min": 530,
-    "max": 689
-  },
-  "macronutrients": {
-    "protein": 42,
-    "carbs": 65,
-    "fat": 9.5
-  },
-  "confidence": 0.8,
-  "analysis_method": "llm_analysis",
-  "reasoning": "Identifiquei claramente arroz branco, frango grelhado e feijão no prato"
-}
-```
-
-**ESTRATÉGIA DE ESTIMATIVA CONSERVADORA:**
-- **Quantidade**: Se não tiver certeza se é 100g ou 150g, escolha 150g
-- **Calorias**: Se calcular 180 kcal, arredonde para 200 kcal
-- **Proteína**: Se calcular 22g, arredonde para 25g
-- **Carboidratos**: Se calcular 45g, arredonde para 50g
-- **Gordura**: Se calcular 8g, arredonde para 10g
-- **Princípio**: É melhor superestimar do que subestimar valores nutricionais
+	•	Se não for possível estimar, use "quantity_grams": null.
+4. **NÃO calcule calorias nem macronutrientes**: os valores nutricionais são calculados pelo sistema a partir da lista.  
+5. Se não houver alimento identificável na imagem, retorne `"food_items": []`.  
+6. Sempre inclua um campo `"confidence"` entre 0.0 e 1.0 para indicar o grau de confiança da identificação.  
 
-**CÁLCULO DO RANGE DE CALORIAS CONSERVADOR:**
-- **Min**: Use o valor calculado como mínimo (não reduza)
-- **Max**: Adicione 20-30% ao valor calculado para o máximo
-- **Exemplo**: Se calcular 400 kcal → min: 400, max: 520 (400 + 30%)
-- **Exemplo**: Se calcular 250 kcal → min: 250, max: 325 (250 + 30%)
-- **Princípio**: O range deve ser conservador, sempre incluindo margem de segurança
-
-### Estrutura de saída obrigatória:
-```json
-{
-  "food_items": [
-    {
-      "name": "alimento_identificado",
-      "quantity_grams": número_em_gramas,
-      "calories": número_calorias,
-      "protein": gramas_proteina,
-      "carbs": gramas_carboidratos,
-      "fat": gramas_gordura
-    }
-  ],
-  "estimated_calories": total_de_calorias,
-  "calorie_range": {
-    "min": valor_mínimo_conservador,
-    "max": valor_máximo_conservador
-  },
-  "macronutrients": {
-    "protein": total_proteina,
-    "carbs": total_carboidratos,
-    "fat": total_gordura
-  },
-  "confidence": 0.0_a_1.0,
-  "analysis_method": "llm_analysis",
-  "reasoning": "explicação_detalhada_da_análise_realizada"
-}"""
+"""
             
             # Usa LiteLLM para análise multimodal com formato compatível
-            response = await llm_service.call_with_fallback(
+            analysis = await llm_service.call_structured(
                 messages=[{
                     "role": "user",
                     "content": [
                         {
                             "type": "text",
-                            "text": prompt
+                            "text": IMAGE_ANALYSIS_INSTRUCTION
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
+                                "url": image_url
                             }
                         }
                     ]
                 }],
-                max_tokens=500,
-                temperature=0.1
+                schema=FOOD_ITEMS_SCHEMA,
+                schema_name="itens_refeicao",
+                max_tokens=300,
+                temperature=0.1,
+                system_prompt=prompt,
+                call_site="multimodal.food"
             )
             
-            # Log da resposta bruta do LLM
-            print(f"🍽️ MultimodalTool: Resposta bruta do LLM para análise de comida:")
-            print(f"📝 Resposta: {response[:500]}...")
-            
-            # Extrai JSON da resposta com limpeza robusta
-            import json
-            import re
-            
-            # Limpa a resposta removendo texto antes e depois do JSON
-            cleaned_response = response.strip()
-            
-            # Remove possíveis markdown ou texto extra
-            if "```json" in cleaned_response:
-                cleaned_response = cleaned_response.split("```json")[1].split("```")[0]
-            elif "```" in cleaned_response:
-                cleaned_response = cleaned_response.split("```")[1].split("```")[0]
+            if analysis is None:
+                raise Exception("LLM não retornou análise estruturada válida")
             
-            # Procura por JSON na resposta usando múltiplas estratégias
-            json_str = None
+            # Calorias e macros calculados localmente a partir dos itens e porções
+            analysis = nutrition_db.compute(analysis["food_items"], analysis.get("confidence", 0.7), analysis.get("reasoning", ""))
             
-            # Estratégia 1: Procura por JSON completo
-            json_match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
+            # Log do resultado da análise
+            print(f"✅ MultimodalTool: Análise de comida concluída com sucesso!")
+            print(f"🍽️ Alimentos identificados: {analysis.get('food_items', [])}")
+            print(f"🔥 Calorias estimadas: {analysis.get('estimated_calories', 0)} kcal")
+            print(f"📊 Range de calorias: {analysis.get('calorie_range', {}).get('min', 0)}-{analysis.get('calorie_range', {}).get('max', 0)} kcal")
+            print(f"🥩 Macronutrientes: {analysis.get('macronutrients', {})}")
+            print(f"📈 Confiança: {analysis.get('confidence', 0):.1%}")
+            print(f"🔧 Método: {analysis.get('analysis_method', 'unknown')}")
+            print(f"🧠 Reasoning: {analysis.get('reasoning', 'Não fornecido')}")
             
-            # Estratégia 2: Se não encontrou, tenta encontrar o primeiro { até o último }
-            if not json_str:
-                start_idx = cleaned_response.find('{')
-                end_idx = cleaned_response.rfind('}')
-                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                    json_str = cleaned_response[start_idx:end_idx+1]
-            
-            if json_str:
-                # Limpa o JSON de possíveis caracteres problemáticos
-                json_str = json_str.strip()
-                
-                # Remove vírgulas finais problemáticas
-                json_str = re.sub(r',\s*}', '}', json_str)
-                json_str = re.sub(r',\s*]', ']', json_str)
-                
-                # Verifica se o JSON está completo
-                open_braces = json_str.count('{')
-                close_braces = json_str.count('}')
-                open_brackets = json_str.count('[')
-                close_brackets = json_str.count(']')
-                
-                # Se o JSON está incompleto, tenta completar
-                if open_braces > close_braces:
-                    missing_braces = open_braces - close_braces
-                    json_str += '}' * missing_braces
-                
-                if open_brackets > close_brackets:
-                    missing_brackets = open_brackets - close_brackets
-                    json_str += ']' * missing_brackets
-                
-                # Log do JSON limpo para debug
-                print(f"🔍 MultimodalTool: JSON extraído e limpo:")
-                print(f"📝 JSON: {json_str[:300]}...")
-                
-                try:
-                    analysis = json.loads(json_str)
-                    
-                    # Log do resultado da análise
-                    print(f"✅ MultimodalTool: Análise de comida concluída com sucesso!")
-                    print(f"🍽️ Alimentos identificados: {analysis.get('food_items', [])}")
-                    print(f"🔥 Calorias estimadas: {analysis.get('estimated_calories', 0)} kcal")
-                    print(f"📊 Range de calorias: {analysis.get('calorie_range', {}).get('min', 0)}-{analysis.get('calorie_range', {}).get('max', 0)} kcal")
-                    print(f"🥩 Macronutrientes: {analysis.get('macronutrients', {})}")
-                    print(f"📈 Confiança: {analysis.get('confidence', 0):.1%}")
-                    print(f"🔧 Método: {analysis.get('analysis_method', 'unknown')}")
-                    print(f"🧠 Reasoning: {analysis.get('reasoning', 'Não fornecido')}")
-                    
-                    return analysis
-                    
-                except json.JSONDecodeError as json_error:
-                    print(f"❌ MultimodalTool: Erro ao parsear JSON: {json_error}")
-                    print(f"❌ MultimodalTool: JSON problemático: {json_str}")
-                    print(f"❌ MultimodalTool: Resposta original: {response[:500]}...")
-                    raise Exception(f"JSON inválido retornado pelo LLM: {str(json_error)}")
-            else:
-                print(f"❌ MultimodalTool: Resposta não contém JSON válido")
-                print(f"📝 Resposta completa: {response}")
-                raise Exception("Resposta não contém JSON válido")
+            return analysis
                     
         except Exception as e:
             print(f"❌ Erro na análise LLM: {e}")
@@ -806,7 +892,7 @@ Analise cuidadosamente a **imagem enviada de comida** e identifique todos os ali
             "analysis_method": "placeholder"
         }
     
-    async def _analyze_exercise_with_llm(self, image_base64: str) -> Dict[str, Any]:
+    async def _analyze_exercise_with_llm(self, image_url: str) -> Dict[str, Any]:
         """
         Analisa imagem de exercício usando LLM
         """
@@ -823,56 +909,26 @@ INSTRUÇÕES:
 5. Sugira melhorias ou ajustes
 6. Considere segurança e eficácia
 
-ESTRUTURA DE SAÍDA OBRIGATÓRIA:
-```json
-{{
-  "exercise_name": "nome_do_exercício",
-  "muscle_groups": ["músculo_1", "músculo_2"],
-  "execution_analysis": {{
-    "form_score": 1_a_10,
-    "posture_notes": "observações_sobre_postura",
-    "technique_notes": "observações_sobre_técnica"
-  }},
-  "suggestions": [
-    "sugestão_1",
-    "sugestão_2",
-    "sugestão_3"
-  ],
-  "safety_notes": "observações_de_segurança",
-  "difficulty_level": "iniciante/intermediário/avançado",
-  "equipment_needed": "equipamento_necessário",
-  "confidence": 0.0_a_1.0,
-  "reasoning": "explicação_detalhada_da_análise"
-}}"""
+"""
             
-            response = await llm_service.call_with_fallback(
+            analysis = await llm_service.call_structured(
                 messages=[{
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                        {"type": "text", "text": IMAGE_ANALYSIS_INSTRUCTION},
+                        {"type": "image_url", "image_url": {"url": image_url}}
                     ]
                 }],
+                schema=EXERCISE_ANALYSIS_SCHEMA,
+                schema_name="analise_exercicio",
                 max_tokens=800,
-                temperature=0.1
+                temperature=0.1,
+                system_prompt=prompt,
+                call_site="multimodal.exercise"
             )
             
-            # Extrai JSON da resposta
-            import json
-            import re
-            
-            cleaned_response = response.strip()
-            if "```json" in cleaned_response:
-                cleaned_response = cleaned_response.split("```json")[1].split("```")[0]
-            elif "```" in cleaned_response:
-                cleaned_response = cleaned_response.split("```")[1].split("```")[0]
-            
-            # Remove texto antes e depois do JSON
-            json_match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
-            if json_match:
-                cleaned_response = json_match.group(0)
-            
-            analysis = json.loads(cleaned_response.strip())
+            if analysis is None:
+                raise Exception("LLM não retornou análise estruturada válida")
             return analysis
             
         except Exception as e:
@@ -893,7 +949,7 @@ ESTRUTURA DE SAÍDA OBRIGATÓRIA:
                 "reasoning": f"Erro na análise LLM: {str(e)[:100]}"
             }
     
-    async def _analyze_body_with_llm(self, image_base64: str) -> Dict[str, Any]:
+    async def _analyze_body_with_llm(self, image_url: str) -> Dict[str, Any]:
         """
         Analisa imagem corporal usando LLM
         """
@@ -910,59 +966,26 @@ INSTRUÇÕES:
 5. Foque em saúde e bem-estar
 6. Evite comentários negativos ou críticos
 
-ESTRUTURA DE SAÍDA OBRIGATÓRIA:
-```json
-{{
-  "body_composition": {{
-    "muscle_definition": "baixa/média/alta",
-    "body_fat_estimate": "baixo/médio/alto",
-    "overall_condition": "descrição_geral"
-  }},
-  "development_areas": [
-    "área_1",
-    "área_2",
-    "área_3"
-  ],
-  "diet_suggestions": [
-    "sugestão_dieta_1",
-    "sugestão_dieta_2"
-  ],
-  "training_suggestions": [
-    "sugestão_treino_1",
-    "sugestão_treino_2"
-  ],
-  "positive_notes": "observações_positivas",
-  "confidence": 0.0_a_1.0,
-  "reasoning": "explicação_detalhada_da_análise"
-}}"""
+"""
             
-            response = await llm_service.call_with_fallback(
+            analysis = await llm_service.call_structured(
                 messages=[{
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                        {"type": "text", "text": IMAGE_ANALYSIS_INSTRUCTION},
+                        {"type": "image_url", "image_url": {"url": image_url}}
                     ]
                 }],
+                schema=BODY_ANALYSIS_SCHEMA,
+                schema_name="analise_corporal",
                 max_tokens=600,
-                temperature=0.1
+                temperature=0.1,
+                system_prompt=prompt,
+                call_site="multimodal.body"
             )
             
-            # Extrai JSON da resposta
-            import json
-            import re
-            
-            cleaned_response = response.strip()
-            if "```json" in cleaned_response:
-                cleaned_response = cleaned_response.split("```json")[1].split("```")[0]
-            elif "```" in cleaned_response:
-                cleaned_response = cleaned_response.split("```")[1].split("```")[0]
-            
-            json_match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
-            if json_match:
-                cleaned_response = json_match.group(0)
-            
-            analysis = json.loads(cleaned_response.strip())
+            if analysis is None:
+                raise Exception("LLM não retornou análise estruturada válida")
             return analysis
             
         except Exception as e:
@@ -981,7 +1004,7 @@ ESTRUTURA DE SAÍDA OBRIGATÓRIA:
                 "reasoning": f"Erro na análise LLM: {str(e)[:100]}"
             }
     
-    async def _analyze_label_with_llm(self, image_base64: str) -> Dict[str, Any]:
+    async def _analyze_label_with_llm(self, image_url: str) -> Dict[str, Any]:
         """
         Analisa imagem de rótulo nutricional usando LLM
         """
@@ -997,58 +1020,26 @@ INSTRUÇÕES:
 4. Sugira alternativas se necessário
 5. Foque nos aspectos mais relevantes para saúde
 
-ESTRUTURA DE SAÍDA OBRIGATÓRIA:
-```json
-{{
-  "product_name": "nome_do_produto",
-  "nutritional_info": {{
-    "calories_per_serving": número,
-    "protein": "valor_proteína",
-    "carbs": "valor_carboidratos",
-    "fat": "valor_gordura",
-    "sugar": "valor_açúcar",
-    "sodium": "valor_sódio",
-    "fiber": "valor_fibras"
-  }},
-  "serving_size": "tamanho_da_porção",
-  "ingredients": ["ingrediente_1", "ingrediente_2"],
-  "health_notes": [
-    "nota_saúde_1",
-    "nota_saúde_2"
-  ],
-  "red_flags": ["ponto_atencao_1", "ponto_atencao_2"],
-  "overall_rating": "ruim/regular/bom/excelente",
-  "confidence": 0.0_a_1.0,
-  "reasoning": "explicação_detalhada_da_análise"
-}}"""
+"""
             
-            response = await llm_service.call_with_fallback(
+            analysis = await llm_service.call_structured(
                 messages=[{
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                        {"type": "text", "text": IMAGE_ANALYSIS_INSTRUCTION},
+                        {"type": "image_url", "image_url": {"url": image_url}}
                     ]
                 }],
+                schema=LABEL_ANALYSIS_SCHEMA,
+                schema_name="analise_rotulo",
                 max_tokens=700,
-                temperature=0.1
+                temperature=0.1,
+                system_prompt=prompt,
+                call_site="multimodal.label"
             )
             
-            # Extrai JSON da resposta
-            import json
-            import re
-            
-            cleaned_response = response.strip()
-            if "```json" in cleaned_response:
-                cleaned_response = cleaned_response.split("```json")[1].split("```")[0]
-            elif "```" in cleaned_response:
-                cleaned_response = cleaned_response.split("```")[1].split("```")[0]
-            
-            json_match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
-            if json_match:
-                cleaned_response = json_match.group(0)
-            
-            analysis = json.loads(cleaned_response.strip())
+            if analysis is None:
+                raise Exception("LLM não retornou análise estruturada válida")
             return analysis
             
         except Exception as e:
@@ -1073,7 +1064,7 @@ ESTRUTURA DE SAÍDA OBRIGATÓRIA:
                 "reasoning": f"Erro na análise LLM: {str(e)[:100]}"
             }
     
-    async def _analyze_treino_planilha_with_llm(self, image_base64: str) -> Dict[str, Any]:
+    async def _analyze_treino_planilha_with_llm(self, image_url: str) -> Dict[str, Any]:
         """
         Analisa imagem de planilha de treino usando LLM
         """
@@ -1090,61 +1081,26 @@ INSTRUÇÕES:
 5. Sugira melhorias se necessário
 6. Identifique o tipo de treino (força, hipertrofia, etc.)
 
-ESTRUTURA DE SAÍDA OBRIGATÓRIA:
-```json
-{{
-  "workout_type": "tipo_de_treino",
-  "exercises": [
-    {{
-      "name": "nome_exercício",
-      "sets": número_séries,
-      "reps": "número_repetições",
-      "weight": "carga_peso",
-      "notes": "observações_adicionais"
-    }}
-  ],
-  "workout_structure": {{
-    "total_exercises": número,
-    "estimated_duration": "tempo_estimado",
-    "difficulty_level": "iniciante/intermediário/avançado"
-  }},
-  "progression_notes": "observações_sobre_progressão",
-  "suggestions": [
-    "sugestão_1",
-    "sugestão_2"
-  ],
-  "overall_assessment": "avaliação_geral",
-  "confidence": 0.0_a_1.0,
-  "reasoning": "explicação_detalhada_da_análise"
-}}"""
+"""
             
-            response = await llm_service.call_with_fallback(
+            analysis = await llm_service.call_structured(
                 messages=[{
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                        {"type": "text", "text": IMAGE_ANALYSIS_INSTRUCTION},
+                        {"type": "image_url", "image_url": {"url": image_url}}
                     ]
                 }],
+                schema=WORKOUT_SHEET_SCHEMA,
+                schema_name="analise_planilha_treino",
                 max_tokens=1000,
-                temperature=0.1
+                temperature=0.1,
+                system_prompt=prompt,
+                call_site="multimodal.treino_planilha"
             )
             
-            # Extrai JSON da resposta
-            import json
-            import re
-            
-            cleaned_response = response.strip()
-            if "```json" in cleaned_response:
-                cleaned_response = cleaned_response.split("```json")[1].split("```")[0]
-            elif "```" in cleaned_response:
-                cleaned_response = cleaned_response.split("```")[1].split("```")[0]
-            
-            json_match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
-            if json_match:
-                cleaned_response = json_match.group(0)
-            
-            analysis = json.loads(cleaned_response.strip())
+            if analysis is None:
+                raise Exception("LLM não retornou análise estruturada válida")
             return analysis
             
         except Exception as e:
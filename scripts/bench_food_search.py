@@ -0,0 +1,148 @@
+"""
+Benchmark do índice de n-gramas de nomes de alimentos (app/services/food_search.py)
+
+Uso:
+    python scripts/bench_food_search.py
+    python scripts/bench_food_search.py --synthetic 50000 --repeat 5
+    python scripts/bench_food_search.py --save logs/food_index.npz
+
+Indexa os nomes e aliases de app/data/food_composition.csv (opcionalmente expandidos com
+variações sintéticas até N documentos, para simular tabelas TACO/USDA completas), consulta
+nomes com e sem acento, plural e erros de digitação e compara com a varredura linear
+(similaridade de n-gramas calculada documento a documento). Com --save grava o artefato
+pré-construído usado por NUTRITION_INDEX_PATH (só vale para a tabela real, sem --synthetic).
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.food_search import NgramIndex, char_ngrams
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "data", "food_composition.csv")
+
+# Modificadores usados para gerar nomes sintéticos plausíveis
+MODIFIERS = ["light", "integral", "caseiro", "temperado", "assado", "cozido", "cru", "congelado", "orgânico",
+             "zero lactose", "com sal", "sem sal", "tradicional", "diet", "recheado", "defumado", "ralado"]
+BRANDS = ["marca a", "marca b", "da fazenda", "do chef", "premium", "fit", "da casa", "artesanal"]
+
+# (consulta, nome esperado na tabela) – com acento, sem acento, plural e erros de digitação
+QUERIES = [
+    ("arroz branco", "arroz branco cozido"), ("feijao carioca", "feijão carioca cozido"),
+    ("frango grelhado", "peito de frango grelhado"), ("batatas fritas", "batata frita"),
+    ("feijão carioka", "feijão carioca cozido"), ("arros integral", "arroz integral cozido"),
+    ("frnago grelhado", "peito de frango grelhado"), ("macarão a bolonhesa", "macarrão à bolonhesa"),
+    ("pao frances", "pão francês"), ("ovos cozidos", "ovo cozido"), ("file de tilapia", "peixe grelhado"),
+    ("brocolis no vapor", "brócolis cozido"), ("iogurtes gregos", "iogurte grego"),
+    ("queijo mussarela", "queijo mussarela"), ("pure de batatas", "purê de batata"),
+    ("suco de laranja natural", "suco de laranja"), ("banana prata", "banana"),
+    ("whey protein chocolate", "whey protein"), ("açai com granola", "açaí na tigela"),
+    ("strogonoff de frango", "estrogonofe de frango")
+]
+
+
+def load_documents(path):
+    """Nome e aliases de cada alimento da tabela, com o nome canônico correspondente"""
+    documents, names = [], []
+    with open(path, "r", encoding="utf-8") as table_file:
+        for row in csv.DictReader(table_file):
+            for phrase in [row["name"], *[alias for alias in row["aliases"].split("|") if alias.strip()]]:
+                documents.append(phrase)
+                names.append(row["name"])
+    return documents, names
+
+
+def expand_synthetic(documents, names, size, seed=7):
+    """Completa até `size` documentos com variações (modificador + marca) dos nomes reais"""
+    rng = random.Random(seed)
+    documents, names = list(documents), list(names)
+    base = list(zip(documents, names))
+    while len(documents) < size:
+        document, name = rng.choice(base)
+        documents.append(f"{document} {rng.choice(MODIFIERS)} {rng.choice(BRANDS)} {len(documents)}")
+        names.append(name)
+    return documents, names
+
+
+def linear_search(query, document_grams):
+    """Referência: cosseno de n-gramas (sem IDF) documento a documento"""
+    query_grams = char_ngrams(query)
+    query_norm = sum(count * count for count in query_grams.values()) ** 0.5 or 1.0
+    best, best_score = -1, 0.0
+    for document_id, (grams, norm) in enumerate(document_grams):
+        overlap = sum(count * grams.get(gram, 0) for gram, count in query_grams.items())
+        score = overlap / (query_norm * norm)
+        if score > best_score:
+            best, best_score = document_id, score
+    return best, best_score
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do índice de n-gramas de alimentos")
+    parser.add_argument("--table", default=TABLE_PATH)
+    parser.add_argument("--synthetic", type=int, default=0, help="Total de documentos com variações sintéticas")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--save", default=None, help="Grava o artefato .npz do índice")
+    args = parser.parse_args()
+
+    documents, names = load_documents(args.table)
+    if args.synthetic:
+        documents, names = expand_synthetic(documents, names, args.synthetic)
+
+    started = time.perf_counter()
+    index = NgramIndex.build(documents, NgramIndex.signature_for(documents))
+    build_ms = (time.perf_counter() - started) * 1000
+    index_bytes = index.offsets.nbytes + index.postings.nbytes + index.weights.nbytes + index.idf.nbytes
+    print(f"📥 {len(documents)} documentos, {len(index.vocabulary)} n-gramas, {len(index.postings)} postings")
+    print(f"🔨 Construção: {build_ms:.0f}ms, arrays: {index_bytes / 1024:.0f} KiB")
+
+    if args.save:
+        if args.synthetic:
+            print("⚠️ --save ignorado com --synthetic (o artefato precisa corresponder à tabela real)")
+        else:
+            started = time.perf_counter()
+            index.save(args.save)
+            path = args.save if args.save.endswith(".npz") else f"{args.save}.npz"
+            loaded = NgramIndex.load(path)
+            print(f"💾 Artefato {path}: gravação+carga {(time.perf_counter() - started) * 1000:.0f}ms, "
+                  f"{os.path.getsize(path) / 1024:.0f} KiB, assinatura ok={loaded.signature == index.signature}")
+
+    # Acurácia: nome canônico do melhor documento
+    hits = 0
+    print("\n🔎 Consultas:")
+    for query, expected in QUERIES:
+        document_id, score = index.search(query)[0]
+        hit = names[document_id] == expected
+        hits += hit
+        print(f"   {'✅' if hit else '❌'} {query:<26} → {documents[document_id]:<32} ({score:.2f})")
+    print(f"   acerto: {hits}/{len(QUERIES)}")
+
+    # Latência do índice
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for query, _ in QUERIES:
+            index.search(query)
+    index_us = (time.perf_counter() - started) / (args.repeat * len(QUERIES)) * 1_000_000
+
+    # Latência da varredura linear (uma passada basta: é ordens de grandeza mais lenta)
+    document_grams = []
+    for document in documents:
+        grams = char_ngrams(document)
+        document_grams.append((grams, sum(count * count for count in grams.values()) ** 0.5 or 1.0))
+    started = time.perf_counter()
+    for query, _ in QUERIES:
+        linear_search(query, document_grams)
+    linear_us = (time.perf_counter() - started) / len(QUERIES) * 1_000_000
+
+    print(f"\n⏱️ NgramIndex.search   {index_us:10.1f} µs/consulta")
+    print(f"⏱️ varredura linear    {linear_us:10.1f} µs/consulta")
+    print(f"   speedup: {linear_us / index_us:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
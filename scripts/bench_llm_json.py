@@ -0,0 +1,129 @@
+"""
+Benchmark do parser de JSON de respostas do LLM contra o pipeline antigo
+
+Uso:
+    python scripts/bench_llm_json.py
+    python scripts/bench_llm_json.py --corpus logs/llm_json_failures.jsonl --repeat 500
+
+O corpus é um JSONL com {"call_site", "response"} (respostas reais, inclusive malformadas).
+Compara taxa de sucesso e tempo do pipeline antigo (remove ```json, regex gulosa, regex de
+vírgula final, contagem de chaves) com LLMJSONParser.parse.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.llm_json import LLMJSONParser
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "data", "llm_json_corpus.jsonl")
+
+
+def legacy_parse(response):
+    """Pipeline copiado de MultimodalTool._analyze_*_with_llm (versão mais completa)"""
+    cleaned_response = response.strip()
+    if "```json" in cleaned_response:
+        cleaned_response = cleaned_response.split("```json")[1].split("```")[0]
+    elif "```" in cleaned_response:
+        cleaned_response = cleaned_response.split("```")[1].split("```")[0]
+
+    json_match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
+    if not json_match:
+        raise ValueError("sem JSON")
+    json_str = json_match.group().strip()
+    json_str = re.sub(r',\s*}', '}', json_str)
+    json_str = re.sub(r',\s*]', ']', json_str)
+
+    if json_str.count('{') > json_str.count('}'):
+        json_str += '}' * (json_str.count('{') - json_str.count('}'))
+    if json_str.count('[') > json_str.count(']'):
+        json_str += ']' * (json_str.count('[') - json_str.count(']'))
+    return json.loads(json_str)
+
+
+def load_corpus(path):
+    with open(path, "r", encoding="utf-8") as corpus_file:
+        return [json.loads(line) for line in corpus_file if line.strip()]
+
+
+def run(label, function, corpus, repeat):
+    successes = defaultdict(int)
+    totals = defaultdict(int)
+    for row in corpus:
+        totals[row["call_site"]] += 1
+        try:
+            function(row["response"])
+            successes[row["call_site"]] += 1
+        except Exception:
+            pass
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for row in corpus:
+            try:
+                function(row["response"])
+            except Exception:
+                pass
+    per_response_us = (time.perf_counter() - start) / (repeat * len(corpus)) * 1_000_000
+
+    total_ok = sum(successes.values())
+    print(f"\n📊 {label}: {total_ok}/{len(corpus)} respostas aproveitadas, {per_response_us:.1f} µs/resposta")
+    for call_site in sorted(totals):
+        print(f"   {call_site:<32} {successes[call_site]}/{totals[call_site]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do parser de JSON do LLM")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    print(f"📥 {len(corpus)} respostas no corpus")
+
+    run("pipeline antigo", legacy_parse, corpus, args.repeat)
+
+    json_parser = LLMJSONParser()
+    # Silencia os logs por chamada durante a medição
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        results = {}
+        for row in corpus:
+            try:
+                json_parser.parse(row["response"], row["call_site"])
+            except Exception:
+                pass
+        results = json_parser.get_stats()
+        new_parser = LLMJSONParser()
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for row in corpus:
+                try:
+                    new_parser.parse(row["response"], row["call_site"])
+                except Exception:
+                    pass
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    ok = sum(stats["direct"] + stats["repaired"] for stats in results.values())
+    per_response_us = elapsed / (args.repeat * len(corpus)) * 1_000_000
+    print(f"\n📊 LLMJSONParser: {ok}/{len(corpus)} respostas aproveitadas, {per_response_us:.1f} µs/resposta")
+    for call_site in sorted(results):
+        stats = results[call_site]
+        print(
+            f"   {call_site:<32} {stats['direct'] + stats['repaired']}/{stats['calls']} "
+            f"(diretas={stats['direct']} reparadas={stats['repaired']}) {stats['repairs']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Teste de carga do long polling do Telegram (app/services/telegram_polling.py) contra uma
+Bot API fake local
+
+Uso:
+    python scripts/bench_telegram_polling.py
+    python scripts/bench_telegram_polling.py --updates 5000 --chats 200 --handler-ms 50
+
+Sobe um servidor FastAPI em 127.0.0.1 imitando getUpdates/deleteWebhook (updates gerados
+para N chats, com álbuns), aponta TELEGRAM_API_BASE para ele e roda o TelegramPoller com um
+handler que só espera --handler-ms (o líder de cada álbum espera ainda --album-window-ms,
+como o MediaGroupCollector). Confere a ordem por chat, fotos de álbum que chegaram depois do
+grupo fechar, a vazão e que o offset gravado retoma sem reprocessar updates.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+OFFSET_PATH = os.path.join(tempfile.mkdtemp(prefix="telegram_poll_"), "offset.json")
+
+
+def build_updates(total, chats, seed=7):
+    """Updates de texto e álbuns de 3 fotos, intercalados entre chats"""
+    rng = random.Random(seed)
+    updates, update_id, message_id = [], 1000, 1
+    while len(updates) < total:
+        chat_id = rng.randint(1, chats)
+        album = rng.random() < 0.05
+        for position in range(3 if album else 1):
+            message = {"message_id": message_id, "chat": {"id": chat_id}, "from": {"id": chat_id}, "date": int(time.time())}
+            if album:
+                message["media_group_id"] = f"album-{update_id}"
+                message["photo"] = [{"file_id": f"photo-{message_id}"}]
+            else:
+                message["text"] = f"mensagem {message_id}"
+            updates.append({"update_id": update_id, "message": message})
+            update_id += 1
+            message_id += 1
+    return updates
+
+
+def create_fake_api(updates):
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+    state = {"polls": 0, "confirmed": 0}
+
+    @app.post("/bot{token}/deleteWebhook")
+    async def delete_webhook(token: str):
+        return {"ok": True, "result": True}
+
+    @app.post("/bot{token}/getUpdates")
+    async def get_updates(token: str, request: Request):
+        body = await request.json()
+        state["polls"] += 1
+        offset = body.get("offset") or 0
+        # Como na Bot API: o offset confirma (descarta) os updates anteriores
+        state["confirmed"] = max(state["confirmed"], offset)
+        pending = [update for update in updates if update["update_id"] >= offset][:body.get("limit", 100)]
+        if not pending:
+            await asyncio.sleep(min(body.get("timeout", 0), 0.2))
+        return {"ok": True, "result": pending}
+
+    return app, state
+
+
+async def run(args):
+    os.environ["TELEGRAM_API_BASE"] = f"http://127.0.0.1:{args.port}"
+    os.environ["TELEGRAM_BOT_TOKEN"] = "bench"
+    os.environ["TELEGRAM_OFFSET_PATH"] = OFFSET_PATH
+    os.environ["TELEGRAM_POLL_TIMEOUT"] = "1"
+
+    import uvicorn
+    from app.services.telegram_polling import TelegramPoller
+
+    updates = build_updates(args.updates, args.chats)
+    app, state = create_fake_api(updates)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    seen = []
+    open_albums, late_photos = {}, []
+
+    async def handler(update):
+        seen.append(update)
+        await asyncio.sleep(args.handler_ms / 1000)
+        media_group_id = update["message"].get("media_group_id")
+        if not media_group_id:
+            return
+        # Mesmo contrato do MediaGroupCollector: o primeiro espera a janela, os demais entram no grupo
+        if media_group_id in open_albums:
+            if open_albums[media_group_id] is None:
+                late_photos.append(update)
+            return
+        open_albums[media_group_id] = True
+        await asyncio.sleep(args.album_window_ms / 1000)
+        open_albums[media_group_id] = None
+
+    poller = TelegramPoller()
+    started = time.perf_counter()
+    poller.start(handler)
+    while len(seen) < len(updates):
+        await asyncio.sleep(0.05)
+    while poller.offset != updates[-1]["update_id"] + 1:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    await poller.stop()
+
+    # Ordem por chat: message_id crescente na ordem em que o handler recebeu
+    last_by_chat, out_of_order = {}, 0
+    for update in seen:
+        message = update["message"]
+        if message["message_id"] < last_by_chat.get(message["chat"]["id"], 0):
+            out_of_order += 1
+        last_by_chat[message["chat"]["id"]] = message["message_id"]
+
+    # Reinício: o offset gravado não reprocessa nada
+    restarted = TelegramPoller()
+    replayed = []
+
+    async def replay_handler(update):
+        replayed.append(update)
+
+    restarted.start(replay_handler)
+    await asyncio.sleep(0.5)
+    await restarted.stop()
+
+    server.should_exit = True
+    await server_task
+
+    stats = poller.get_stats()
+    print(f"📥 {len(updates)} updates, {args.chats} chats, handler {args.handler_ms}ms")
+    print(f"⏱️ {elapsed:.2f}s → {len(updates) / elapsed:.0f} updates/s ({state['polls']} getUpdates, "
+          f"lote médio {stats['avg_batch_size']}, {stats['avg_batch_ms']}ms por lote)")
+    print(f"   {'✅' if out_of_order == 0 else '❌'} fora de ordem por chat: {out_of_order}")
+    print(f"   {'✅' if len(seen) == len(updates) else '❌'} processados: {len(seen)}/{len(updates)}")
+    print(f"   {'✅' if not late_photos else '❌'} fotos de álbum depois do grupo fechar: {len(late_photos)}")
+    print(f"   {'✅' if not replayed else '❌'} reprocessados após reinício: {len(replayed)} (offset {restarted.offset})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do long polling do Telegram")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--handler-ms", type=float, default=20)
+    parser.add_argument("--album-window-ms", type=float, default=1200)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Treino e avaliação offline do classificador local de intenção
+
+Uso:
+    python scripts/train_intent_classifier.py
+    python scripts/train_intent_classifier.py --samples logs/intent_samples.jsonl --min-confidence 0.8
+    python scripts/train_intent_classifier.py --eval-only
+
+Lê pares (mensagem, intenção) do seed versionado e dos logs do orquestrador, separa um split
+de validação com semente fixa, treina só no split de treino e grava os pesos em
+app/data/intent_classifier.json (recarregados a quente). --eval-only refaz o mesmo split
+(semente e fração gravadas nos metadados dos pesos) e avalia só nos exemplos não vistos.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.intent_classifier import LocalIntentClassifier, DEFAULT_WEIGHTS_PATH
+
+SEED_PATH = os.path.join(os.path.dirname(DEFAULT_WEIGHTS_PATH), "intent_seed.jsonl")
+
+
+def load_samples(paths, min_confidence):
+    """Carrega pares (mensagem, intenção), deduplicando por mensagem (último rótulo vence)"""
+    samples = {}
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"⚠️ Arquivo não encontrado: {path}")
+            continue
+        with open(path, "r", encoding="utf-8") as samples_file:
+            for line in samples_file:
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                if row.get("confidence", 1.0) < min_confidence:
+                    continue
+                if row.get("intent") in (None, "unknown"):
+                    continue
+                samples[row["message"].strip().lower()] = (row["message"], row["intent"])
+    return list(samples.values())
+
+
+def split_samples(samples, eval_split, seed):
+    """Split treino/validação determinístico (mesma semente -> mesmos exemplos de validação)"""
+    shuffled = list(samples)
+    random.Random(seed).shuffle(shuffled)
+    split = int(len(shuffled) * (1 - eval_split))
+    return shuffled[:split], shuffled[split:]
+
+
+def evaluate(classifier, samples):
+    """Acurácia geral, cobertura acima do limiar e precisão/recall por classe"""
+    correct = 0
+    covered = 0
+    covered_correct = 0
+    per_class = defaultdict(Counter)
+
+    start = time.perf_counter()
+    for text, intent in samples:
+        prediction = classifier.predict(text)
+        predicted = prediction["intent"]
+        correct += predicted == intent
+        if prediction["confident"]:
+            covered += 1
+            covered_correct += predicted == intent
+            per_class[predicted]["covered"] += 1
+            per_class[predicted]["covered_hits"] += predicted == intent
+        per_class[intent]["support"] += 1
+        per_class[predicted]["predicted"] += 1
+        if predicted == intent:
+            per_class[intent]["hits"] += 1
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    total = len(samples) or 1
+    print(f"\n📊 Avaliação em {len(samples)} exemplos")
+    print(f"   Acurácia geral: {correct / total:.3f}")
+    print(f"   Cobertura (confiança >= {classifier.threshold}, {classifier.intent_thresholds}): {covered / total:.3f}")
+    print(f"   Acurácia nos cobertos: {covered_correct / covered:.3f}" if covered else "   Nenhum exemplo coberto")
+    print(f"   Latência média: {elapsed_ms / total:.3f} ms/mensagem")
+    for label in sorted(per_class):
+        stats = per_class[label]
+        precision = stats["hits"] / stats["predicted"] if stats["predicted"] else 0.0
+        recall = stats["hits"] / stats["support"] if stats["support"] else 0.0
+        covered_precision = stats["covered_hits"] / stats["covered"] if stats["covered"] else 0.0
+        print(f"   {label:<24} precisão={precision:.3f} recall={recall:.3f} precisão_cobertos={covered_precision:.3f} "
+              f"suporte={stats['support']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Treina o classificador local de intenção")
+    parser.add_argument("--samples", nargs="*", default=[os.path.join("logs", "intent_samples.jsonl")])
+    parser.add_argument("--no-seed", action="store_true", help="Não inclui o seed versionado")
+    parser.add_argument("--min-confidence", type=float, default=0.8)
+    parser.add_argument("--eval-split", type=float, default=0.2)
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=DEFAULT_WEIGHTS_PATH)
+    parser.add_argument("--eval-only", action="store_true", help="Avalia os pesos atuais no split de validação")
+    args = parser.parse_args()
+
+    paths = ([] if args.no_seed else [SEED_PATH]) + args.samples
+    samples = load_samples(paths, args.min_confidence)
+    print(f"📥 {len(samples)} exemplos carregados: {dict(Counter(intent for _, intent in samples))}")
+
+    if args.eval_only:
+        classifier = LocalIntentClassifier(args.out)
+        # Mesmo split do treino que gerou os pesos
+        eval_split = classifier.metadata.get("eval_split", args.eval_split)
+        seed = classifier.metadata.get("split_seed", args.seed)
+        _, eval_samples = split_samples(samples, eval_split, seed)
+        evaluate(classifier, eval_samples)
+        return
+
+    train_samples, eval_samples = split_samples(samples, args.eval_split, args.seed)
+
+    # Os pesos gravados são os do split de treino: a avaliação (aqui e no --eval-only) é em exemplos não vistos
+    classifier = LocalIntentClassifier(weights_path=args.out)
+    classifier.train(train_samples, epochs=args.epochs, seed=args.seed)
+    classifier.metadata.update({"eval_split": args.eval_split, "split_seed": args.seed})
+    evaluate(classifier, eval_samples)
+
+    classifier.save(args.out)
+    print(f"\n💾 Pesos salvos em {args.out} ({len(classifier.weights)} features)")
+
+
+if __name__ == "__main__":
+    main()